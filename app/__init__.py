@@ -1,16 +1,44 @@
 # app/__init__.py
+import os
+
 from flask import Flask
+from jinja2 import FileSystemBytecodeCache
 from config import Config
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
+from app.assets import Assets
+from app.caching import FragmentCache
+from app.compression import Compress
+from app.jobrunner import JobRunner
+from app.ledger import BalanceCheckpoints
+from app.querybudget import QueryBudget
+from app.rangesum import RangeSumIndex
+from app.replica import ReplicaRouter
+from app.searchcache import SearchCache
+from app.session import RoutingSession
+from app.sharding import ShardRouter
+from app.snapshots import ColumnSnapshots
+from app.writequeue import WriteQueue
 
 # 实例化扩展
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 bcrypt = Bcrypt()
 login_manager = LoginManager()
+write_queue = WriteQueue(db)
+shard_router = ShardRouter(db)
+replica_router = ReplicaRouter(db)
+job_runner = JobRunner(db)
+assets = Assets()
+compress = Compress()
+fragment_cache = FragmentCache(db)
+search_cache = SearchCache(db)
+query_budget = QueryBudget()
+range_index = RangeSumIndex(db)
+checkpoints = BalanceCheckpoints(db)
+snapshot_store = ColumnSnapshots(db)
 
 # 配置 Flask-Login
 login_manager.login_view = 'auth.login'
@@ -22,10 +50,29 @@ def create_app(config_class=Config):
     app.config.from_object(config_class)
 
     # 初始化扩展
+    # 分片和只读副本都通过 SQLALCHEMY_BINDS 注册，需要先于 db 初始化
+    shard_router.init_app(app)
+    replica_router.init_app(app)
     db.init_app(app)
     migrate.init_app(app, db)
     bcrypt.init_app(app)
     login_manager.init_app(app)
+    write_queue.init_app(app)
+    job_runner.init_app(app)
+    assets.init_app(app)
+    compress.init_app(app)
+    fragment_cache.init_app(app)
+    search_cache.init_app(app)
+    query_budget.init_app(app)
+    range_index.init_app(app)
+    checkpoints.init_app(app)
+    snapshot_store.init_app(app)
+
+    # Jinja 字节码缓存：编译后的模板存到磁盘，worker 启动后不必重新编译
+    bytecode_dir = app.config.get('JINJA_BYTECODE_CACHE_DIR')
+    if bytecode_dir:
+        os.makedirs(bytecode_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(bytecode_dir)
 
     # 注册蓝图
     from app.auth import bp as auth_bp
@@ -34,9 +81,39 @@ def create_app(config_class=Config):
     from app.main import bp as main_bp
     app.register_blueprint(main_bp)
 
+    from app.jobs import bp as jobs_bp
+    app.register_blueprint(jobs_bp, url_prefix='/jobs')
+
     # 在应用上下文中创建数据库表
     # 注意：在生产中，我们会使用 'flask db migrate' 和 'flask db upgrade'
     with app.app_context():
+        from app.money import upgrade_schema
+        # 旧版库里的浮点金额列先就地改成整数分
+        upgrade_schema(db)
         db.create_all()
+        shard_router.create_all()
+        # create_all 只建缺少的表，已有的表上后来新增的索引（如 ix_transaction_user_date）要单独补上
+        create_missing_indexes([db.engine] + [shard_router.engine(n) for n in range(app.config['SHARD_COUNT'])])
+        replica_router.start(app)
 
     return app
+
+
+def create_missing_indexes(engines):
+    """在各库已有的表上补建模型中声明、库里还没有的（非唯一）索引，返回新建的索引名"""
+    import sqlalchemy as sa
+    created = []
+    for engine in engines:
+        with engine.begin() as conn:
+            inspector = sa.inspect(conn)
+            existing = set(inspector.get_table_names())
+            for table in db.metadata.sorted_tables:
+                if table.name not in existing:
+                    continue
+                names = {index['name'] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    # 唯一索引遇到重复数据会建不起来，只补普通索引
+                    if not index.unique and index.name not in names:
+                        index.create(conn)
+                        created.append(index.name)
+    return created
@@ -0,0 +1,212 @@
+# app/analytics.py
+"""
+收支统计（NumPy 向量化）。
+
+一次查询只取区间内每笔交易的 (日期, 金额, 分类, 类型) 四列，不构造 ORM 对象；
+日期由 NumPy 换算成 1970-01-01 起的天数（不依赖 julianday() 这类某种数据库特有的函数），
+金额是整数分。之后所有统计都是整列运算（bincount / quantile / histogram / cumsum），
+不在 Python 里逐行循环：
+
+    - 汇总：笔数、收支合计、单笔支出的均值/中位数/最大值、日均支出
+    - 单笔支出的分位数与直方图（0 ~ P99 等宽分桶，P99 以上单独计数）
+    - 星期分布：每个星期几的支出合计，以及按区间内该星期几出现次数折算的平均值
+    - 周汇总与 4 周移动平均（点数超过 CHART_MAX_POINTS 时用 LTTB 降采样）
+    - 月汇总与环比
+    - 分类排行
+
+往月的交易可以直接来自列式快照（见 app/snapshots.py），只有本月起的交易查库。
+10 万笔交易的计算部分在几十毫秒以内，耗时主要在数据库扫描。
+"""
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+
+from app.downsample import downsample_series
+
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+HISTOGRAM_BINS = 20
+MOVING_AVERAGE_WEEKS = 4
+
+_EPOCH = date(1970, 1, 1)
+
+
+def epoch_day(day):
+    return (day - _EPOCH).days
+
+
+def from_epoch_day(n):
+    return _EPOCH + timedelta(days=int(n))
+
+
+def query_columns(session, user_id, *conditions, order_by=()):
+    """
+    符合条件的交易的列数据：(天数, 金额（分）, 分类 id, 是否收入)，都是 numpy 一维数组。
+    日期列经 SQLAlchemy 的结果处理得到 datetime（SQLite 里存的是字符串），再整列转换成天数。
+    """
+    from app.models import Transaction
+    stmt = sa.select(
+        Transaction.date, Transaction.amount_cents, Transaction.category_id,
+        sa.case((Transaction.type == 'income', 1), else_=0)
+    ).where(Transaction.user_id == user_id, *conditions).order_by(*order_by)
+
+    connection = session.connection(bind_arguments={'mapper': Transaction})
+    dates, *numbers = list(zip(*connection.execute(stmt))) or [(), (), (), ()]
+    days = np.array(dates, dtype='datetime64[D]').astype(np.int64)
+    cents, category_ids, income = (np.array(column, dtype=np.int64) for column in numbers)
+    return days, cents, category_ids, income.astype(bool)
+
+
+def load_columns(session, user_id, start_date, end_date):
+    """
+    [start_date, end_date] 区间内全部交易的列数据。
+    启用列式快照（见 app/snapshots.py）时往月部分直接从快照切片，只查询本月起的交易。
+    """
+    from app.models import Transaction
+    store = current_app.extensions.get('snapshots') if has_app_context() else None
+    closed = store.closed_columns(session, user_id, start_date.date(), end_date.date()) if store else None
+    if closed is None:
+        return query_columns(session, user_id, Transaction.date.between(start_date, end_date))
+
+    columns, boundary = closed
+    boundary = datetime.combine(boundary, time.min)
+    if end_date < boundary:
+        return columns
+    recent = query_columns(session, user_id, Transaction.date.between(max(start_date, boundary), end_date))
+    return tuple(np.concatenate(pair) for pair in zip(columns, recent))
+
+
+def monthly_category_totals(columns, first_period, months):
+    """
+    按 (分类, 月份, 类型) 汇总金额（分），返回 (分类 id 数组, 形状为 (分类数, months, 2) 的合计)，
+    最后一维 0 为支出、1 为收入。月份序号 = 年 * 12 + 月 - 1，不在 [first_period, first_period + months) 的行忽略。
+    """
+    days, cents, category_ids, income = columns
+    periods = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64) + 1970 * 12 - first_period
+    keep = (periods >= 0) & (periods < months)
+    ids, inverse = np.unique(category_ids[keep], return_inverse=True)
+    key = (inverse * months + periods[keep]) * 2 + income[keep]
+    # 权重是整数分，float64 在 2^53 以内求和是精确的
+    totals = np.bincount(key, weights=cents[keep], minlength=len(ids) * months * 2)
+    return ids, totals.reshape(len(ids), months, 2)
+
+
+def _trailing_mean(values, window):
+    """前 window 个点（不足时取已有的点）的平均值"""
+    total = np.cumsum(values)
+    total[window:] = total[window:] - total[:-window]
+    return total / np.minimum(np.arange(1, len(values) + 1), window)
+
+
+def _rounded(values):
+    return np.round(values, 2).tolist()
+
+
+def compute_statistics(columns, first_day, last_day, category_names=None, max_points=200):
+    """
+    columns 为 load_columns() 的返回值，[first_day, last_day] 为统计区间（date，两端包含）。
+    返回值只包含列表、数字和字符串，可以直接 jsonify。
+    """
+    days, cents, category_ids, income = columns
+    amounts = cents / 100
+    category_names = category_names or {}
+    first, last = epoch_day(first_day), epoch_day(last_day)
+    span = last - first + 1
+
+    expense = ~income
+    spend = amounts[expense]
+    spend_cents = cents[expense]
+    spend_days = days[expense]
+    total_expense = int(spend_cents.sum()) / 100
+    total_income = int(cents[income].sum()) / 100
+
+    summary = {
+        'count': int(len(amounts)),
+        'expense_count': int(len(spend)),
+        'income_count': int(len(amounts) - len(spend)),
+        'expense': round(total_expense, 2),
+        'income': round(total_income, 2),
+        'balance': round(total_income - total_expense, 2),
+        'days': int(span),
+        'daily_expense': round(total_expense / span, 2),
+        'mean': round(float(spend.mean()), 2) if len(spend) else 0.0,
+        'median': round(float(np.median(spend)), 2) if len(spend) else 0.0,
+        'max': round(float(spend.max()), 2) if len(spend) else 0.0,
+    }
+
+    # 1. 单笔支出分位数与直方图：最高的 1% 单独计数，不让一两笔大额支出把其它桶挤成一条
+    if len(spend):
+        quantiles = np.quantile(spend, QUANTILES)
+    else:
+        quantiles = np.zeros(len(QUANTILES))
+    upper = float(quantiles[-1]) or 1.0
+    counts, edges = np.histogram(spend, bins=HISTOGRAM_BINS, range=(0.0, upper))
+    histogram = {
+        'edges': _rounded(edges),
+        'counts': counts.tolist(),
+        'overflow': int(np.count_nonzero(spend > upper)),
+    }
+
+    # 2. 星期分布（1970-01-01 是星期四，周一为 0）
+    weekday_totals = np.bincount((spend_days + 3) % 7, weights=spend_cents, minlength=7) / 100
+    occurrences = np.bincount((np.arange(first, last + 1) + 3) % 7, minlength=7)
+    weekday = {
+        'totals': _rounded(weekday_totals),
+        'average': _rounded(weekday_totals / np.maximum(occurrences, 1)),
+    }
+
+    # 3. 周汇总（周一开始）与移动平均
+    first_monday = first - (first + 3) % 7
+    weeks = (last - first_monday) // 7 + 1
+    weekly_expense = np.bincount((spend_days - first_monday) // 7, weights=spend_cents, minlength=weeks) / 100
+    weekly_income = np.bincount((days[income] - first_monday) // 7, weights=cents[income], minlength=weeks) / 100
+    labels = [from_epoch_day(first_monday + 7 * i).isoformat() for i in range(weeks)]
+    labels, series = downsample_series(labels, {
+        'expense': _rounded(weekly_expense),
+        'income': _rounded(weekly_income),
+        'moving_average': _rounded(_trailing_mean(weekly_expense, MOVING_AVERAGE_WEEKS)),
+    }, max_points)
+    weekly = dict(series, labels=labels)
+
+    # 4. 月汇总与环比
+    months = (days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64))
+    first_month = np.datetime64(first_day, 'M').astype(np.int64)
+    month_count = int(np.datetime64(last_day, 'M').astype(np.int64) - first_month + 1)
+    monthly_expense = np.bincount(months[expense] - first_month, weights=spend_cents, minlength=month_count) / 100
+    monthly_income = np.bincount(months[income] - first_month, weights=cents[income], minlength=month_count) / 100
+    change = np.diff(monthly_expense, prepend=np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent = np.where(monthly_expense - change > 0, change / (monthly_expense - change) * 100, np.nan)
+    monthly = {
+        'labels': [str(np.datetime64(int(first_month + i), 'M')) for i in range(month_count)],
+        'expense': _rounded(monthly_expense),
+        'income': _rounded(monthly_income),
+        'change': [None if np.isnan(v) else round(float(v), 2) for v in change],
+        'change_percent': [None if np.isnan(v) else round(float(v), 2) for v in percent],
+    }
+
+    # 5. 分类排行
+    ids, inverse = np.unique(category_ids[expense], return_inverse=True)
+    category_totals = np.bincount(inverse, weights=spend_cents, minlength=len(ids)) / 100
+    category_counts = np.bincount(inverse, minlength=len(ids))
+    order = np.argsort(-category_totals, kind='stable')
+    categories = [{
+        'id': int(ids[i]),
+        'name': category_names.get(int(ids[i]), ''),
+        'total': round(float(category_totals[i]), 2),
+        'count': int(category_counts[i]),
+        'percent': round(float(category_totals[i]) / total_expense * 100, 2) if total_expense else 0.0,
+    } for i in order]
+
+    return {
+        'start': first_day.isoformat(),
+        'end': last_day.isoformat(),
+        'summary': summary,
+        'quantiles': dict(zip((f'p{round(q * 100)}' for q in QUANTILES), _rounded(quantiles))),
+        'histogram': histogram,
+        'weekday': weekday,
+        'weekly': weekly,
+        'monthly': monthly,
+        'categories': categories,
+    }
@@ -0,0 +1,237 @@
+# app/assets.py
+"""
+静态资源流水线：把 app/static 下的文件构建成带内容哈希的文件名，并生成预压缩版本。
+
+构建产物写入 ASSETS_BUILD_DIR：
+    vendor/bootstrap/bootstrap.min.3f2a9c1d7e0b.css
+    vendor/bootstrap/bootstrap.min.3f2a9c1d7e0b.css.gz
+    vendor/bootstrap/bootstrap.min.3f2a9c1d7e0b.css.br   (安装了 brotli 时)
+    manifest.json                                        (原文件名 -> 哈希文件名)
+
+文件名随内容变化，所以可以带 `Cache-Control: immutable` 和一年的 max-age 返回，
+浏览器重复访问时完全不需要请求静态资源。CSS 中 url(...) 引用的相对路径会被改写为
+对应的哈希文件名（例如 Bootstrap Icons 的字体文件）。
+
+模板中用 asset_url('vendor/bootstrap/bootstrap.min.css') 代替
+url_for('static', filename=...)；还没有构建时会退回普通的 static 地址。
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import tempfile
+
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+from werkzeug.exceptions import NotFound
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，没有时只生成 gzip 版本
+    brotli = None
+
+assets_cli = AppGroup('assets', help='静态资源构建命令')
+
+MANIFEST_NAME = 'manifest.json'
+
+# 参与构建的文件类型；其余文件（README、LICENSE 等）不对外提供
+BUILD_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.ico', '.png', '.jpg', '.gif', '.webp', '.woff', '.woff2'}
+# 值得预压缩的文本类型；字体和图片本身已经压缩过
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt'}
+# 预压缩版本的后缀与对应的 Content-Encoding，按优先级排列
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+CSS_URL_RE = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def _hashed_name(path, content):
+    root, ext = posixpath.splitext(path)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+
+
+def _rewrite_css_urls(path, content, manifest):
+    """把 CSS 里指向其它静态文件的相对 url() 改写为哈希后的文件名"""
+    base = posixpath.dirname(path)
+
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        target, _, fragment = url.partition('#')
+        target = target.split('?', 1)[0]
+        resolved = posixpath.normpath(posixpath.join(base, target))
+        if resolved not in manifest:
+            return match.group(0)
+        new_url = posixpath.relpath(manifest[resolved], base)
+        if fragment:
+            new_url += '#' + fragment
+        return f'url({quote}{new_url}{quote})'
+
+    return CSS_URL_RE.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def build_assets(source_dir, build_dir, compress_level=9):
+    """构建全部静态资源，返回 manifest（原相对路径 -> 哈希相对路径）"""
+    sources = []
+    for root, dirs, files in os.walk(source_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if name.startswith('.') or os.path.splitext(name)[1].lower() not in BUILD_EXTENSIONS:
+                continue
+            full = os.path.join(root, name)
+            sources.append(os.path.relpath(full, source_dir).replace(os.sep, '/'))
+
+    # CSS 可能引用其它文件，最后处理，保证被引用文件的哈希名已经确定
+    sources.sort(key=lambda p: (p.endswith('.css'), p))
+    manifest = {}
+    for path in sources:
+        with open(os.path.join(source_dir, path), 'rb') as f:
+            content = f.read()
+        if path.endswith('.css'):
+            content = _rewrite_css_urls(path, content, manifest)
+        hashed = _hashed_name(path, content)
+        manifest[path] = hashed
+
+        target = os.path.join(build_dir, hashed)
+        _write_atomic(target, content)
+        if posixpath.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+            variants = [('.gz', gzip.compress(content, compresslevel=compress_level, mtime=0))]
+            if brotli is not None:
+                variants.append(('.br', brotli.compress(content, quality=11)))
+            for suffix, data in variants:
+                if len(data) < len(content):
+                    _write_atomic(target + suffix, data)
+
+    _write_atomic(os.path.join(build_dir, MANIFEST_NAME),
+                  json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def _latest_mtime(source_dir):
+    latest = 0
+    for root, _, files in os.walk(source_dir):
+        for name in files:
+            latest = max(latest, os.path.getmtime(os.path.join(root, name)))
+    return latest
+
+
+class _Build:
+    """绑定到单个 Flask 应用的构建结果：manifest 以及资源响应逻辑"""
+
+    def __init__(self, app):
+        self.app = app
+        self.build_dir = app.config['ASSETS_BUILD_DIR']
+        self.manifest = {}
+        self.hashed_names = set()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.build_dir, MANIFEST_NAME)
+
+    def is_stale(self):
+        """没有 manifest，或者源文件比 manifest 新时需要重新构建"""
+        if not os.path.exists(self.manifest_path):
+            return True
+        return _latest_mtime(self.app.static_folder) > os.path.getmtime(self.manifest_path)
+
+    def build(self):
+        self._set_manifest(build_assets(self.app.static_folder, self.build_dir,
+                                        self.app.config['ASSETS_COMPRESS_LEVEL']))
+        return self.manifest
+
+    def load(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self._set_manifest(json.load(f))
+        except FileNotFoundError:
+            self._set_manifest({})
+        return self.manifest
+
+    def _set_manifest(self, manifest):
+        self.manifest = manifest
+        self.hashed_names = set(manifest.values())
+
+    def serve(self, filename):
+        """返回构建后的资源；客户端支持时优先返回 br / gzip 预压缩版本"""
+        if filename not in self.hashed_names:
+            raise NotFound()
+        mimetype = _guess_mimetype(filename)
+        for encoding, suffix in ENCODINGS:
+            if encoding in request.accept_encodings and os.path.exists(os.path.join(self.build_dir, filename + suffix)):
+                response = send_from_directory(self.build_dir, filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(self.build_dir, filename, mimetype=mimetype)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.max_age = self.app.config['ASSETS_MAX_AGE']
+        response.cache_control.immutable = True
+        return response
+
+
+class Assets:
+    """
+    静态资源扩展：
+
+        assets = Assets()
+        assets.init_app(app)
+
+    注册 asset_url 模板函数和 ASSETS_URL_PREFIX 下的资源路由；ASSETS_AUTO_BUILD 为 True 时
+    启动时发现源文件有更新就自动构建，否则只读取已有的 manifest（由 `flask assets build` 生成）。
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSETS_BUILD_DIR', os.path.join(app.instance_path, 'assets'))
+        app.config.setdefault('ASSETS_URL_PREFIX', '/assets')
+        app.config.setdefault('ASSETS_AUTO_BUILD', True)
+        app.config.setdefault('ASSETS_MAX_AGE', 365 * 24 * 3600)
+        app.config.setdefault('ASSETS_COMPRESS_LEVEL', 9)
+        build = _Build(app)
+        app.extensions['assets'] = build
+        app.cli.add_command(assets_cli)
+        app.add_url_rule(app.config['ASSETS_URL_PREFIX'] + '/<path:filename>',
+                         endpoint='assets', view_func=build.serve)
+        app.jinja_env.globals['asset_url'] = asset_url
+
+        if app.config['ASSETS_AUTO_BUILD'] and build.is_stale():
+            build.build()
+        else:
+            build.load()
+
+
+def _guess_mimetype(filename):
+    ext = posixpath.splitext(filename)[1].lower()
+    return {'.woff2': 'font/woff2', '.woff': 'font/woff'}.get(ext) or \
+        mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def asset_url(filename, **values):
+    """url_for('static', filename=...) 的替代：已构建时返回带哈希的地址"""
+    hashed = current_app.extensions['assets'].manifest.get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename, **values)
+    return url_for('assets', filename=hashed, **values)
+
+
+@assets_cli.command('build')
+def assets_build():
+    """构建静态资源（哈希文件名 + gzip/brotli 预压缩）"""
+    manifest = current_app.extensions['assets'].build()
+    click.echo(f'已构建 {len(manifest)} 个静态资源到 {current_app.config["ASSETS_BUILD_DIR"]}。')
@@ -1,7 +1,7 @@
 # app/auth/routes.py
 from flask import render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, current_user
-from app import db
+from app import db, shard_router
 from app.auth import bp
 from app.models import User, Category
 from app.forms import LoginForm, RegistrationForm
@@ -43,6 +43,9 @@ def register():
         user = User(username=form.username.data, email=form.email.data)
         user.set_password(form.password.data)
         db.session.add(user)
+        db.session.flush()  # 获取 user.id
+        # 启用分片时为新用户分配分片，之后创建的分类会写入该分片
+        shard_router.activate(user.id)
        
         # !! 关键：为新用户创建预设分类 !!
         default_categories = [
@@ -0,0 +1,275 @@
+# app/caching.py
+"""
+渲染结果缓存。
+
+- 数据版本号：每个用户一行 DataVersion，交易/分类/预算在 flush 时有增删改就把版本号加一
+  （与用户的数据放在同一个分片，随数据写入同一个事务提交，写入不会因此再去锁中心库）。
+  批量 SQL（例如后台任务里的 query.delete()）绕过了 flush，需要调用 bump_data_version() 手动加一。
+- 年份版本号：交易的新旧日期落在哪些年份，就把这些年份的 YearVersion 加一；year_version()
+  只在这一年的交易变化后才变，已经结束的年份（日历热力图）用它做缓存键，今年的记账不影响往年。
+- 片段缓存：模板中的 {% cache 'name', 其它键... %} ... {% endcache %}，缓存键自动附加
+  当前用户 id 与其数据版本号，数据一变旧片段自然失效，不需要主动清理。缓存存放在进程内的
+  LRU 中，多个 worker 各自缓存，但版本号在数据库里，所以不会读到别的进程已经改掉的旧数据。
+- 结果缓存：fragment_cache.cached(name, user_id, args, compute) 用同样的 (用户, 版本号) 方式
+  缓存普通数据（例如统计分析），没有过期时间；也可以传入别的版本号（例如 year_version()）。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context
+from flask_login import current_user
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from app.session import RoutingSession
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    线程安全的 LRU 缓存，可选过期时间（秒）。
+    给出 weigh(value) 与 maxweight 时另按总重量（例如字节数）淘汰最久未用的项。
+    """
+
+    def __init__(self, maxsize=1024, timeout=None, maxweight=None, weigh=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.maxweight = maxweight
+        self.weigh = weigh
+        self.weight = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            value, expires, weight = item
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                self.weight -= weight
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.timeout if self.timeout else None
+        weight = self.weigh(value) if self.weigh is not None else 0
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.weight -= old[2]
+            self._data[key] = (value, expires, weight)
+            self.weight += weight
+            while len(self._data) > self.maxsize or \
+                    (self.maxweight is not None and self.weight > self.maxweight and len(self._data) > 1):
+                _, (_, _, evicted) = self._data.popitem(last=False)
+                self.weight -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+# --- 数据版本号 ---
+
+def _versioned_models():
+    from app.models import Transaction, Category, Budget
+    return Transaction, Category, Budget
+
+
+def _owner_id(obj):
+    if obj.user_id is not None:
+        return obj.user_id
+    # 通过关系 (author=user / owner=user) 创建的对象在 flush 前还没有外键值
+    owner = getattr(obj, 'author', None) or getattr(obj, 'owner', None)
+    return owner.id if owner is not None else None
+
+
+# year_version 中表示“所有年份”的年份
+ALL_YEARS = 0
+
+
+def _increment(session, model, **key):
+    result = session.execute(
+        sa.update(model).filter_by(**key).values(version=model.version + 1)
+    )
+    if result.rowcount == 0:
+        session.execute(sa.insert(model).values(version=1, **key))
+
+
+def bump_data_version(session, user_id, years=None):
+    """
+    把用户的数据版本号加一（随 session 的事务一起提交）。
+    years 为改动涉及的交易年份，这些年份的版本号同样加一；None 表示不确定，所有年份一起失效。
+    """
+    from app.models import DataVersion, YearVersion
+    _increment(session, DataVersion, user_id=user_id)
+    for year in sorted(years) if years is not None else (ALL_YEARS,):
+        _increment(session, YearVersion, user_id=user_id, year=year)
+    if has_request_context():
+        g.pop('_data_versions', None)
+
+
+def data_version(session, user_id):
+    """读取用户当前的数据版本号；请求内多次读取只查一次库"""
+    from app.models import DataVersion
+    versions = g.setdefault('_data_versions', {}) if has_request_context() else {}
+    if user_id not in versions:
+        versions[user_id] = session.execute(
+            sa.select(DataVersion.version).where(DataVersion.user_id == user_id)
+        ).scalar() or 0
+    return versions[user_id]
+
+
+def year_version(session, user_id, year):
+    """用户 year 年交易的版本号（含“所有年份”那一行），这一年的交易不变就不变"""
+    from app.models import YearVersion
+    return session.execute(
+        sa.select(sa.func.sum(YearVersion.version)).where(
+            YearVersion.user_id == user_id, YearVersion.year.in_((year, ALL_YEARS)))
+    ).scalar() or 0
+
+
+def changed_owner_ids(session):
+    """本次 flush 中有增删改（交易/分类/预算）的用户，每个用户的版本号会因此加一"""
+    models = _versioned_models()
+    user_ids = set()
+    for obj in session.new:
+        if isinstance(obj, models):
+            user_ids.add(_owner_id(obj))
+    for obj in session.deleted:
+        if isinstance(obj, models):
+            user_ids.add(obj.user_id)
+    for obj in session.dirty:
+        if isinstance(obj, models) and session.is_modified(obj, include_collections=False):
+            user_ids.add(obj.user_id)
+    user_ids.discard(None)
+    return user_ids
+
+
+def changed_years(session):
+    """本次 flush 中增删改的交易涉及的 {用户: 年份集合}（新旧日期都算，不确定时为 ALL_YEARS）"""
+    from app.models import Transaction
+    years = {}
+
+    def touch(user_id, value):
+        years.setdefault(user_id, set()).add(value.year if value is not None else ALL_YEARS)
+
+    for obj in session.new:
+        if isinstance(obj, Transaction):
+            touch(_owner_id(obj), obj.date)
+    for obj in list(session.deleted) + list(session.dirty):
+        if not isinstance(obj, Transaction) or (obj in session.dirty and not session.is_modified(obj)):
+            continue
+        state = sa.inspect(obj)
+        history = state.attrs.date.history
+        old = history.deleted or history.unchanged
+        # 日期没有加载（或过期后直接赋值）时旧日期未知
+        touch(obj.user_id, old[0] if 'date' in state.dict and old else None)
+        if obj in session.dirty:
+            touch(obj.user_id, obj.date)
+    return years
+
+
+def _bump_on_flush(session, flush_context, instances):
+    years = changed_years(session)
+    for user_id in sorted(changed_owner_ids(session)):
+        bump_data_version(session, user_id, years.get(user_id, set()))
+
+
+# --- 模板片段缓存 ---
+
+class FragmentCacheExtension(Extension):
+    """
+    {% cache 'category-list', extra_key %} ... {% endcache %}
+
+    第一个参数是片段名，后面可以跟任意多个附加键（必须可哈希）。
+    """
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render_cached', [nodes.List(args)]),
+                               [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, key_parts, caller):
+        return self.environment.fragment_cache.render(tuple(key_parts), caller)
+
+
+class FragmentCache:
+    """
+    片段缓存扩展：
+
+        fragment_cache = FragmentCache(db)
+        fragment_cache.init_app(app)
+    """
+
+    def __init__(self, db=None):
+        self.db = db
+
+    def init_app(self, app):
+        app.config.setdefault('FRAGMENT_CACHE_ENABLED', True)
+        app.config.setdefault('FRAGMENT_CACHE_SIZE', 1024)
+        app.config.setdefault('FRAGMENT_CACHE_TIMEOUT', 300)  # 兜底过期时间(秒)，也保证片段中的 CSRF token 不过期
+        app.config.setdefault('RESULT_CACHE_ENABLED', True)
+        app.config.setdefault('RESULT_CACHE_SIZE', 256)
+        app.extensions['fragment_cache'] = LRUCache(app.config['FRAGMENT_CACHE_SIZE'],
+                                                    app.config['FRAGMENT_CACHE_TIMEOUT'])
+        app.extensions['result_cache'] = LRUCache(app.config['RESULT_CACHE_SIZE'])
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self
+        if not sa.event.contains(RoutingSession, 'before_flush', _bump_on_flush):
+            sa.event.listen(RoutingSession, 'before_flush', _bump_on_flush)
+
+    def key_for(self, key_parts):
+        if current_user.is_authenticated:
+            user_id = current_user.id
+            return key_parts + (user_id, data_version(self.db.session, user_id))
+        return key_parts + (None, 0)
+
+    def render(self, key_parts, caller):
+        if not current_app.config['FRAGMENT_CACHE_ENABLED']:
+            return caller()
+        cache = current_app.extensions['fragment_cache']
+        key = self.key_for(key_parts)
+        html = cache.get(key)
+        if html is None:
+            html = caller()
+            cache.set(key, str(html))
+        return Markup(html)
+
+    def cached(self, name, user_id, args, compute, version=None):
+        """
+        按 (名称, 用户, 参数, 数据版本号) 缓存 compute() 的结果，用户数据不变就一直命中。
+        version 默认是用户的数据版本号，只依赖部分数据的结果可以传入更细的版本号（如 year_version()）。
+        结果会被多个请求共用，调用方不能修改它。
+        """
+        if not current_app.config['RESULT_CACHE_ENABLED']:
+            return compute()
+        cache = current_app.extensions['result_cache']
+        if version is None:
+            version = data_version(self.db.session, user_id)
+        key = (name, user_id, version, args)
+        value = cache.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            cache.set(key, value)
+        return value
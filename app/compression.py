@@ -0,0 +1,112 @@
+# app/compression.py
+"""
+响应压缩：按 Accept-Encoding 对较大的 HTML / JSON 等文本响应做 gzip 压缩，
+安装了 brotli / zstandard 时优先使用压缩率更高的算法。
+
+以下响应不处理：
+    - 已经带 Content-Encoding 的（例如静态资源的预压缩版本）
+    - 流式响应和 send_file 之类的直通响应
+    - 不在 COMPRESS_MIMETYPES 中的类型、小于 COMPRESS_MIN_SIZE 的响应
+    - 声明了 Cache-Control: no-transform 的响应
+"""
+import gzip
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖
+    zstandard = None
+
+DEFAULT_MIMETYPES = (
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/xml',
+    'application/json', 'application/javascript', 'image/svg+xml',
+)
+
+
+def _compress_gzip(data, app):
+    return gzip.compress(data, compresslevel=app.config['COMPRESS_LEVEL'], mtime=0)
+
+
+def _compress_br(data, app):
+    return brotli.compress(data, quality=app.config['COMPRESS_BR_LEVEL'])
+
+
+def _compress_zstd(data, app):
+    return zstandard.ZstdCompressor(level=app.config['COMPRESS_ZSTD_LEVEL']).compress(data)
+
+
+# 编码名 -> 压缩函数，按服务端偏好排列；缺少可选依赖的算法不会出现
+COMPRESSORS = {}
+if brotli is not None:
+    COMPRESSORS['br'] = _compress_br
+if zstandard is not None:
+    COMPRESSORS['zstd'] = _compress_zstd
+COMPRESSORS['gzip'] = _compress_gzip
+
+
+class Compress:
+    """
+    响应压缩扩展：
+
+        compress = Compress()
+        compress.init_app(app)
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ENABLED', True)
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BR_LEVEL', 4)
+        app.config.setdefault('COMPRESS_ZSTD_LEVEL', 3)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES)
+        app.config.setdefault('COMPRESS_ALGORITHMS', tuple(COMPRESSORS))
+        app.extensions['compress'] = self
+        app.after_request(self.after_request)
+
+    @staticmethod
+    def choose_encoding(app, accept_encodings):
+        """在客户端接受且服务端可用的算法中，按客户端给出的权重选择，权重相同时按服务端偏好"""
+        best, best_quality = None, 0
+        for encoding in app.config['COMPRESS_ALGORITHMS']:
+            if encoding not in COMPRESSORS:
+                continue
+            quality = accept_encodings[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def after_request(self, response):
+        app = current_app
+        if not app.config['COMPRESS_ENABLED'] or response.mimetype not in app.config['COMPRESS_MIMETYPES']:
+            return response
+        response.vary.add('Accept-Encoding')
+        if response.direct_passthrough or response.is_streamed \
+                or 'Content-Encoding' in response.headers \
+                or response.status_code < 200 or response.status_code in (204, 206, 304) \
+                or response.cache_control.no_transform:
+            return response
+
+        encoding = self.choose_encoding(app, request.accept_encodings)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+
+        response.set_data(COMPRESSORS[encoding](data, app))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # 压缩后的字节与原文不同，强 ETag 不再成立
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,106 @@
+# app/downsample.py
+"""
+图表序列降采样。
+
+长时间区间的折线图先在服务端按日/周/月聚合；聚合后点数仍超过预算时，用 LTTB
+（Largest-Triangle-Three-Buckets）挑出最能保持曲线形状的点，峰值和谷值会被保留，
+不像等距抽样那样把突出的大额支出抽掉。
+"""
+from datetime import date, timedelta
+
+BUCKETS = ('day', 'week', 'month')
+
+
+def choose_bucket(start, end, max_points):
+    """选择点数不超过预算的最细粒度：日 -> 周 -> 月（月粒度仍超出时交给 LTTB）"""
+    days = (end - start).days + 1
+    if days <= max_points:
+        return 'day'
+    if (days + 6) // 7 + 1 <= max_points:
+        return 'week'
+    return 'month'
+
+
+def bucket_start(day, bucket):
+    """某一天所在桶的起始日期（周从周一开始）"""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def iter_buckets(start, end, bucket):
+    """按时间顺序列出 [start, end] 覆盖的所有桶的起始日期"""
+    current = bucket_start(start, bucket)
+    while current <= end:
+        yield current
+        # 下一个桶会超出 date.max 时到此为止（区间可以一直选到 9999-12-31）
+        if bucket == 'day':
+            if current == date.max:
+                return
+            current += timedelta(days=1)
+        elif bucket == 'week':
+            if date.max - current < timedelta(days=7):
+                return
+            current += timedelta(days=7)
+        else:
+            if (current.year, current.month) == (date.max.year, date.max.month):
+                return
+            current = date(current.year + current.month // 12, current.month % 12 + 1, 1)
+
+
+def bucket_label(day, bucket):
+    return day.strftime('%Y-%m') if bucket == 'month' else day.isoformat()
+
+
+def lttb(values, threshold):
+    """
+    对等间距序列 values 做 LTTB 降采样，返回保留下来的下标（升序，含首尾）。
+    threshold 小于 3 或不小于序列长度时原样返回全部下标。
+    """
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    selected = [0]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # 下一个桶的平均点，作为三角形的第三个顶点
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_x = (avg_start + avg_end - 1) / 2
+        avg_y = sum(values[avg_start:avg_end]) / (avg_end - avg_start)
+
+        # 当前桶中与上一个选中点、下一桶平均点围成三角形面积最大的点
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax, ay = a, values[a]
+        best, best_area = range_start, -1.0
+        for j in range(range_start, range_end):
+            area = abs((ax - avg_x) * (values[j] - ay) - (ax - j) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+
+    selected.append(n - 1)
+    return selected
+
+
+def downsample_series(labels, series, max_points):
+    """
+    多条共用横轴的序列一起降采样：每条序列各自用 LTTB 选点，取并集，
+    保证任何一条曲线的形状都不会因为另一条而丢失，总点数不超过 max_points。
+    series 为 {名称: 数值列表}，返回 (labels, series)。
+    """
+    if len(labels) <= max_points:
+        return labels, series
+    per_series = max(max_points // max(len(series), 1), 3)
+    keep = set()
+    for values in series.values():
+        keep.update(lttb(values, per_series))
+    keep = sorted(keep)[:max_points]
+    return ([labels[i] for i in keep],
+            {name: [values[i] for i in keep] for name, values in series.items()})
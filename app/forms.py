@@ -1,9 +1,11 @@
 # app/forms.py
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, BooleanField, SelectField, DateField, DecimalField, TextAreaField
-from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError, Optional, NumberRange
+from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError, Optional, NumberRange, StopValidation
 from wtforms_sqlalchemy.fields import QuerySelectField
 from app.models import User, Category
+from app.money import MAX_AMOUNT
 from flask_login import current_user
 from datetime import date
 
@@ -52,8 +54,14 @@ def get_all_user_categories():
 
 # --- 主应用表单 ---
 
+def finite_amount(form, field):
+    """拒绝 NaN / Infinity（Decimal 可以解析它们，但无法比较大小，也换算不成分）"""
+    if field.data is not None and not field.data.is_finite():
+        raise StopValidation('请输入有效的金额。')
+
+
 class TransactionForm(FlaskForm):
-    amount = DecimalField('金额', validators=[DataRequired(), NumberRange(min=0.01)], places=2)
+    amount = DecimalField('金额', validators=[DataRequired(), finite_amount, NumberRange(min=0.01, max=MAX_AMOUNT)], places=2)
     # 类型字段将帮助我们在路由中决定使用哪个分类查询
     type = SelectField('类型', choices=[('expense', '支出'), ('income', '收入')], validators=[DataRequired()])
     # 我们将在路由中动态设置此字段的 query_factory
@@ -68,7 +76,7 @@ class CategoryForm(FlaskForm):
     submit = SubmitField('保存分类')
 
 class BudgetForm(FlaskForm):
-    amount = DecimalField('预算金额', validators=[DataRequired(), NumberRange(min=0)], places=2)
+    amount = DecimalField('预算金额', validators=[DataRequired(), finite_amount, NumberRange(min=0, max=MAX_AMOUNT)], places=2)
     # 动态查询所有“支出”分类，并允许“总预算”选项
     category = QuerySelectField(
         '预算分类',
@@ -84,19 +92,31 @@ class SearchForm(FlaskForm):
     category = QuerySelectField('分类', query_factory=get_all_user_categories, get_label='name', allow_blank=True, blank_text='-- 所有分类 --')
     start_date = DateField('开始日期', validators=[Optional()])
     end_date = DateField('结束日期', validators=[Optional()])
-    min_amount = DecimalField('最小金额', validators=[Optional()])
-    max_amount = DecimalField('最大金额', validators=[Optional()])
+    min_amount = DecimalField('最小金额', validators=[Optional(), finite_amount, NumberRange(min=0, max=MAX_AMOUNT)])
+    max_amount = DecimalField('最大金额', validators=[Optional(), finite_amount, NumberRange(min=0, max=MAX_AMOUNT)])
     submit = SubmitField('搜索')
 
 class DateRangeForm(FlaskForm):
     # 用于仪表盘和统计页面的日期筛选
     # 我们将使用 'month' 和 'year' 作为主要筛选方式
-    # 'custom' 稍显复杂，我们先实现 按月/按年
+    # 'custom'：start_date/end_date 都填写时，图表改为显示该区间（可跨年，服务端自动降采样）
     month = SelectField('月份', choices=[(str(i), f'{i}月') for i in range(1, 13)], default=str(date.today().month))
     year = SelectField('年份', choices=[(str(i), f'{i}年') for i in range(date.today().year - 5, date.today().year + 2)], default=str(date.today().year))
+    start_date = DateField('开始日期', validators=[Optional()])
+    end_date = DateField('结束日期', validators=[Optional()])
     submit = SubmitField('查看')
 
 
 class ConfirmDeleteForm(FlaskForm):
     """简单的删除确认表单（用于在模板中包含 CSRF token）"""
-    submit = SubmitField('删除')
\ No newline at end of file
+    submit = SubmitField('删除')
+
+
+class JobForm(FlaskForm):
+    """通用的后台任务提交表单（用于在模板中包含 CSRF token）"""
+    submit = SubmitField('提交')
+
+
+class ImportForm(FlaskForm):
+    file = FileField('CSV 文件', validators=[FileRequired(), FileAllowed(['csv'], '只支持 CSV 文件。')])
+    submit = SubmitField('导入')
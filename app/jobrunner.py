@@ -0,0 +1,175 @@
+# app/jobrunner.py
+"""
+后台任务执行器。
+
+任务记录保存在 Job 表中，执行方式由 JOBS_MODE 决定：
+    - 'thread'：在本进程的线程池中执行（默认），不占用处理请求的线程
+    - 'external'：只入队，由单独的 `flask jobs worker` 进程领取执行
+    - 'inline'：在提交任务的请求中同步执行（测试或调试用）
+
+任务函数通过 @task('名称') 注册，签名为 fn(ctx)，ctx 是 JobContext；
+返回 None 或 (bytes, 文件名, mimetype) 作为可下载的结果。内置任务见 app/jobs/tasks.py。
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import update
+
+TASKS = {}
+
+jobs_cli = AppGroup('jobs', help='后台任务命令')
+
+
+def task(name, label):
+    """注册一种后台任务"""
+    def decorator(fn):
+        TASKS[name] = (fn, label)
+        return fn
+    return decorator
+
+
+class JobContext:
+    """传给任务函数的上下文：任务参数、输入数据以及进度汇报"""
+
+    def __init__(self, runner, job):
+        self.runner = runner
+        self.job_id = job.id
+        self.user_id = job.user_id
+        self.params = job.params or {}
+        self.payload = job.payload
+        self.batch_size = current_app.config['JOBS_BATCH_SIZE']
+        self.summary = None  # 任务结束后显示的说明，为空时显示“已完成”
+        self._last_report = 0.0
+
+    def progress(self, fraction, message=None, force=False):
+        """汇报进度 (0~1)。为避免频繁写库，默认按 JOBS_PROGRESS_INTERVAL 节流"""
+        now = time.monotonic()
+        if not force and now - self._last_report < current_app.config['JOBS_PROGRESS_INTERVAL']:
+            return
+        self._last_report = now
+        from app.models import Job
+        values = {'progress': max(0.0, min(float(fraction), 1.0))}
+        if message is not None:
+            values['message'] = message[:200]
+        db = self.runner.db
+        db.session.execute(update(Job).where(Job.id == self.job_id).values(**values))
+        db.session.commit()
+
+
+class JobRunner:
+
+    def __init__(self, db=None):
+        self.db = db
+
+    def init_app(self, app):
+        app.config.setdefault('JOBS_MODE', 'thread')
+        app.config.setdefault('JOBS_WORKERS', 1)
+        app.config.setdefault('JOBS_BATCH_SIZE', 500)
+        app.config.setdefault('JOBS_PROGRESS_INTERVAL', 0.5)
+        app.extensions['job_runner'] = self
+        app.cli.add_command(jobs_cli)
+        self._executors = {}
+
+    def _executor(self, app):
+        if app not in self._executors:
+            self._executors[app] = ThreadPoolExecutor(
+                max_workers=app.config['JOBS_WORKERS'], thread_name_prefix='ledger-job')
+        return self._executors[app]
+
+    def submit(self, user_id, kind, params=None, payload=None):
+        """创建任务记录并按 JOBS_MODE 安排执行，返回 Job"""
+        from app.models import Job
+        if kind not in TASKS:
+            raise ValueError(f'未知的任务类型: {kind}')
+        job = Job(user_id=user_id, kind=kind, params=params or {}, payload=payload, message='排队中')
+        self.db.session.add(job)
+        self.db.session.commit()
+
+        mode = current_app.config['JOBS_MODE']
+        if mode == 'inline':
+            self.execute(job.id)
+        elif mode == 'thread':
+            app = current_app._get_current_object()
+            self._executor(app).submit(self._execute_in_app, app, job.id)
+        return job
+
+    def _execute_in_app(self, app, job_id):
+        with app.app_context():
+            self.execute(job_id)
+
+    def claim(self, job_id):
+        """原子地把任务从 queued 改为 running，多个 worker 同时领取时只有一个会成功"""
+        from app.models import Job
+        result = self.db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == 'queued')
+            .values(status='running', started_at=datetime.utcnow(), message='执行中')
+        )
+        self.db.session.commit()
+        return result.rowcount == 1
+
+    def execute(self, job_id):
+        """领取并执行一个任务，返回是否由本次调用执行"""
+        from app.models import Job
+        from app import shard_router
+        if not self.claim(job_id):
+            return False
+        db = self.db
+        job = db.session.get(Job, job_id)
+        fn, _ = TASKS[job.kind]
+        ctx = JobContext(self, job)
+        try:
+            with shard_router.use_user(job.user_id):
+                output = fn(ctx)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception('后台任务 %s 执行失败', job_id)
+            job = db.session.get(Job, job_id)
+            job.status = 'failed'
+            job.error = str(e) or e.__class__.__name__
+            job.message = '执行失败'
+        else:
+            job = db.session.get(Job, job_id)
+            if output is not None:
+                job.result, job.result_name, job.result_mimetype = output
+            job.status = 'done'
+            job.progress = 1.0
+            job.message = ctx.summary or '已完成'
+        job.payload = None  # 输入数据只在执行期间需要
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        return True
+
+    def run_pending(self, limit=None):
+        """执行所有排队中的任务（worker 进程调用），返回执行的任务数"""
+        from app.models import Job
+        done = 0
+        while limit is None or done < limit:
+            job_id = self.db.session.query(Job.id).filter_by(status='queued') \
+                .order_by(Job.id).limit(1).scalar()
+            self.db.session.commit()
+            if job_id is None:
+                break
+            if self.execute(job_id):
+                done += 1
+        return done
+
+
+@jobs_cli.command('worker')
+@click.option('--once', is_flag=True, help='执行完当前排队的任务后退出')
+@click.option('--poll', default=1.0, show_default=True, help='队列为空时的轮询间隔(秒)')
+def jobs_worker(once, poll):
+    """在独立进程中领取并执行排队中的任务（配合 JOBS_MODE = 'external' 使用）"""
+    runner = current_app.extensions['job_runner']
+    click.echo('后台任务 worker 已启动。')
+    while True:
+        done = runner.run_pending()
+        if done:
+            click.echo(f'执行了 {done} 个任务。')
+        if once:
+            return
+        time.sleep(poll)
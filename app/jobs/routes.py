@@ -0,0 +1,77 @@
+# app/jobs/routes.py
+from flask import render_template, redirect, url_for, flash, request, jsonify, abort, Response
+from flask_login import current_user, login_required
+from app import db, job_runner
+from app.jobs import bp
+from app.jobrunner import TASKS
+from app.models import Job
+from app.forms import ImportForm, JobForm
+
+
+def _get_own_job(id):
+    job = db.session.get(Job, id)
+    if job is None or job.user_id != current_user.id:
+        abort(404)
+    return job
+
+
+def _wants_json():
+    return request.accept_mimetypes.best == 'application/json' or \
+        request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+
+@bp.route('/')
+@login_required
+def index():
+    """后台任务页面：提交导出/导入/清空/重建汇总任务，查看任务进度并下载结果"""
+    jobs = Job.query.filter_by(user_id=current_user.id).order_by(Job.id.desc()).limit(20).all()
+    return render_template('jobs.html',
+                           title='后台任务',
+                           jobs=jobs,
+                           labels={name: label for name, (_, label) in TASKS.items()},
+                           form=JobForm(),
+                           import_form=ImportForm())
+
+
+@bp.route('/submit/<kind>', methods=['POST'])
+@login_required
+def submit(kind):
+    if kind not in TASKS:
+        abort(404)
+    if kind == 'import_csv':
+        form = ImportForm()
+        payload = form.file.data.read() if form.validate_on_submit() else None
+    else:
+        form = JobForm()
+        payload = None
+    if not form.validate_on_submit():
+        if _wants_json():
+            return jsonify({'errors': form.errors}), 400
+        flash('任务提交失败，请检查表单。', 'danger')
+        return redirect(url_for('jobs.index'))
+
+    job = job_runner.submit(current_user.id, kind, payload=payload)
+    if _wants_json():
+        return jsonify({'id': job.id, 'status_url': url_for('jobs.status', id=job.id)}), 202
+    flash(f'任务“{TASKS[kind][1]}”已提交。', 'info')
+    return redirect(url_for('jobs.index'))
+
+
+@bp.route('/<int:id>')
+@login_required
+def status(id):
+    """轮询任务状态与进度"""
+    job = _get_own_job(id)
+    data = job.to_dict()
+    data['result_url'] = url_for('jobs.result', id=job.id) if job.has_result else None
+    return jsonify(data)
+
+
+@bp.route('/<int:id>/result')
+@login_required
+def result(id):
+    job = _get_own_job(id)
+    if job.result is None:
+        abort(404)
+    return Response(job.result, mimetype=job.result_mimetype or 'application/octet-stream',
+                    headers={'Content-Disposition': f'attachment; filename="{job.result_name or "result"}"'})
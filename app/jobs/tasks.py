@@ -0,0 +1,132 @@
+# app/jobs/tasks.py
+# 内置的后台任务：导出 / 导入 CSV、清空账本、重建汇总
+import csv
+import io
+from datetime import date, datetime
+
+from flask import current_app
+
+from app import db, snapshot_store
+from app.caching import bump_data_version
+from app.ledger import rebuild_checkpoints, reset_checkpoints
+from app.jobrunner import task
+from app.snapshots import discard_snapshot
+from app.models import Transaction, Category, Budget
+from app.money import from_cents
+
+CSV_HEADER = ['日期', '类型', '分类', '金额', '备注']
+TYPE_LABELS = {'expense': '支出', 'income': '收入'}
+TYPE_VALUES = {'支出': 'expense', '收入': 'income', 'expense': 'expense', 'income': 'income'}
+
+
+@task('export_csv', '导出 CSV')
+def export_csv(ctx):
+    """按日期顺序导出全部交易。按 id 分批读取，批与批之间汇报进度"""
+    total = Transaction.query.filter_by(user_id=ctx.user_id).count()
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(CSV_HEADER)
+
+    written, last_id = 0, 0
+    while True:
+        rows = db.session.query(
+            Transaction.id, Transaction.date, Transaction.type, Category.name,
+            Transaction.amount_cents, Transaction.memo
+        ).join(Category, Transaction.category_id == Category.id).filter(
+            Transaction.user_id == ctx.user_id,
+            Transaction.id > last_id
+        ).order_by(Transaction.id).limit(ctx.batch_size).all()
+        if not rows:
+            break
+        for row in rows:
+            writer.writerow([row.date.strftime('%Y-%m-%d'), TYPE_LABELS.get(row.type, row.type),
+                             row.name, f'{from_cents(row.amount_cents):.2f}', row.memo or ''])
+        written += len(rows)
+        last_id = rows[-1].id
+        ctx.progress(written / total, f'已导出 {written}/{total} 条')
+
+    ctx.summary = f'共导出 {written} 条交易'
+    # utf-8-sig 带 BOM，Excel 打开时不会乱码
+    return buf.getvalue().encode('utf-8-sig'), f'transactions-{date.today():%Y%m%d}.csv', 'text/csv'
+
+
+@task('import_csv', '导入 CSV')
+def import_csv(ctx):
+    """导入与导出格式相同的 CSV。分类不存在时自动创建；格式错误的行会被跳过"""
+    rows = list(csv.reader(io.StringIO(ctx.payload.decode('utf-8-sig'))))
+    if rows and rows[0] and rows[0][0].strip() in ('日期', 'date'):
+        rows = rows[1:]
+
+    categories = {
+        (c.name, c.type): c.id
+        for c in Category.query.filter_by(user_id=ctx.user_id)
+    }
+    imported = skipped = 0
+    for i, row in enumerate(rows, 1):
+        try:
+            tx_date = datetime.strptime(row[0].strip(), '%Y-%m-%d')
+            tx_type = TYPE_VALUES[row[1].strip()]
+            name = row[2].strip()
+            amount = float(row[3])
+            memo = row[4].strip()[:200] if len(row) > 4 else ''
+            if not name or amount <= 0:
+                raise ValueError
+        except (IndexError, KeyError, ValueError):
+            skipped += 1
+            continue
+
+        if (name, tx_type) not in categories:
+            category = Category(name=name[:100], type=tx_type, user_id=ctx.user_id)
+            db.session.add(category)
+            db.session.flush()
+            categories[(name, tx_type)] = category.id
+        db.session.add(Transaction(amount=amount, type=tx_type, date=tx_date, memo=memo or None,
+                                   user_id=ctx.user_id, category_id=categories[(name, tx_type)]))
+        imported += 1
+        # 分批提交，避免长时间占用写锁挡住用户自己的记账请求
+        if i % ctx.batch_size == 0:
+            db.session.commit()
+            ctx.progress(i / len(rows), f'已处理 {i}/{len(rows)} 行')
+
+    db.session.commit()
+    ctx.summary = f'导入 {imported} 条，跳过 {skipped} 行'
+
+
+@task('purge', '清空账本')
+def purge(ctx):
+    """删除全部交易和预算（保留分类），分批删除并提交"""
+    totals = {model: model.query.filter_by(user_id=ctx.user_id).count() for model in (Transaction, Budget)}
+    total = sum(totals.values()) or 1
+    deleted = 0
+    for model in (Transaction, Budget):
+        while True:
+            ids = [row[0] for row in db.session.query(model.id).filter_by(user_id=ctx.user_id).limit(ctx.batch_size)]
+            if not ids:
+                break
+            model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+            # 批量删除不经过 flush，需要手动让页面片段缓存、余额检查点和列式快照失效（快照在提交之后删）
+            bump_data_version(db.session, ctx.user_id)
+            if model is Transaction:
+                reset_checkpoints(db.session, ctx.user_id)
+            db.session.commit()
+            if model is Transaction:
+                discard_snapshot(ctx.user_id)
+            deleted += len(ids)
+            ctx.progress(deleted / total, f'已删除 {deleted} 条记录')
+    ctx.summary = f'已删除 {totals[Transaction]} 条交易、{totals[Budget]} 条预算'
+
+
+@task('rebuild_rollups', '重建汇总')
+def rebuild_rollups(ctx):
+    """按交易表重建余额检查点与往月列式快照（与 flask ledger rebuild / flask snapshots rebuild 相同）"""
+    ctx.progress(0, '正在重建余额检查点')
+    rebuild_checkpoints(db.session, ctx.user_id)
+    db.session.commit()
+    ctx.progress(0.5, '正在重建列式快照')
+    discard_snapshot(ctx.user_id)
+    rows = 0
+    if current_app.config['SNAPSHOT_ENABLED'] and snapshot_store.build(db.session, ctx.user_id):
+        snapshot = snapshot_store.open(ctx.user_id)
+        rows = snapshot.rows if snapshot is not None else 0
+    db.session.rollback()
+    ctx.summary = f'已重建余额检查点和快照（{rows} 笔往月交易）'
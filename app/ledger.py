@@ -0,0 +1,285 @@
+# app/ledger.py
+"""
+余额检查点与流水账。
+
+BalanceCheckpoint 保存每个用户每个月末的累计结余（整数分，见 app/money.py）：
+    - 交易在 flush 时有增删改，就把所在月份及以后所有检查点加上变化量（与交易同一个事务提交），
+      该月还没有检查点时先按上一个检查点补一行
+    - 用户第一次改动交易时（或者检查点被批量 SQL 清掉之后）按当前交易表整体重建一次
+    - 批量 SQL（query.delete() 等）绕过了 flush，需要调用 reset_checkpoints() 清掉检查点
+
+查询某一时刻的余额 = 上个月末的检查点 + 本月内此前的交易，最多只扫描一个月的行；
+流水账每一页的逐行余额再用窗口函数在本页范围内累加，与翻到第几页无关。
+流水账按 (date, id) 键集分页（ledger_page），翻页用上一页首尾行的游标，不用 OFFSET 也不计总数。
+"""
+from datetime import datetime
+
+import click
+import sqlalchemy as sa
+from flask.cli import AppGroup
+
+from app.money import from_cents
+from app.rangesum import committed_values
+from app.readmodels import fetch_rows, transaction_select
+from app.session import RoutingSession
+
+ledger_cli = AppGroup('ledger', help='余额检查点命令')
+
+# “已初始化”标记行的 period
+INITIALIZED = -1
+_FIELDS = ('user_id', 'type', 'date', 'amount_cents')
+
+
+def _models():
+    from app.models import Transaction, BalanceCheckpoint
+    return Transaction, BalanceCheckpoint
+
+
+def period_of(day):
+    return day.year * 12 + day.month - 1
+
+
+def signed_cents():
+    """收入为正、支出为负的金额（分）表达式"""
+    Transaction, _ = _models()
+    return sa.case((Transaction.type == 'income', Transaction.amount_cents), else_=-Transaction.amount_cents)
+
+
+def is_initialized(session, user_id):
+    _, BalanceCheckpoint = _models()
+    return session.execute(
+        sa.select(BalanceCheckpoint.period)
+        .where(BalanceCheckpoint.user_id == user_id, BalanceCheckpoint.period == INITIALIZED)
+    ).first() is not None
+
+
+def reset_checkpoints(session, user_id):
+    """删除用户的全部检查点（包括初始化标记），下次改动交易时重建"""
+    _, BalanceCheckpoint = _models()
+    session.execute(sa.delete(BalanceCheckpoint).where(BalanceCheckpoint.user_id == user_id))
+
+
+def rebuild_checkpoints(session, user_id):
+    """按当前交易表重新生成用户的全部检查点，一次按月 GROUP BY"""
+    Transaction, BalanceCheckpoint = _models()
+    reset_checkpoints(session, user_id)
+    period = (sa.extract('year', Transaction.date) * 12 + sa.extract('month', Transaction.date) - 1).label('period')
+    rows = session.execute(
+        sa.select(period, sa.func.sum(signed_cents()))
+        .where(Transaction.user_id == user_id)
+        .group_by(period).order_by(period)
+    ).all()
+    balance = 0
+    values = [{'user_id': user_id, 'period': INITIALIZED, 'balance_cents': 0}]
+    for p, total in rows:
+        balance += total
+        values.append({'user_id': user_id, 'period': int(p), 'balance_cents': balance})
+    session.execute(sa.insert(BalanceCheckpoint), values)
+
+
+def _apply_delta(session, user_id, period, delta):
+    _, BalanceCheckpoint = _models()
+    checkpoint = BalanceCheckpoint.__table__
+    mine = checkpoint.c.user_id == user_id
+    previous = (
+        sa.select(checkpoint.c.balance_cents).where(mine, checkpoint.c.period < period)
+        .order_by(checkpoint.c.period.desc()).limit(1).scalar_subquery()
+    )
+    exists = sa.select(checkpoint.c.period).where(mine, checkpoint.c.period == period).exists()
+    session.execute(
+        sa.insert(BalanceCheckpoint).from_select(
+            ['user_id', 'period', 'balance_cents'],
+            sa.select(sa.literal(user_id), sa.literal(period), sa.func.coalesce(previous, 0)).where(~exists)
+        )
+    )
+    session.execute(
+        sa.update(BalanceCheckpoint)
+        .where(BalanceCheckpoint.user_id == user_id, BalanceCheckpoint.period >= period)
+        .values(balance_cents=BalanceCheckpoint.balance_cents + delta)
+    )
+
+
+def _maintain_on_flush(session, flush_context):
+    Transaction, _ = _models()
+    deltas = {}
+    stale = set()
+
+    def record(user_id, type_, day, cents):
+        by_period = deltas.setdefault(user_id, {})
+        p = period_of(day)
+        by_period[p] = by_period.get(p, 0) + (cents if type_ == 'income' else -cents)
+
+    for obj in session.new:
+        if isinstance(obj, Transaction):
+            record(obj.user_id, obj.type, obj.date, obj.amount_cents)
+    for obj in list(session.deleted) + list(session.dirty):
+        if not isinstance(obj, Transaction) or (obj in session.dirty and not session.is_modified(obj)):
+            continue
+        old = committed_values(obj, _FIELDS)
+        if old is None:
+            stale.add(sa.inspect(obj).dict.get('user_id'))
+            continue
+        record(old[0], old[1], old[2], -old[3])
+        if obj in session.dirty:
+            record(obj.user_id, obj.type, obj.date, obj.amount_cents)
+
+    if None in stale:
+        # 连用户都不知道（属性没有加载），只能让所有检查点失效
+        _, BalanceCheckpoint = _models()
+        session.execute(sa.delete(BalanceCheckpoint))
+        return
+    for user_id in sorted(set(deltas) | stale):
+        if user_id in stale or not is_initialized(session, user_id):
+            rebuild_checkpoints(session, user_id)
+            continue
+        for period, delta in sorted(deltas[user_id].items()):
+            if delta:
+                _apply_delta(session, user_id, period, delta)
+
+
+# --- 查询 ---
+
+def balance_before(session, user_id, moment, tx_id=None):
+    """
+    moment 之前（tx_id 不为空时，还包括同一时刻 id 更小的交易）全部交易的结余（元）。
+    有检查点时只需要上个月末的检查点 + 本月内的交易；没有时退回到全量求和。
+    """
+    return from_cents(_balance_before_cents(session, user_id, moment, tx_id))
+
+
+def _balance_before_cents(session, user_id, moment, tx_id):
+    Transaction, BalanceCheckpoint = _models()
+    earlier = Transaction.date < moment
+    if tx_id is not None:
+        earlier = sa.or_(earlier, sa.and_(Transaction.date == moment, Transaction.id < tx_id))
+    conditions = [Transaction.user_id == user_id, earlier]
+
+    base = 0
+    if is_initialized(session, user_id):
+        base = session.execute(
+            sa.select(BalanceCheckpoint.balance_cents)
+            .where(BalanceCheckpoint.user_id == user_id, BalanceCheckpoint.period < period_of(moment))
+            .order_by(BalanceCheckpoint.period.desc()).limit(1)
+        ).scalar() or 0
+        conditions.append(Transaction.date >= datetime(moment.year, moment.month, 1))
+    partial = session.execute(sa.select(sa.func.sum(signed_cents())).where(*conditions)).scalar() or 0
+    return base + partial
+
+
+def running_balances(session, user_id, transactions):
+    """
+    流水账一页中每笔交易之后的余额 {交易 id: 余额}。
+    transactions 为按 (date, id) 排序后连续的一段（顺序、倒序均可）。
+    """
+    if not transactions:
+        return {}
+    Transaction, _ = _models()
+    oldest = min(transactions, key=lambda t: (t.date, t.id))
+    newest = max(transactions, key=lambda t: (t.date, t.id))
+    base = _balance_before_cents(session, user_id, oldest.date, oldest.id)
+
+    not_before = sa.or_(Transaction.date > oldest.date, sa.and_(Transaction.date == oldest.date, Transaction.id >= oldest.id))
+    not_after = sa.or_(Transaction.date < newest.date, sa.and_(Transaction.date == newest.date, Transaction.id <= newest.id))
+    running = sa.func.sum(signed_cents()).over(order_by=(Transaction.date, Transaction.id))
+    rows = session.execute(
+        sa.select(Transaction.id, running).where(Transaction.user_id == user_id, not_before, not_after)
+    ).all()
+    return {tx_id: from_cents(base + total) for tx_id, total in rows}
+
+
+# --- 流水账分页 ---
+
+def encode_cursor(row):
+    """翻页游标：交易的 (date, id)，形如 2024-05-01T09:30:00_123"""
+    return f'{row.date.isoformat()}_{row.id}'
+
+
+def decode_cursor(value):
+    """解析 encode_cursor() 生成的游标，无效时返回 None"""
+    moment, _, tx_id = (value or '').rpartition('_')
+    try:
+        return datetime.fromisoformat(moment), int(tx_id)
+    except ValueError:
+        return None
+
+
+def _later_than(moment, tx_id):
+    Transaction, _ = _models()
+    return sa.or_(Transaction.date > moment, sa.and_(Transaction.date == moment, Transaction.id > tx_id))
+
+
+def _earlier_than(moment, tx_id):
+    Transaction, _ = _models()
+    return sa.or_(Transaction.date < moment, sa.and_(Transaction.date == moment, Transaction.id < tx_id))
+
+
+class LedgerPage:
+    """流水账的一页：items 为新的在前的 TransactionRow，next_cursor / prev_cursor 为更早 / 更新一页的游标"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+
+def ledger_page(session, user_id, after=None, before=None, per_page=20):
+    """
+    按 (date, id) 倒序的键集分页：after 给出时取比它更早的一页，before 给出时取比它更新的一页，
+    都没有时为最新的一页（游标为 decode_cursor() 的结果）。
+    每页沿 (user_id, date) 索引定位到游标后只取 per_page + 1 行，翻到多深都一样快；
+    游标指向的位置已经没有交易时（例如被删光）回到第一页。
+    """
+    Transaction, _ = _models()
+    mine = Transaction.user_id == user_id
+    if before is not None:
+        stmt = transaction_select(mine, _later_than(*before)).order_by(Transaction.date, Transaction.id)
+    elif after is not None:
+        stmt = transaction_select(mine, _earlier_than(*after)).order_by(Transaction.date.desc(), Transaction.id.desc())
+    else:
+        stmt = transaction_select(mine).order_by(Transaction.date.desc(), Transaction.id.desc())
+    rows = fetch_rows(session, stmt.limit(per_page + 1))
+    if not rows and (after or before):
+        return ledger_page(session, user_id, per_page=per_page)
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before is not None:
+        rows.reverse()
+        has_newer, has_older = more, True
+    else:
+        has_newer, has_older = after is not None, more
+    return LedgerPage(rows,
+                      next_cursor=encode_cursor(rows[-1]) if has_older and rows else None,
+                      prev_cursor=encode_cursor(rows[0]) if has_newer and rows else None)
+
+
+class BalanceCheckpoints:
+    """
+    余额检查点扩展：
+
+        checkpoints = BalanceCheckpoints(db)
+        checkpoints.init_app(app)
+    """
+
+    def __init__(self, db=None):
+        self.db = db
+
+    def init_app(self, app):
+        app.extensions['balance_checkpoints'] = self
+        app.cli.add_command(ledger_cli)
+        if not sa.event.contains(RoutingSession, 'after_flush', _maintain_on_flush):
+            sa.event.listen(RoutingSession, 'after_flush', _maintain_on_flush)
+
+
+@ledger_cli.command('rebuild')
+@click.option('--user-id', type=int, help='只重建指定用户（默认全部用户）')
+def ledger_rebuild(user_id):
+    """按交易表重建余额检查点（上线本功能或手工改库之后执行一次）"""
+    from app import db, shard_router
+    from app.models import User
+    user_ids = [user_id] if user_id is not None else [uid for uid, in db.session.query(User.id)]
+    for uid in user_ids:
+        with shard_router.use_user(uid) as session:
+            rebuild_checkpoints(session, uid)
+            session.commit()
+    click.echo(f'已重建 {len(user_ids)} 个用户的余额检查点。')
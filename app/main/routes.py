@@ -1,11 +1,19 @@
 # app/main/routes.py
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, abort, current_app
 from flask_login import current_user, login_required
-from app import db
+from app import db, write_queue, singleflight, fragment_cache, search_cache, snapshot_store, range_index
+from app.caching import data_version, year_version
+from app.ledger import decode_cursor, ledger_page, running_balances
+from app.analytics import load_columns, compute_statistics, monthly_category_totals
+from app.downsample import choose_bucket, bucket_start, iter_buckets, bucket_label, downsample_series
 from app.main import bp
+from app.replica import read_replica
 from app.models import Transaction, Category, Budget
+from app.money import to_cents, from_cents
+from app.readmodels import fetch_rows, paginate_ids, paginate_rows
+from app import statements
 from app.forms import TransactionForm, CategoryForm, BudgetForm, SearchForm, DateRangeForm, get_user_expense_categories, get_user_income_categories, ConfirmDeleteForm
-from datetime import datetime, date
+from datetime import datetime, date, time, timedelta
 from sqlalchemy import func, extract
 import calendar
 
@@ -15,6 +23,8 @@ def get_date_range(year_str, month_str):
     try:
         year = int(year_str)
         month = int(month_str)
+        if not (1 <= year <= 9999 and 1 <= month <= 12):
+            raise ValueError
     except (ValueError, TypeError):
         today = date.today()
         year, month = today.year, today.month
@@ -27,9 +37,332 @@ def get_date_range(year_str, month_str):
 
     return start_date, end_date, year, month
 
+
+def get_custom_range(start, end):
+    """自定义区间（DateRangeForm 的 start_date/end_date）：两个日期都有效时返回 (开始时间, 结束时间)，否则返回 None"""
+    if not start or not end:
+        return None
+    if start > end:
+        start, end = end, start
+    return datetime.combine(start, time.min), datetime.combine(end, time.max)
+
+# --- 帮助函数：写操作 ---
+# 写操作都以 “接收 session 的函数” 的形式交给 write_queue.run_write 执行，
+# 只通过 id 引用数据，这样既可以在请求线程内直接提交，也可以交给组提交写线程合并提交。
+def add_transaction_op(user_id, form, type_):
+    """根据记账表单构造“新增交易”写操作，返回新交易的 id"""
+    values = dict(
+        amount=form.amount.data,
+        type=type_,
+        date=form.date.data,
+        memo=form.memo.data,
+        user_id=user_id,
+        category_id=form.category.data.id,
+    )
+
+    def op(session):
+        t = Transaction(**values)
+        session.add(t)
+        session.flush()
+        return t.id
+    return op
+
+# --- 帮助函数：仪表盘数据 ---
+# 仪表盘页面由几个片段组成，每个片段对应 templates 中的一个局部模板，
+# 整页渲染时 include 进 index.html，记账后通过 AJAX 只重新渲染这些片段。
+DASHBOARD_FRAGMENTS = {
+    'stats': '_dashboard_stats.html',
+    'budget_warnings': '_dashboard_budgets.html',
+    'recent_transactions': '_dashboard_recent.html',
+}
+
+
+def is_ajax():
+    return request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+
+def coalesced(name, user_id, args, compute):
+    """
+    同一用户、同一参数的并发计算只执行一次，其余请求等待并共享结果（见 app/singleflight.py）。
+    键中带上数据版本号：写入之后发起的请求不会拿到写入之前就开始计算的结果。
+    compute 必须返回普通数据，不能返回 ORM 对象。
+    """
+    if not current_app.config.get('SINGLE_FLIGHT_ENABLED', True):
+        return compute()
+    key = (name, user_id, data_version(db.session, user_id), args)
+    return singleflight.group.do(key, compute)
+
+
+def get_month_stats(user_id, start_date, end_date):
+    """当月总收入、总支出与结余：启用 RANGESUM 时由按日前缀和索引回答，否则一次 GROUP BY 查询"""
+    totals = range_index.totals_cents(user_id, start_date.date(), end_date.date())
+    if totals is None:
+        totals = dict(statements.execute(db.session, statements.MONTH_TOTALS,
+                                         user_id=user_id, start=start_date, end=end_date).all())
+    income = totals.get('income') or 0
+    expense = totals.get('expense') or 0
+    return {
+        'income': from_cents(income),
+        'expense': from_cents(expense),
+        'balance': from_cents(income - expense)
+    }
+
+
+def get_budget_warnings(user_id, year, month, total_expense):
+    """当月总预算与各分类预算的执行情况"""
+    budgets = statements.execute(db.session, statements.MONTH_BUDGETS, user_id=user_id, year=year, month=month).all()
+    if not budgets:
+        return []
+    # 各分类的支出：启用 RANGESUM 时逐个分类查索引，否则一次 GROUP BY 查出
+    start_date, end_date, _, _ = get_date_range(year, month)
+    if current_app.config['RANGESUM_ENABLED']:
+        spent = {category_id: range_index.totals_cents(user_id, start_date.date(), end_date.date(),
+                                                       category_id)['expense']
+                 for category_id, _, _ in budgets if category_id is not None}
+    else:
+        spent = dict(statements.execute(db.session, statements.SPENT_BY_CATEGORY,
+                                        user_id=user_id, start=start_date, end=end_date).all())
+
+    def warning(name, amount_cents, spent_amount):
+        amount = from_cents(amount_cents)
+        return {
+            'name': name,
+            'amount': amount,
+            'spent': spent_amount,
+            'percent': round(spent_amount / amount * 100, 2) if amount > 0 else 0,
+        }
+
+    # 总预算在前，分类预算在后
+    budget_warnings = [warning('月度总预算', amount_cents, total_expense)
+                       for category_id, _, amount_cents in budgets if category_id is None][:1]
+    budget_warnings += [warning(name, amount_cents, from_cents(spent.get(category_id) or 0))
+                        for category_id, name, amount_cents in budgets if category_id is not None]
+    return budget_warnings
+
+
+def get_recent_transactions(user_id, limit=5):
+    return fetch_rows(db.session, statements.RECENT_ROWS, {'user_id': user_id, 'limit': limit})
+
+
+def get_dashboard_context(user_id, start_date, end_date, year, month):
+    """仪表盘各片段共用的模板变量"""
+    def aggregate():
+        stats = get_month_stats(user_id, start_date, end_date)
+        return stats, get_budget_warnings(user_id, year, month, stats['expense'])
+
+    stats, budget_warnings = coalesced('dashboard', user_id, (start_date, end_date, year, month), aggregate)
+    return {
+        'stats': stats,
+        'budget_warnings': budget_warnings,
+        # 最近交易只有几行，直接按列查询，不参与合并
+        'recent_transactions': get_recent_transactions(user_id),
+        # 删除表单（用于在模板中包含 CSRF token）
+        'delete_form': ConfirmDeleteForm(),
+    }
+
+
+def get_chart_data(user_id, start_date, end_date):
+    """
+    仪表盘图表数据：支出分类饼图 + 收支趋势折线图，区间可以是一个月也可以是任意长的自定义区间。
+    首页直接把结果内嵌进页面，/api/chart-data 切换月份或区间时返回同样的结构。
+    折线图按区间长度自动选择日/周/月粒度，点数仍超过 CHART_MAX_POINTS 时再用 LTTB 降采样，
+    所以返回的数据量与区间长度无关。
+    """
+    max_points = current_app.config.get('CHART_MAX_POINTS', 200)
+    return coalesced('chart', user_id, (start_date, end_date, max_points),
+                     lambda: _build_chart_data(user_id, start_date, end_date, max_points))
+
+
+def _build_chart_data(user_id, start_date, end_date, max_points):
+    # 1. 支出分类饼图 (金额从大到小)
+    pie = statements.execute(db.session, statements.EXPENSE_PIE, user_id=user_id, start=start_date, end=end_date).all()
+    pie_data = {
+        'labels': [row.name for row in pie],
+        'data': [from_cents(row.total) for row in pie]
+    }
+
+    # 2. 收支折线图：数据库只按日汇总，再在内存中归入周/月桶
+    first_day, last_day = start_date.date(), end_date.date()
+    bucket = choose_bucket(first_day, last_day, max_points)
+    starts = list(iter_buckets(first_day, last_day, bucket))
+    position = {day: i for i, day in enumerate(starts)}
+    by_bucket = {'expense': [0] * len(starts), 'income': [0] * len(starts)}
+
+    rows = statements.execute(db.session, statements.DAILY_TOTALS, user_id=user_id, start=start_date, end=end_date).all()
+    for row in rows:
+        # SQLite 的 date() 返回字符串，其它数据库返回 date
+        day = row.day if isinstance(row.day, date) else date.fromisoformat(row.day)
+        by_bucket[row.type][position[bucket_start(day, bucket)]] += row.total
+    by_bucket = {type_: [from_cents(total) for total in totals] for type_, totals in by_bucket.items()}
+
+    labels, series = downsample_series([bucket_label(day, bucket) for day in starts], by_bucket, max_points)
+    line_data = {
+        'bucket': bucket,
+        'labels': labels,
+        'expense': series['expense'],
+        'income': series['income']
+    }
+    return {'pie_data': pie_data, 'line_data': line_data}
+
+
+def get_trend_data(user_id, year, month, months):
+    """
+    截至 year 年 month 月（含）的最近 months 个月，每月的收入、支出、结余及分类明细。
+    只有一次查询：按 (用户, 日期) 索引范围扫描，再按 (月份序号, 类型, 分类) GROUP BY，
+    月份序号 = 年 * 12 + 月，数据再多也只返回 months * 分类数 行。
+    启用列式快照时往月部分改为在快照上用 numpy 汇总，这条查询只扫描快照之后（本月起）的交易。
+    """
+    return coalesced('trend', user_id, (year, month, months),
+                     lambda: _build_trend_data(user_id, year, month, months))
+
+
+def _build_trend_data(user_id, year, month, months):
+    last = year * 12 + month - 1
+    # 窗口最早只能从公元 1 年 1 月（月份序号 12）开始
+    first = max(last - months + 1, 12)
+    months = last - first + 1
+    start_date = datetime(first // 12, first % 12 + 1, 1)
+    _, end_date, _, _ = get_date_range(year, month)
+
+    # 先按分累加，返回前再换算成元
+    totals = {'income': [0] * months, 'expense': [0] * months}
+    categories = {'income': {}, 'expense': {}}
+
+    def add(type_, name, i, cents):
+        totals[type_][i] += cents
+        by_month = categories[type_].setdefault(name, [0] * months)
+        by_month[i] += cents
+
+    conditions = [Transaction.user_id == user_id, Transaction.date.between(start_date, end_date)]
+    # 往月部分有列式快照时直接在快照上汇总，数据库只查快照之后的交易
+    closed = snapshot_store.closed_columns(db.session, user_id, start_date.date(), end_date.date())
+    if closed is not None:
+        columns, boundary = closed
+        names = dict(db.session.query(Category.id, Category.name).filter(Category.user_id == user_id))
+        ids, table = monthly_category_totals(columns, first, months)
+        for c, category_id in enumerate(ids):
+            for t, type_ in enumerate(('expense', 'income')):
+                if table[c, :, t].any():
+                    for i in range(months):
+                        add(type_, names.get(int(category_id), ''), i, int(table[c, i, t]))
+        conditions.append(Transaction.date >= datetime.combine(boundary, time.min))
+
+    period = (extract('year', Transaction.date) * 12 + extract('month', Transaction.date) - 1).label('period')
+    rows = db.session.query(
+        period, Transaction.type, Category.name, func.sum(Transaction.amount_cents).label('total')
+    ).join(Transaction.category).filter(*conditions).group_by(period, Transaction.type, Category.name).all()
+    for row in rows:
+        add(row.type, row.name, int(row.period) - first, row.total)
+
+    return {
+        'labels': [f'{p // 12}-{p % 12 + 1:02d}' for p in range(first, last + 1)],
+        'income': [from_cents(c) for c in totals['income']],
+        'expense': [from_cents(c) for c in totals['expense']],
+        'balance': [from_cents(income - expense) for income, expense in zip(totals['income'], totals['expense'])],
+        'categories': {type_: {name: [from_cents(c) for c in by_month] for name, by_month in by_name.items()}
+                       for type_, by_name in categories.items()},
+    }
+
+
+def get_year_heatmap(user_id, year):
+    """
+    日历热力图：year 年每一天的支出和收入合计（一次按日 GROUP BY）。
+    已经结束的年份按该年交易的版本号缓存，只有日期在这一年的交易变化后才会重新计算。
+    """
+    def compute():
+        return coalesced('heatmap', user_id, (year,), lambda: _build_year_heatmap(user_id, year))
+
+    if year < date.today().year:
+        return fragment_cache.cached('heatmap', user_id, (year,), compute,
+                                     version=year_version(db.session, user_id, year))
+    return compute()
+
+
+def _build_year_heatmap(user_id, year):
+    first_day = date(year, 1, 1)
+    days = (date(year + 1, 1, 1) - first_day).days
+    totals = {'expense': [0.0] * days, 'income': [0.0] * days}
+
+    day_col = func.date(Transaction.date).label('day')
+    rows = db.session.query(
+        Transaction.type, day_col, func.sum(Transaction.amount_cents).label('total')
+    ).filter(
+        Transaction.user_id == user_id,
+        Transaction.date.between(datetime(year, 1, 1), datetime(year, 12, 31, 23, 59, 59))
+    ).group_by(Transaction.type, day_col).all()
+    for row in rows:
+        day = row.day if isinstance(row.day, date) else date.fromisoformat(row.day)
+        totals[row.type][(day - first_day).days] += from_cents(row.total)
+
+    return {
+        'year': year,
+        'start': first_day.isoformat(),
+        'expense': totals['expense'],
+        'income': totals['income'],
+    }
+
+
+def heatmap_weeks(heatmap, levels=4):
+    """把热力图数据排成按周（周一开头）的列，每格带 0..levels 的支出强度等级"""
+    first_day = date.fromisoformat(heatmap['start'])
+    max_expense = max(heatmap['expense'], default=0.0)
+    weeks = [[None] * first_day.weekday()]
+    for i, expense in enumerate(heatmap['expense']):
+        if len(weeks[-1]) == 7:
+            weeks.append([])
+        level = 0 if expense <= 0 else max(1, -(-expense * levels // max_expense))
+        weeks[-1].append({
+            'date': first_day + timedelta(days=i),
+            'expense': expense,
+            'income': heatmap['income'][i],
+            'level': int(level),
+        })
+    weeks[-1].extend([None] * (7 - len(weeks[-1])))
+    return weeks
+
+
+def get_statistics_range(date_form):
+    """统计区间：?start_date=&end_date=，缺省为截至今天的最近 STATISTICS_MONTHS 个月"""
+    custom = get_custom_range(date_form.start_date.data, date_form.end_date.data)
+    if custom:
+        return custom
+    today = date.today()
+    first = today.year * 12 + today.month - current_app.config['STATISTICS_MONTHS']
+    return datetime(first // 12, first % 12 + 1, 1), datetime.combine(today, time.max)
+
+
+def get_statistics(user_id, start_date, end_date):
+    """
+    区间内的收支统计（见 app/analytics.py）：只取四列装进 numpy 数组，一次向量化计算。
+    整个区间都在今天之前时按数据版本号缓存。
+    """
+    max_points = current_app.config.get('CHART_MAX_POINTS', 200)
+
+    def build():
+        columns = load_columns(db.session, user_id, start_date, end_date)
+        names = dict(db.session.query(Category.id, Category.name).filter(Category.user_id == user_id))
+        return compute_statistics(columns, start_date.date(), end_date.date(), names, max_points)
+
+    def compute():
+        return coalesced('statistics', user_id, (start_date, end_date, max_points), build)
+
+    if end_date.date() < date.today():
+        return fragment_cache.cached('statistics', user_id, (start_date, end_date, max_points), compute)
+    return compute()
+
+
+def render_dashboard_fragments(user_id, start_date, end_date, year, month):
+    """渲染所有仪表盘片段，返回 {片段名: HTML}"""
+    context = get_dashboard_context(user_id, start_date, end_date, year, month)
+    return {
+        name: render_template(template, current_year=year, current_month=month, **context)
+        for name, template in DASHBOARD_FRAGMENTS.items()
+    }
+
 # --- 1. 仪表盘 (首页) & 记账 ---
 @bp.route('/', methods=['GET', 'POST'])
 @login_required
+@read_replica
 def index():
     """主页面，显示本月收支和结余，包括数字，折线和饼图，提供月份切换，链接到其余页面；提供记账表单，支持收入和支出两种类型的记账。具有预算提醒功能，采用不同颜色标注预算情况。"""
     # --- 日期筛选逻辑 ---
@@ -43,6 +376,8 @@ def index():
         date_form.month.data = month_str
 
     start_date, end_date, year, month = get_date_range(year_str, month_str)
+    # 图表可以单独查看自定义区间，统计卡片与预算仍按所选月份
+    chart_range = get_custom_range(date_form.start_date.data, date_form.end_date.data) or (start_date, end_date)
 
     # --- 记账表单逻辑 ---
     # 我们使用两个表单实例，并用 prefix 区分
@@ -54,233 +389,258 @@ def index():
     income_form.category.query_factory = get_user_income_categories
     income_form.type.data = 'income' # 预设收入表单的类型
 
-    # 处理支出表单提交
-    if expense_form.validate_on_submit() and expense_form.submit.data:
-        t = Transaction(
-            amount=expense_form.amount.data,
-            type='expense',
-            date=expense_form.date.data,
-            memo=expense_form.memo.data,
-            author=current_user,
-            category=expense_form.category.data
-        )
-        db.session.add(t)
-        db.session.commit()
-        flash('支出记录已添加！', 'success')
-        return redirect(url_for('main.index', year=year, month=month))
-
-    # 处理收入表单提交
-    if income_form.validate_on_submit() and income_form.submit.data:
-        t = Transaction(
-            amount=income_form.amount.data,
-            type='income',
-            date=income_form.date.data,
-            memo=income_form.memo.data,
-            author=current_user,
-            category=income_form.category.data
-        )
-        db.session.add(t)
-        db.session.commit()
-        flash('收入记录已添加！', 'success')
-        return redirect(url_for('main.index', year=year, month=month))
+    # 处理记账表单提交。AJAX 提交（仪表盘弹窗）只返回需要更新的页面片段，不再重定向后整页重绘
+    for form, type_, message in ((expense_form, 'expense', '支出记录已添加！'),
+                                 (income_form, 'income', '收入记录已添加！')):
+        if form.validate_on_submit() and form.submit.data:
+            write_queue.run_write(add_transaction_op(current_user.id, form, type_))
+            if is_ajax():
+                return jsonify({
+                    'message': message,
+                    'fragments': render_dashboard_fragments(current_user.id, start_date, end_date, year, month),
+                    'chart_data': get_chart_data(current_user.id, *chart_range),
+                    'trend_data': get_trend_data(current_user.id, year, month, current_app.config['TREND_MONTHS']),
+                })
+            flash(message, 'success')
+            return redirect(url_for('main.index', year=year, month=month))
+
+    if request.method == 'POST' and is_ajax():
+        form = income_form if income_form.submit.data else expense_form
+        return jsonify({'errors': form.errors}), 400
 
     # --- 仪表盘统计数据查询 (GET) ---
-
-    # 1. 总收支与结余
-    total_income_q = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.type == 'income',
-        Transaction.date.between(start_date, end_date)
-    ).scalar() or 0.0
-
-    total_expense_q = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.type == 'expense',
-        Transaction.date.between(start_date, end_date)
-    ).scalar() or 0.0
-
-    balance = total_income_q - total_expense_q
-
-    stats = {
-        'income': total_income_q,
-        'expense': total_expense_q,
-        'balance': balance
-    }
-
-    # 2. 预算提醒
-    budget_warnings = []
-
-    # 查询总预算
-    total_budget_q = Budget.query.filter(
-        Budget.user_id == current_user.id,
-        Budget.year == year,
-        Budget.month == month,
-        Budget.category_id == None
-    ).first()
-
-    if total_budget_q:
-        spent_percent = (total_expense_q / total_budget_q.amount) * 100 if total_budget_q.amount > 0 else 0
-        budget_warnings.append({
-            'name': '月度总预算',
-            'amount': total_budget_q.amount,
-            'spent': total_expense_q,
-            'percent': round(spent_percent, 2),
-        })
-
-    # 查询分类预算
-    category_budgets_q = Budget.query.filter(
-        Budget.user_id == current_user.id,
-        Budget.year == year,
-        Budget.month == month,
-        Budget.category_id != None
-    ).join(Category).all()
-
-    for cb in category_budgets_q:
-        spent_in_category = cb.category.get_spent_in_month(year, month)
-        spent_percent = (spent_in_category / cb.amount) * 100 if cb.amount > 0 else 0
-        budget_warnings.append({
-            'name': cb.category.name,
-            'amount': cb.amount,
-            'spent': spent_in_category,
-            'percent': round(spent_percent, 2),
-        })
-
-    # 3. 最近 5 笔交易
-    recent_transactions = Transaction.query.filter(
-        Transaction.user_id == current_user.id
-    ).order_by(Transaction.id.desc()).limit(5).all()
-
-    # 删除表单（用于在模板中包含 CSRF token）
-    delete_form = ConfirmDeleteForm()
+    context = get_dashboard_context(current_user.id, start_date, end_date, year, month)
 
     return render_template('index.html',
                            title='仪表盘',
                            expense_form=expense_form,
                            income_form=income_form,
                            date_form=date_form,
-                           stats=stats,
-                           budget_warnings=budget_warnings,
-                           recent_transactions=recent_transactions,
                            current_year=year,
                            current_month=month,
-                           delete_form=delete_form)
+                           chart_range=chart_range,
+                           chart_data=get_chart_data(current_user.id, *chart_range),
+                           trend_data=get_trend_data(current_user.id, year, month, current_app.config['TREND_MONTHS']),
+                           **context)
+
+
+@bp.route('/fragments/<name>')
+@login_required
+@read_replica
+def dashboard_fragment(name):
+    """单独渲染仪表盘的某个片段（统计卡片、预算提醒、最近交易），供页面局部刷新使用"""
+    if name not in DASHBOARD_FRAGMENTS:
+        abort(404)
+    year_str = request.args.get('year', str(date.today().year))
+    month_str = request.args.get('month', str(date.today().month))
+    start_date, end_date, year, month = get_date_range(year_str, month_str)
+    context = get_dashboard_context(current_user.id, start_date, end_date, year, month)
+    return render_template(DASHBOARD_FRAGMENTS[name], current_year=year, current_month=month, **context)
 
 # --- 2. API 端点 (用于图表) ---
 
 @bp.route('/api/chart-data')
 @login_required
+@read_replica
 def chart_data():
+    """图表数据：?year=&month= 按月，?start_date=&end_date= 为任意自定义区间（优先）"""
+    date_form = DateRangeForm(request.args)
     year_str = request.args.get('year', str(date.today().year))
     month_str = request.args.get('month', str(date.today().month))
 
     start_date, end_date, _, _ = get_date_range(year_str, month_str)
+    start_date, end_date = get_custom_range(date_form.start_date.data, date_form.end_date.data) or (start_date, end_date)
 
-    # 1. 支出分类饼图 (当月)
-    pie_data_q = db.session.query(
-        Category.name,
-        func.sum(Transaction.amount).label('total')
-    ).join(Transaction).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.type == 'expense',
-        Transaction.date.between(start_date, end_date)
-    ).group_by(Category.name).order_by(func.sum(Transaction.amount).desc()).all()
+    return jsonify(get_chart_data(current_user.id, start_date, end_date))
 
-    pie_data = {
-        'labels': [row.name for row in pie_data_q],
-        'data': [float(row.total) for row in pie_data_q]
-    }
 
-    # 2. 收支趋势折线图 (最近6个月)
-    # (为了简化，我们暂时也只显示当月的每日趋势)
-    # 一个更复杂的查询会 group by (最近6个的) 'year-month'
+@bp.route('/api/trend')
+@login_required
+@read_replica
+def trend():
+    """最近 N 个月（?months=，默认 TREND_MONTHS）的月度收支趋势，截至 ?year=&month=（默认本月）"""
+    year_str = request.args.get('year', str(date.today().year))
+    month_str = request.args.get('month', str(date.today().month))
+    _, _, year, month = get_date_range(year_str, month_str)
+    months = request.args.get('months', current_app.config['TREND_MONTHS'], type=int)
+    months = min(max(months, 1), current_app.config['TREND_MAX_MONTHS'])
+    return jsonify(get_trend_data(current_user.id, year, month, months))
 
-    # 我们改为查询 "当月每日收支"
-    line_data_expense = db.session.query(
-        extract('day', Transaction.date).label('day'),
-        func.sum(Transaction.amount).label('total')
-    ).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.type == 'expense',
-        Transaction.date.between(start_date, end_date)
-    ).group_by('day').all()
-
-    line_data_income = db.session.query(
-        extract('day', Transaction.date).label('day'),
-        func.sum(Transaction.amount).label('total')
-    ).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.type == 'income',
-        Transaction.date.between(start_date, end_date)
-    ).group_by('day').all()
-
-    # 准备 Chart.js 数据
-    days_in_month = end_date.day
-    line_labels = list(range(1, days_in_month + 1))
-    expense_by_day = [0.0] * days_in_month
-    income_by_day = [0.0] * days_in_month
-
-    for row in line_data_expense:
-        expense_by_day[int(row.day) - 1] = float(row.total)
-    for row in line_data_income:
-        income_by_day[int(row.day) - 1] = float(row.total)
 
-    line_data = {
-        'labels': line_labels,
-        'expense': expense_by_day,
-        'income': income_by_day
-    }
+def get_heatmap_year():
+    year = request.args.get('year', date.today().year, type=int)
+    if not 1 <= year < 9999:
+        abort(404)
+    return year
 
-    return jsonify({'pie_data': pie_data, 'line_data': line_data})
+
+@bp.route('/api/heatmap')
+@login_required
+@read_replica
+def heatmap():
+    """?year= 整年的每日收支合计（默认今年）"""
+    year = get_heatmap_year()
+    return jsonify(get_year_heatmap(current_user.id, year))
+
+
+@bp.route('/calendar')
+@login_required
+@read_replica
+def calendar_view():
+    """日历热力图页面：一年中每天的支出强度，一次请求一整年"""
+    year = get_heatmap_year()
+    data = get_year_heatmap(current_user.id, year)
+    return render_template('calendar.html',
+                           title='日历视图',
+                           year=year,
+                           weeks=heatmap_weeks(data),
+                           total_expense=sum(data['expense']),
+                           total_income=sum(data['income']),
+                           current_year=date.today().year)
+
+
+@bp.route('/api/statistics')
+@login_required
+@read_replica
+def statistics_data():
+    """?start_date=&end_date= 区间内的分位数、直方图、星期/周/月汇总与移动平均（默认最近 STATISTICS_MONTHS 个月）"""
+    start_date, end_date = get_statistics_range(DateRangeForm(request.args))
+    return jsonify(get_statistics(current_user.id, start_date, end_date))
+
+
+@bp.route('/statistics')
+@login_required
+@read_replica
+def statistics():
+    """统计分析页面：图表数据直接内嵌，切换区间就是带参数重新打开本页"""
+    date_form = DateRangeForm(request.args)
+    start_date, end_date = get_statistics_range(date_form)
+    date_form.start_date.data, date_form.end_date.data = start_date.date(), end_date.date()
+    return render_template('statistics.html',
+                           title='统计分析',
+                           date_form=date_form,
+                           data=get_statistics(current_user.id, start_date, end_date))
 
 
 # --- 3. 交易查找与筛选 ---
 
+def build_search_facets(rows, start=None, end=None):
+    """
+    分面查询的结果（见 statements.SearchStatements.facets）汇总成按分类、按月两组，
+    金额换算成元，另返回各类型的合计（分）。
+    每个月份带上点击后要用的起止日期：该月与当前日期条件的交集。
+    """
+    categories, months = {}, {}
+    by_type = {'income': 0, 'expense': 0}
+    for category_id, name, type_, period, count, cents in rows:
+        by_type[type_] = by_type.get(type_, 0) + cents
+        category = categories.setdefault(category_id, {'id': category_id, 'name': name, 'type': type_, 'count': 0, 'total': 0})
+        category['count'] += count
+        category['total'] += cents
+        month = months.setdefault(int(period), {'count': 0, 'income': 0, 'expense': 0})
+        month['count'] += count
+        month[type_] = month.get(type_, 0) + cents
+
+    month_facets = []
+    for period in sorted(months, reverse=True):
+        month = months[period]
+        first = date(period // 12, period % 12 + 1, 1)
+        last = first.replace(day=calendar.monthrange(first.year, first.month)[1])
+        month_facets.append({
+            'label': f'{first.year}-{first.month:02d}',
+            'start_date': max(first, start).isoformat() if start else first.isoformat(),
+            'end_date': min(last, end).isoformat() if end else last.isoformat(),
+            'count': month['count'],
+            'income': from_cents(month['income']),
+            'expense': from_cents(month['expense']),
+        })
+    category_facets = sorted(categories.values(), key=lambda c: (-c['total'], c['name']))
+    for category in category_facets:
+        category['total'] = from_cents(category['total'])
+    return {'categories': category_facets, 'months': month_facets}, by_type
+
+
 @bp.route('/transactions')
 @login_required
+@read_replica
 def transactions():
-    """可以根据关键词、分类、时间范围、金额区间等多种条件组合查找交易，支持分页显示，并统计总收入、总支出和总结余。"""
+    """可以根据关键词、分类、时间范围、金额区间等多种条件组合查找交易，支持分页显示，并统计总收入、总支出和总结余，侧栏按分类和月份列出分面。"""
     page = request.args.get('page', 1, type=int)
     # 使用 request.args 填充表单，使其在 GET 请求后保持状态
     form = SearchForm(request.args)
+    # GET 表单不整体 validate（没有 CSRF token）；金额单独校验，无效的条件（NaN、超出范围）忽略并在表单上提示
+    for field in (form.min_amount, form.max_amount):
+        if not field.validate(form):
+            field.data = None
 
-    query = Transaction.query.filter_by(author=current_user)
-
-    # 动态构建查询
-    if form.keyword.data:
-        query = query.filter(Transaction.memo.ilike(f"%{form.keyword.data}%"))
-       
-    if form.category.data:
-        query = query.filter(Transaction.category_id == form.category.data.id)
-
-    if form.start_date.data:
-        query = query.filter(Transaction.date >= form.start_date.data)
-
-    if form.end_date.data:
+    # 动态构建查询条件
+    search = statements.SearchFilters(
+        user_id=current_user.id,
+        keyword=f"%{form.keyword.data}%" if form.keyword.data else None,
+        category_id=form.category.data.id if form.category.data else None,
+        start=form.start_date.data or None,
         # 包含当天
-        query = query.filter(Transaction.date <= datetime.combine(form.end_date.data, datetime.max.time()))
-       
-    if form.min_amount.data:
-        query = query.filter(Transaction.amount >= form.min_amount.data)
-       
-    if form.max_amount.data:
-        query = query.filter(Transaction.amount <= form.max_amount.data)
-
-    # 排序和分页
-    results = query.order_by(Transaction.date.desc()).paginate(page=page, per_page=20)
-
-    # 统计总收入、总支出、总结余
-    total_income = query.filter(Transaction.type == 'income').with_entities(func.sum(Transaction.amount)).scalar() or 0.0
-    total_expense = query.filter(Transaction.type == 'expense').with_entities(func.sum(Transaction.amount)).scalar() or 0.0
-    stats = {
-        'income': total_income,
-        'expense': total_expense,
-        'balance': total_income - total_expense
-    }
+        end=datetime.combine(form.end_date.data, datetime.max.time()) if form.end_date.data else None,
+        min_cents=to_cents(form.min_amount.data) if form.min_amount.data else None,
+        max_cents=to_cents(form.max_amount.data) if form.max_amount.data else None,
+    )
+
+    search_stmts, search_params = statements.search_statements(search)
+
+    # 分面与总收入、总支出、总结余（与分页无关，相同筛选条件的并发请求合并为一次）
+    # 分面按 (分类, 类型, 月份) 分组一次查出，这条查询本来就要读遍所有匹配的交易，合计直接由分面相加
+    def search_summary():
+        rows = statements.execute(db.session, search_stmts.facets, **search_params).all()
+        facets, by_type = build_search_facets(rows, form.start_date.data, form.end_date.data)
+        income, expense = by_type['income'], by_type['expense']
+        return {
+            'income': from_cents(income),
+            'expense': from_cents(expense),
+            'balance': from_cents(income - expense)
+        }, facets
+
+    filters = (form.keyword.data, search.category_id,
+               form.start_date.data, form.end_date.data, form.min_amount.data, form.max_amount.data)
+
+    def summarize():
+        return coalesced('search-stats', current_user.id, filters, search_summary)
+
+    def fetch_ids(limit):
+        return statements.execute(db.session, search_stmts.ids, **search_params, limit=limit).scalars().all()
+
+    # 排序和分页：列表只读，按列取出轻量行对象。
+    # 第一次查询时记下全部 id 与汇总，翻页只按主键取本页的行
+    snapshot = search_cache.snapshot(current_user.id, search, fetch_ids, summarize)
+    if snapshot is not None:
+        results = paginate_ids(db.session, statements.ROWS_BY_ID, snapshot.ids, page=page, per_page=20,
+                               params={'user_id': current_user.id})
+        stats, facets = snapshot.summary
+    else:
+        results = paginate_rows(db.session, search_stmts.rows, page=page, per_page=20,
+                                count_select=search_stmts.count, params=search_params)
+        stats, facets = summarize()
+    # 分面与翻页链接在当前筛选条件上修改，去掉页码
+    search_args = {key: value for key, value in request.args.items() if key != 'page'}
 
     # 用于删除操作的简单 CSRF 表单
     delete_form = ConfirmDeleteForm()
 
-    return render_template('transactions.html', title='交易查找', form=form, transactions=results, delete_form=delete_form, stats=stats)
+    return render_template('transactions.html', title='交易查找', form=form, transactions=results, delete_form=delete_form,
+                           stats=stats, facets=facets, search_args=search_args)
+
+
+@bp.route('/ledger')
+@login_required
+@read_replica
+def ledger():
+    """流水账：按时间倒序列出全部交易，每行显示该笔交易之后的账户余额"""
+    # ?after= / ?before= 为上一页末行 / 首行的游标（见 app/ledger.py），无效的游标按第一页处理
+    results = ledger_page(db.session, current_user.id,
+                          after=decode_cursor(request.args.get('after')),
+                          before=decode_cursor(request.args.get('before')), per_page=20)
+    # 余额从最近的月度检查点开始，只在本页范围内累加，与翻到多深无关
+    balances = running_balances(db.session, current_user.id, results.items)
+    return render_template('ledger.html', title='流水账', transactions=results, balances=balances)
 
 
 # --- 6. 交易编辑与删除 ---
@@ -313,12 +673,20 @@ def edit_transaction(id):
             pass
 
     if form.validate_on_submit():
-        t.amount = float(form.amount.data)
-        t.type = form.type.data
-        t.date = form.date.data
-        t.memo = form.memo.data
-        t.category = form.category.data
-        db.session.commit()
+        values = dict(
+            amount=form.amount.data,
+            type=form.type.data,
+            date=form.date.data,
+            memo=form.memo.data,
+            category_id=form.category.data.id,
+        )
+
+        def update(session):
+            tx = session.get(Transaction, id)
+            for key, value in values.items():
+                setattr(tx, key, value)
+
+        write_queue.run_write(update)
         flash('交易已更新。', 'success')
         # 优先返回原页面
         return redirect(url_for('main.index'))
@@ -337,8 +705,7 @@ def delete_transaction(id):
             flash('没有权限删除此交易。', 'danger')
             return redirect(request.referrer or url_for('main.index'))
 
-        db.session.delete(t)
-        db.session.commit()
+        write_queue.run_write(lambda session: session.delete(session.get(Transaction, id)))
         flash('交易已删除。', 'success')
     else:
         flash('未能确认删除操作。', 'warning')
@@ -361,21 +728,16 @@ def categories():
         ).first()
        
         if not exists:
-            category = Category(
-                name=form.name.data,
-                type=form.type.data,
-                owner=current_user
-            )
-            db.session.add(category)
-            db.session.commit()
+            values = dict(name=form.name.data, type=form.type.data, user_id=current_user.id)
+            write_queue.run_write(lambda session: session.add(Category(**values)))
             flash('分类已添加。', 'success')
         else:
             flash('同名同类型的分类已存在。', 'warning')
         return redirect(url_for('main.categories'))
 
-    # GET: 显示所有分类
-    expense_categories = Category.query.filter_by(owner=current_user, type='expense').order_by(Category.name).all()
-    income_categories = Category.query.filter_by(owner=current_user, type='income').order_by(Category.name).all()
+    # GET: 显示所有分类。传给模板的是还没执行的查询，分类列表片段命中缓存时不会查库
+    expense_categories = Category.query.filter_by(owner=current_user, type='expense').order_by(Category.name)
+    income_categories = Category.query.filter_by(owner=current_user, type='income').order_by(Category.name)
 
     return render_template('categories.html',
                            title='分类管理',
@@ -401,8 +763,7 @@ def edit_category(id):
         ).first()
        
         if not exists:
-            category.name = new_name
-            db.session.commit()
+            write_queue.run_write(lambda session: setattr(session.get(Category, id), 'name', new_name))
             flash('分类已更新。', 'success')
         else:
             flash('同名分类已存在。', 'warning')
@@ -426,8 +787,7 @@ def delete_category(id):
         flash('无法删除：该分类已设置预算。', 'danger')
         return redirect(url_for('main.categories'))
 
-    db.session.delete(category)
-    db.session.commit()
+    write_queue.run_write(lambda session: session.delete(session.get(Category, id)))
     flash('分类已删除。', 'success')
     return redirect(url_for('main.categories'))
 
@@ -435,6 +795,7 @@ def delete_category(id):
 # --- 5. 预算管理 ---
 @bp.route('/budget', methods=['GET', 'POST'])
 @login_required
+@read_replica
 def budget():
     """预算管理页面，支持为各分类和总支出设置预算"""
     # 预算总是基于 年/月 设置
@@ -453,31 +814,37 @@ def budget():
     if form.validate_on_submit():
         category_id = form.category.data.id if form.category.data else None
        
-        # 查找是否已存在该预算 (UPSERT 逻辑)
-        existing_budget = Budget.query.filter_by(
-            user_id=current_user.id,
-            year=year,
-            month=month,
-            category_id=category_id
-        ).first()
-       
-        if existing_budget:
-            # 更新
-            existing_budget.amount = form.amount.data
-            flash('预算已更新。', 'info')
-        else:
+        amount = form.amount.data
+        user_id = current_user.id
+
+        def upsert(session):
+            # 查找是否已存在该预算 (UPSERT 逻辑)
+            existing_budget = session.query(Budget).filter_by(
+                user_id=user_id,
+                year=year,
+                month=month,
+                category_id=category_id
+            ).first()
+
+            if existing_budget:
+                # 更新
+                existing_budget.amount = amount
+                return False
             # 创建
-            new_budget = Budget(
-                amount=form.amount.data,
+            session.add(Budget(
+                amount=amount,
                 year=year,
                 month=month,
-                user_id=current_user.id,
+                user_id=user_id,
                 category_id=category_id
-            )
-            db.session.add(new_budget)
+            ))
+            return True
+
+        if write_queue.run_write(upsert):
             flash('预算已设置。', 'success')
-           
-        db.session.commit()
+        else:
+            flash('预算已更新。', 'info')
+
         return redirect(url_for('main.budget', year=year, month=month))
        
     # GET: 显示当前选定月份的所有已设预算
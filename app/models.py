@@ -3,6 +3,8 @@ from app import db, login_manager, bcrypt
 from flask_login import UserMixin
 from datetime import datetime
 from sqlalchemy import func
+from sqlalchemy.ext.hybrid import hybrid_property
+from app.money import to_cents, from_cents
 
 # Flask-Login 需要的回调函数，用于从 session 重新加载用户对象
 @login_manager.user_loader
@@ -29,6 +31,8 @@ class User(db.Model, UserMixin):
         return f'<User {self.username}>'
 
 class Category(db.Model):
+    __sharded__ = True  # 启用分片时按 user_id 存放在对应的分片库中
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     type = db.Column(db.String(10), nullable=False, default='expense')
@@ -42,17 +46,34 @@ class Category(db.Model):
 
     # 帮助函数：获取本分类在某月的总花费
     def get_spent_in_month(self, year, month):
-        total = db.session.query(func.sum(Transaction.amount)).filter(
+        total = db.session.query(func.sum(Transaction.amount_cents)).filter(
             Transaction.category_id == self.id,
             Transaction.type == 'expense',
             func.extract('year', Transaction.date) == year,
             func.extract('month', Transaction.date) == month
         ).scalar()
-        return total or 0.0
+        return from_cents(total or 0)
+
+class MoneyMixin:
+    """金额以整数分存储在 amount_cents，amount 是以元为单位的读写属性（见 app/money.py）"""
+    amount_cents = db.Column(db.BigInteger, nullable=False)
+
+    @hybrid_property
+    def amount(self):
+        return from_cents(self.amount_cents)
+
+    @amount.setter
+    def amount(self, value):
+        self.amount_cents = to_cents(value)
+
+    @amount.expression
+    def amount(cls):
+        return cls.amount_cents / 100.0
+
+class Transaction(MoneyMixin, db.Model):
+    __sharded__ = True
 
-class Transaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    amount = db.Column(db.Float, nullable=False)
     type = db.Column(db.String(10), nullable=False, default='expense')
     date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     memo = db.Column(db.String(200))
@@ -60,12 +81,16 @@ class Transaction(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
 
+    # 仪表盘、图表、趋势的查询都是 "某用户 + 日期区间"，用复合索引做范围扫描
+    __table_args__ = (db.Index('ix_transaction_user_date', 'user_id', 'date'),)
+
     def __repr__(self):
         return f'<Transaction {self.id} - {self.amount}>'
 
-class Budget(db.Model):
+class Budget(MoneyMixin, db.Model):
+    __sharded__ = True
+
     id = db.Column(db.Integer, primary_key=True)
-    amount = db.Column(db.Float, nullable=False)
     year = db.Column(db.Integer, nullable=False, index=True)
     month = db.Column(db.Integer, nullable=False, index=True)
    
@@ -76,4 +101,101 @@ class Budget(db.Model):
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=True)
 
     def __repr__(self):
-        return f'<Budget {self.year}-{self.month} - {self.amount}>'
\ No newline at end of file
+        return f'<Budget {self.year}-{self.month} - {self.amount}>'
+
+class BalanceCheckpoint(db.Model):
+    """
+    每个用户每个月末的累计结余（该月及以前全部收入 - 支出，单位：分），与交易放在同一个分片。
+    period = 年 * 12 + 月 - 1；period = -1 的行是“已初始化”标记，没有它说明检查点还不完整。
+    交易每次增删改都在同一次 flush 中更新，见 app/ledger.py。
+    """
+    __sharded__ = True
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    period = db.Column(db.Integer, primary_key=True)
+    balance_cents = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<BalanceCheckpoint {self.user_id}@{self.period} {self.balance_cents}>'
+
+class ShardDirectory(db.Model):
+    """用户 → 分片 目录，位于中心库（仅在启用分片时使用）"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    shard = db.Column(db.Integer, nullable=False, index=True)
+    # 在线迁移期间为 True，此时该用户的写请求会被拒绝
+    moving = db.Column(db.Boolean, nullable=False, default=False)
+
+    def __repr__(self):
+        return f'<ShardDirectory {self.user_id} -> {self.shard}>'
+
+
+class DataVersion(db.Model):
+    """
+    每个用户账本数据（交易/分类/预算）的版本号，与交易放在同一个分片。
+    数据每次变化都会在同一次 flush 中加一，页面片段缓存以它作为键的一部分。
+    """
+    __sharded__ = True
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DataVersion {self.user_id} v{self.version}>'
+
+
+class YearVersion(db.Model):
+    """
+    每个用户每一年交易的版本号，与交易放在同一个分片。
+    只有日期落在该年的交易（新旧日期任一）有增删改时才加一，已经结束的年份据此长期缓存；
+    year 为 0 的一行在改动涉及的年份不确定（批量 SQL、旧日期未加载）时加一，所有年份一起失效。
+    """
+    __sharded__ = True
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<YearVersion {self.user_id} {self.year} v{self.version}>'
+
+
+class Job(db.Model):
+    """后台任务记录（导出、导入、清空账本等耗时操作），位于中心库"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    kind = db.Column(db.String(32), nullable=False)
+    # queued -> running -> done / failed
+    status = db.Column(db.String(16), nullable=False, default='queued', index=True)
+    progress = db.Column(db.Float, nullable=False, default=0.0)  # 0 ~ 1
+    message = db.Column(db.String(200))
+    params = db.Column(db.JSON)
+    # 输入/输出可能有几 MB，默认不加载：任务列表和状态轮询只用到 has_result
+    payload = db.deferred(db.Column(db.LargeBinary))  # 任务输入，例如上传的 CSV 文件
+    result = db.deferred(db.Column(db.LargeBinary))   # 任务输出，例如导出的 CSV 文件
+    has_result = db.column_property(result.columns[0].isnot(None))
+    result_name = db.Column(db.String(200))
+    result_mimetype = db.Column(db.String(100))
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': round(self.progress, 4),
+            'message': self.message,
+            'error': self.error,
+            'has_result': self.has_result,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
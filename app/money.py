@@ -0,0 +1,102 @@
+# app/money.py
+"""
+金额以整数“分”存储。
+
+交易和预算的金额列是 amount_cents（整数），模型上的 amount 是换算成元的属性：
+    - 赋值时（表单的 Decimal、CSV 的字符串、代码里的 float 都可以）按四舍五入换算成分
+    - 读取时返回 float，模板里照常 "%.2f"|format(t.amount)
+    - 查询里的 func.sum 一律对 amount_cents 求和，得到精确的整数，最后用 from_cents() 换算，
+      不会再出现 0.30000000000000004 这样的合计
+
+旧版数据库里是浮点的 amount 列，启动时由 upgrade_schema() 就地改成 amount_cents。
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+import sqlalchemy as sa
+
+from app.session import shard_bind_key
+
+_ONE = Decimal(1)
+
+# 单笔金额（元）的上限：表单据此校验。金额列是 BIGINT 分，上限 9.2e18 分，
+# 留出余量让几百万笔的合计也不会溢出
+MAX_AMOUNT = Decimal('9999999999.99')
+
+
+def to_cents(value):
+    """元 -> 分（四舍五入）；None 原样返回，NaN / 无穷大抛出 ValueError"""
+    if value is None:
+        return None
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value * 100
+    # float 先转成最短的十进制表示，1.005 按 “1.005” 而不是 1.00499999... 舍入
+    amount = Decimal(str(value))
+    if not amount.is_finite():
+        raise ValueError(f'金额必须是有限的数字：{value!r}')
+    return int((amount * 100).quantize(_ONE, rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    """分 -> 元（float）；None 原样返回"""
+    if cents is None:
+        return None
+    return int(cents) / 100
+
+
+# --- 旧数据迁移 ---
+
+# 表 -> (旧的浮点列, 新的整数列)
+_MONEY_COLUMNS = {'transaction': ('amount', 'amount_cents'), 'budget': ('amount', 'amount_cents')}
+
+
+def _upgrade_engine(engine):
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+
+    with engine.begin() as conn:
+        inspector = sa.inspect(conn)
+        tables = set(inspector.get_table_names())
+        ops = Operations(MigrationContext.configure(conn))
+        upgraded = []
+        for table, (old, new) in _MONEY_COLUMNS.items():
+            if table not in tables:
+                continue
+            columns = {c['name'] for c in inspector.get_columns(table)}
+            if old not in columns or new in columns:
+                continue
+            ops.add_column(table, sa.Column(new, sa.BigInteger, nullable=False, server_default='0'))
+            # 在 Python 里按 to_cents() 换算：SQL 的 ROUND(amount * 100) 舍入的是二进制浮点数，
+            # 1.005 会变成 100 分，而现在写入同样的金额是 101 分
+            rows = conn.execute(sa.text(f'SELECT id, {old} FROM "{table}"')).all()
+            if rows:
+                conn.execute(sa.text(f'UPDATE "{table}" SET {new} = :cents WHERE id = :id'),
+                             [{'id': id_, 'cents': to_cents(amount)} for id_, amount in rows])
+            # SQLite 不支持直接删列/改约束，batch 模式会重建整张表
+            with ops.batch_alter_table(table) as batch:
+                batch.drop_column(old)
+                batch.alter_column(new, server_default=None)
+            upgraded.append(table)
+        # 余额检查点是派生数据：旧版的浮点余额直接丢掉，由 create_all 重建空表，下次改动交易时重新生成
+        if 'balance_checkpoint' in tables and \
+                'balance' in {c['name'] for c in inspector.get_columns('balance_checkpoint')}:
+            ops.drop_table('balance_checkpoint')
+            upgraded.append('balance_checkpoint')
+    return upgraded
+
+
+def upgrade_schema(db):
+    """
+    把中心库和各分片库中旧版的浮点金额列改成整数分（在 create_all 之前调用）。
+    已经是新结构的库什么也不做，可以每次启动都执行。
+    """
+    engines = [db.engine]
+    n = 0
+    while shard_bind_key(n) in db.engines:
+        engines.append(db.engines[shard_bind_key(n)])
+        n += 1
+    upgraded = {}
+    for engine in engines:
+        tables = _upgrade_engine(engine)
+        if tables:
+            upgraded[str(engine.url)] = tables
+    return upgraded
@@ -0,0 +1,163 @@
+# app/querybudget.py
+"""
+查询时间预算：给开销可能很大的端点设一个时间上限，超时的查询直接中止。
+
+例如在很大的账本上用一两个字的关键词、不限日期地查找，一条查询就能占住 worker 好几秒。
+QUERY_BUDGETS 中列出的端点从请求开始计时，超出预算后：
+
+    - SQLite：连接上注册了 progress handler，每执行 _SQLITE_PROGRESS_STEPS 条虚拟机指令
+      检查一次，超时则让 SQLite 中断当前语句
+    - PostgreSQL / MySQL：每条语句执行前把剩余时间设为 statement_timeout / max_execution_time，
+      由数据库自己取消
+    - 预算已经用完时，之后的语句不再发出
+
+被中止的查询统一变成 QueryBudgetExceeded，页面请求返回“请缩小查找范围”的提示页，
+AJAX / 接口请求返回 JSON，状态码都是 503；每次中止都记录在 query_budget.exceeded（按端点计数）
+和应用日志中。请求之外也可以临时设预算：
+
+    with query_budget.limit(30, 'export'):
+        ...
+
+    query_budget = QueryBudget()
+    query_budget.init_app(app)
+"""
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from flask import current_app, jsonify, render_template, request
+
+# SQLite 每执行这么多条虚拟机指令调用一次 progress handler（约几十微秒）
+_SQLITE_PROGRESS_STEPS = 1000
+
+# 各后端设置单条语句超时(毫秒)的语句，0 表示不限
+_STATEMENT_TIMEOUT_SQL = {
+    'postgresql': 'SET statement_timeout = %d',
+    'mysql': 'SET SESSION max_execution_time = %d',
+}
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(Exception):
+    """查询超出时间预算被中止"""
+
+    def __init__(self, label, seconds):
+        super().__init__(f'{label} 的查询超出了 {seconds} 秒的时间预算，已中止')
+        self.label = label
+        self.seconds = seconds
+
+
+class _Budget:
+    __slots__ = ('label', 'seconds', 'deadline', 'owner')
+
+    def __init__(self, label, seconds, deadline, owner):
+        self.label = label
+        self.seconds = seconds
+        self.deadline = deadline
+        self.owner = owner
+
+
+def _current():
+    return getattr(_local, 'budget', None)
+
+
+def _sqlite_progress():
+    # 返回非 0 时 SQLite 中断当前语句（sqlite3.OperationalError: interrupted）
+    budget = getattr(_local, 'budget', None)
+    return budget is not None and time.monotonic() >= budget.deadline
+
+
+def _on_connect(dbapi_connection, connection_record):
+    if hasattr(dbapi_connection, 'set_progress_handler'):
+        dbapi_connection.set_progress_handler(_sqlite_progress, _SQLITE_PROGRESS_STEPS)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    budget = _current()
+    remaining = None if budget is None else budget.deadline - time.monotonic()
+    if remaining is not None and remaining <= 0:
+        raise budget.owner.record(budget, statement)
+    sql = _STATEMENT_TIMEOUT_SQL.get(conn.dialect.name)
+    if sql is None:
+        return
+    # 有预算时每条语句都重新设置（SET 可能随事务回滚失效）；预算结束后恢复一次不限
+    if remaining is not None:
+        cursor.execute(sql % max(1, int(remaining * 1000)))
+        conn.info['query_budget_timeout'] = True
+    elif conn.info.pop('query_budget_timeout', False):
+        cursor.execute(sql % 0)
+
+
+def _on_error(context):
+    budget = _current()
+    if budget is None or isinstance(context.original_exception, QueryBudgetExceeded):
+        return None
+    if time.monotonic() >= budget.deadline:
+        return budget.owner.record(budget, context.statement)
+    return None
+
+
+class QueryBudget:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 统计：各端点（或 limit() 的名称）被中止的查询数
+        self.exceeded = Counter()
+
+    def init_app(self, app):
+        app.config.setdefault('QUERY_BUDGET_ENABLED', True)
+        app.config.setdefault('QUERY_BUDGETS', {})
+        app.extensions['query_budget'] = self
+        app.before_request(self._start_request)
+        app.teardown_request(self._end_request)
+        app.register_error_handler(QueryBudgetExceeded, self._handle_exceeded)
+        for name, fn in (('connect', _on_connect),
+                         ('before_cursor_execute', _before_cursor_execute),
+                         ('handle_error', _on_error)):
+            if not sa.event.contains(sa.engine.Engine, name, fn):
+                sa.event.listen(sa.engine.Engine, name, fn)
+
+    @contextmanager
+    def limit(self, seconds, label='query'):
+        """在 with 块内给当前线程的查询设预算；嵌套时取更早的截止时间"""
+        previous = _current()
+        deadline = time.monotonic() + seconds
+        if previous is not None and previous.deadline < deadline:
+            budget = previous
+        else:
+            budget = _Budget(label, seconds, deadline, self)
+        _local.budget = budget
+        try:
+            yield budget
+        finally:
+            _local.budget = previous
+
+    def record(self, budget, statement):
+        """记录一次中止，返回要抛出的异常"""
+        with self._lock:
+            self.exceeded[budget.label] += 1
+        current_app.logger.warning('查询超出时间预算 (%s, %s 秒)，已中止：%s',
+                                   budget.label, budget.seconds, ' '.join((statement or '').split())[:200])
+        return QueryBudgetExceeded(budget.label, budget.seconds)
+
+    def _start_request(self):
+        config = current_app.config
+        if not config['QUERY_BUDGET_ENABLED']:
+            return
+        seconds = config['QUERY_BUDGETS'].get(request.endpoint)
+        if seconds is not None:
+            _local.budget = _Budget(request.endpoint, seconds, time.monotonic() + seconds, self)
+
+    def _end_request(self, exc=None):
+        _local.budget = None
+
+    def _handle_exceeded(self, error):
+        # 取消预算，提示页（比如 _base.html 里的当前用户）还需要查询
+        _local.budget = None
+        message = '查询耗时太长，已被中止。请缩小查找范围后重试，例如限定日期区间、选择分类或使用更具体的关键词。'
+        if request.path.startswith('/api/') or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({'error': message}), 503
+        return render_template('query_budget.html', title='查询超时', message=message, error=error), 503
@@ -0,0 +1,318 @@
+# app/rangesum.py
+"""
+按日前缀和索引：O(log n) 回答 “某用户在 A~B 日期之间的收入/支出合计”。
+
+每个用户一份索引，按 (类型, 分类) 和 (类型, 全部分类) 各维护一棵以天为下标的树状数组，
+数组中存的是整数分（float64 在 2^53 以内表示整数是精确的），返回时再换算成元。
+    - 第一次查询时用一条按日 GROUP BY 的查询构建，记下构建时的数据版本号（见 app/caching.py）
+    - 本进程提交的交易增删改在 after_commit 中直接增量更新，版本号随之加上本事务的 flush 次数
+    - 查询前比较版本号：别的进程写入、批量 SQL、回滚等任何对不上的情况都会丢弃索引重新构建，
+      所以索引只会慢、不会错
+    - 按最近使用淘汰，闲置超过 RANGESUM_IDLE_TIMEOUT 秒或超过 RANGESUM_MAX_USERS 个用户时释放内存
+
+只适用于纯日期/分类条件（首页的当月收支合计、分类预算的已支出金额）；带关键词、金额区间的合计仍然走 SQL。交易查找页面每次都要按分类、月份
+做分面统计，那条查询本来就要读遍匹配的交易，合计直接由分面相加，不使用本索引。
+"""
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import date, datetime
+
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+
+from app.caching import changed_owner_ids, data_version
+from app.money import from_cents
+from app.session import RoutingSession
+
+TYPES = ('income', 'expense')
+# 构建时在最后一笔交易（或今天）之后预留的天数，新记账不会马上超出范围触发重建
+SPARE_DAYS = 366
+
+
+class Fenwick:
+    """树状数组：单点增加、前缀求和都是 O(log n)"""
+    __slots__ = ('tree',)
+
+    def __init__(self, values):
+        n = len(values)
+        tree = array('d', [0.0]) + array('d', values)  # 下标从 1 开始
+        for i in range(1, n + 1):
+            j = i + (i & -i)
+            if j <= n:
+                tree[j] += tree[i]
+        self.tree = tree
+
+    def add(self, i, delta):
+        tree = self.tree
+        i += 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i):
+        """前 i 个元素（下标 0..i-1）之和"""
+        tree = self.tree
+        total = 0.0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def range_sum(self, lo, hi):
+        """下标 [lo, hi) 之和"""
+        return self.prefix(hi) - self.prefix(lo)
+
+
+def _as_day(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)  # SQLite 的 date() 返回字符串
+
+
+class UserIndex:
+    """单个用户的索引，覆盖 [origin, origin + size) 这些天"""
+
+    def __init__(self, version, origin, size, daily):
+        self.version = version
+        self.origin = origin
+        self.size = size
+        self.last_used = time.monotonic()
+        self.series = {}
+        for key, by_offset in daily.items():
+            values = [0.0] * size
+            for offset, total in by_offset.items():
+                values[offset] += total
+            self.series[key] = Fenwick(values)
+
+    def add(self, type_, category_id, day, amount):
+        """增量更新，日期超出覆盖范围时返回 False（需要重建）"""
+        offset = (day - self.origin).days
+        if not 0 <= offset < self.size:
+            return False
+        for key in ((type_, None), (type_, category_id)):
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = Fenwick([0.0] * self.size)
+            series.add(offset, amount)
+        return True
+
+    def totals_cents(self, start=None, end=None, category_id=None):
+        """[start, end] 两端都包含，None 表示不限；返回整数分"""
+        lo = 0 if start is None else min(max((start - self.origin).days, 0), self.size)
+        hi = self.size if end is None else min(max((end - self.origin).days + 1, 0), self.size)
+        result = {}
+        for type_ in TYPES:
+            series = self.series.get((type_, category_id))
+            result[type_] = round(series.range_sum(lo, hi)) if series is not None and lo < hi else 0
+        return result
+
+
+class _Store:
+    """每个应用一份：user_id -> UserIndex，按最近使用淘汰"""
+
+    def __init__(self, max_users, idle_timeout):
+        self.max_users = max_users
+        self.idle_timeout = idle_timeout
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _evict(self, now):
+        while len(self.indexes) > self.max_users:
+            self.indexes.popitem(last=False)
+        while self.indexes:
+            user_id, index = next(iter(self.indexes.items()))
+            if now - index.last_used <= self.idle_timeout:
+                break
+            del self.indexes[user_id]
+
+    def put(self, user_id, index):
+        with self.lock:
+            self.indexes[user_id] = index
+            self.indexes.move_to_end(user_id)
+            self._evict(time.monotonic())
+
+    def totals_cents(self, user_id, version, start, end, category_id):
+        """版本号对得上时直接回答，否则返回 None"""
+        now = time.monotonic()
+        with self.lock:
+            self._evict(now)
+            index = self.indexes.get(user_id)
+            if index is None or index.version != version:
+                return None
+            index.last_used = now
+            self.indexes.move_to_end(user_id)
+            return index.totals_cents(start, end, category_id)
+
+    def apply(self, user_id, bumps, deltas):
+        with self.lock:
+            index = self.indexes.get(user_id)
+            if index is None:
+                return
+            for type_, category_id, day, amount in deltas:
+                if not index.add(type_, category_id, day, amount):
+                    del self.indexes[user_id]
+                    return
+            index.version += bumps
+
+    def discard(self, user_id):
+        with self.lock:
+            self.indexes.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.indexes.clear()
+
+    def __len__(self):
+        return len(self.indexes)
+
+
+# --- 增量更新：flush 时记下变化，提交后应用到索引 ---
+
+_PENDING = 'rangesum_pending'
+_INVALID = 'rangesum_invalid'
+_FIELDS = ('user_id', 'type', 'category_id', 'date', 'amount_cents')
+
+
+def committed_values(obj, fields=_FIELDS):
+    """flush 前（数据库中）的值；属性没有加载时返回 None，此时只能让索引失效"""
+    state = sa.inspect(obj)
+    values = []
+    for name in fields:
+        if name not in state.dict:
+            return None
+        history = state.attrs[name].history
+        if history.deleted:
+            values.append(history.deleted[0])
+        elif history.unchanged:
+            values.append(history.unchanged[0])
+        else:
+            return None  # 属性过期后直接赋值，旧值从未加载
+    return values
+
+
+def _collect_on_flush(session, flush_context):
+    from app.models import Transaction
+    # 未启用时不记录；之后再启用，版本号对不上，旧索引会被重建
+    if not has_app_context() or not current_app.config.get('RANGESUM_ENABLED'):
+        return
+    pending = session.info.setdefault(_PENDING, {})
+    invalid = session.info.setdefault(_INVALID, set())
+
+    def record(user_id, type_, category_id, day, cents):
+        pending.setdefault(user_id, [0, []])[1].append((type_, category_id, _as_day(day), cents))
+
+    for obj in session.new:
+        if isinstance(obj, Transaction):
+            record(obj.user_id, obj.type, obj.category_id, obj.date, obj.amount_cents)
+    for obj in list(session.deleted) + list(session.dirty):
+        if not isinstance(obj, Transaction) or (obj in session.dirty and not session.is_modified(obj)):
+            continue
+        old = committed_values(obj)
+        if old is None:
+            invalid.add(sa.inspect(obj).dict.get('user_id'))  # 连用户都不知道时为 None，清空全部索引
+            continue
+        user_id, type_, category_id, day, cents = old
+        record(user_id, type_, category_id, day, -cents)
+        if obj in session.dirty:
+            record(obj.user_id, obj.type, obj.category_id, obj.date, obj.amount_cents)
+
+    # 与 _bump_on_flush 一致：每个有改动的用户本次 flush 版本号加一
+    for user_id in changed_owner_ids(session):
+        pending.setdefault(user_id, [0, []])[0] += 1
+
+
+def _apply_on_commit(session):
+    pending = session.info.pop(_PENDING, None)
+    invalid = session.info.pop(_INVALID, set())
+    if not pending and not invalid:
+        return
+    if not has_app_context() or 'range_index' not in current_app.extensions:
+        return
+    store = current_app.extensions['range_index']
+    if None in invalid:
+        store.clear()
+    for user_id in invalid:
+        store.discard(user_id)
+    for user_id, (bumps, deltas) in (pending or {}).items():
+        if user_id not in invalid:
+            store.apply(user_id, bumps, deltas)
+
+
+def _invalidate_on_rollback(session, previous_transaction):
+    # 回滚（包括 SAVEPOINT）后已记下的变化不一定真的提交了，涉及的用户一律重建
+    pending = session.info.pop(_PENDING, None)
+    if pending:
+        session.info.setdefault(_INVALID, set()).update(pending)
+
+
+class RangeSumIndex:
+    """
+    日期区间合计索引扩展：
+
+        range_index = RangeSumIndex(db)
+        range_index.init_app(app)
+        range_index.totals(user_id, start, end, category_id)        # -> {'income': 元, 'expense': 元}
+        range_index.totals_cents(user_id, start, end, category_id)  # 同上，整数分
+
+首页仪表盘的当月收支合计和各分类预算的已支出金额由本索引回答（见 app/main/routes.py）。
+    """
+
+    def __init__(self, db=None):
+        self.db = db
+
+    def init_app(self, app):
+        app.config.setdefault('RANGESUM_ENABLED', True)
+        app.config.setdefault('RANGESUM_MAX_USERS', 256)
+        app.config.setdefault('RANGESUM_IDLE_TIMEOUT', 1800)
+        app.extensions['range_index'] = _Store(app.config['RANGESUM_MAX_USERS'],
+                                               app.config['RANGESUM_IDLE_TIMEOUT'])
+        for name, fn in (('after_flush', _collect_on_flush),
+                         ('after_commit', _apply_on_commit),
+                         ('after_soft_rollback', _invalidate_on_rollback)):
+            if not sa.event.contains(RoutingSession, name, fn):
+                sa.event.listen(RoutingSession, name, fn)
+
+    def totals_cents(self, user_id, start=None, end=None, category_id=None):
+        """start/end 为 date（两端包含，None 不限）；未启用时返回 None，调用方应改用 SQL"""
+        if not current_app.config['RANGESUM_ENABLED']:
+            return None
+        store = current_app.extensions['range_index']
+        version = data_version(self.db.session, user_id)
+        result = store.totals_cents(user_id, version, start, end, category_id)
+        if result is None:
+            index = self.build(user_id, version)
+            store.put(user_id, index)
+            result = index.totals_cents(start, end, category_id)
+        return result
+
+    def totals(self, user_id, start=None, end=None, category_id=None):
+        """同 totals_cents，金额换算成元"""
+        result = self.totals_cents(user_id, start, end, category_id)
+        return None if result is None else {type_: from_cents(cents) for type_, cents in result.items()}
+
+    def build(self, user_id, version):
+        from app.models import Transaction
+        day_col = sa.func.date(Transaction.date).label('day')
+        rows = self.db.session.query(
+            Transaction.type, Transaction.category_id, day_col, sa.func.sum(Transaction.amount_cents)
+        ).filter(Transaction.user_id == user_id).group_by(
+            Transaction.type, Transaction.category_id, day_col
+        ).all()
+
+        rows = [(type_, category_id, _as_day(day), float(total)) for type_, category_id, day, total in rows]
+        today = date.today()
+        origin = min((day for _, _, day, _ in rows), default=today)
+        last = max([today] + [day for _, _, day, _ in rows])
+        size = (last - origin).days + 1 + SPARE_DAYS
+
+        daily = {}
+        for type_, category_id, day, total in rows:
+            offset = (day - origin).days
+            for key in ((type_, None), (type_, category_id)):
+                by_offset = daily.setdefault(key, {})
+                by_offset[offset] = by_offset.get(offset, 0.0) + total
+        return UserIndex(version, origin, size, daily)
@@ -0,0 +1,101 @@
+# app/readmodels.py
+"""
+只读列表用的轻量行对象。
+
+首页的最近交易、交易查找和流水账的分页结果只用来渲染表格，不需要完整的 ORM 对象：
+加载 Transaction 实例要登记到 session 的 identity map、记录属性状态，模板里的
+t.category.name 还会为每个分类再懒加载一次 Category。这里只按列查询
+(id, 日期, 金额（分）, 类型, 备注, 分类名)，分类名在同一条 SQL 里 JOIN 出来，
+每行装进一个不带 __dict__ 的 namedtuple。
+
+    rows = fetch_rows(db.session, transaction_select(Transaction.user_id == user_id).limit(5))
+    page = paginate_rows(db.session, transaction_select(*conditions).order_by(...), page=2)
+
+行对象与 session 无关，不会过期，也不能用来修改数据；需要修改时仍按 id 加载 ORM 对象。
+"""
+from collections import namedtuple
+
+import sqlalchemy as sa
+from flask_sqlalchemy.pagination import Pagination
+
+from app.money import from_cents
+
+
+class TransactionRow(namedtuple('TransactionRow', 'id date amount_cents type memo category_name')):
+    __slots__ = ()
+
+    @property
+    def amount(self):
+        return from_cents(self.amount_cents)
+
+
+def transaction_select(*conditions):
+    """TransactionRow 各列的查询，可以继续 order_by / limit"""
+    from app.models import Category, Transaction
+    return sa.select(
+        Transaction.id, Transaction.date, Transaction.amount_cents, Transaction.type, Transaction.memo,
+        Category.name
+    ).join(Category, Transaction.category_id == Category.id).where(*conditions)
+
+
+def fetch_rows(session, stmt, params=None):
+    """
+    执行 transaction_select() 构造的查询。
+    直接在 session 的连接上执行，结果不经过 ORM 装载，也不进入 identity map；
+    连接按 Transaction 选取，分片与只读副本的路由照常生效。
+    """
+    from app.models import Transaction
+    connection = session.connection(bind_arguments={'mapper': Transaction})
+    return list(map(TransactionRow._make, connection.execute(stmt, params)))
+
+
+class RowPagination(Pagination):
+    """
+    与 Query.paginate() 的结果用法相同（items / pages / iter_pages ...），items 是 TransactionRow。
+    也可以传入预先构造好的语句（见 app/statements.py）：select 中的 LIMIT / OFFSET 是名为
+    limit、offset 的 bindparam，count_select 是对应的计数语句，其余参数放在 params 中。
+    """
+
+    def _query_items(self):
+        stmt, params = self._query_args['select'], self._query_args['params']
+        if params is None:
+            return fetch_rows(self._query_args['session'], stmt.limit(self.per_page).offset(self._query_offset))
+        return fetch_rows(self._query_args['session'], stmt, dict(params, limit=self.per_page, offset=self._query_offset))
+
+    def _query_count(self):
+        from app.models import Transaction
+        stmt, params = self._query_args['count_select'], self._query_args['params']
+        if stmt is None:
+            sub = self._query_args['select'].order_by(None).subquery()
+            stmt = sa.select(sa.func.count()).select_from(sub)
+        connection = self._query_args['session'].connection(bind_arguments={'mapper': Transaction})
+        return connection.execute(stmt, params).scalar()
+
+
+def paginate_rows(session, stmt, page=None, per_page=None, count_select=None, params=None):
+    return RowPagination(page=page, per_page=per_page, select=stmt, session=session,
+                         count_select=count_select, params=params)
+
+
+class IdPagination(Pagination):
+    """
+    在已经排好序的 id 列表上分页（见 app/searchcache.py）：总数就是列表长度，
+    每页只按主键取本页的几行。select 中按 id 过滤的是名为 ids 的 expanding bindparam。
+    """
+
+    def _query_items(self):
+        ids = list(self._query_args['ids'][self._query_offset:self._query_offset + self.per_page])
+        if not ids:
+            return []
+        rows = fetch_rows(self._query_args['session'], self._query_args['select'], dict(self._query_args['params'], ids=ids))
+        by_id = {row.id: row for row in rows}
+        # 快照之后被删掉的交易直接跳过
+        return [by_id[i] for i in ids if i in by_id]
+
+    def _query_count(self):
+        return len(self._query_args['ids'])
+
+
+def paginate_ids(session, stmt, ids, page=None, per_page=None, params=None):
+    return IdPagination(page=page, per_page=per_page, select=stmt, session=session, ids=ids, params=params or {})
+
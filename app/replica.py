@@ -0,0 +1,121 @@
+# app/replica.py
+"""
+读写分离：只读视图走只读副本，写入始终走主库。
+
+配置 READ_REPLICA_DATABASE_URI 后会注册名为 'replica' 的 bind。被 @read_replica 装饰的
+视图在 GET/HEAD 请求中把 db.session.info['read_only'] 置为 True，RoutingSession 会把
+主库上的查询改发到副本（分片表不受影响，仍然走各自的分片）。
+
+用户自己提交写请求后的 READ_YOUR_WRITES_SECONDS 秒内（记录在 Flask session 中，
+多个 worker 之间同样有效），该用户的读请求继续走主库，保证能看到自己刚写入的数据。
+
+本地开发时副本是另一个 SQLite 文件，通过 SQLite 在线备份 API 从主库同步：
+启动时同步一次，之后可以用 `flask replica sync` 手动同步，或者设置
+READ_REPLICA_SYNC_INTERVAL 让后台线程定期同步。
+"""
+import threading
+import time
+from functools import wraps
+
+import click
+from flask import current_app, request, session
+from flask.cli import AppGroup
+from flask_login import current_user
+
+from app.session import REPLICA_BIND_KEY
+
+replica_cli = AppGroup('replica', help='只读副本管理命令')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRouter:
+    """读写分离扩展。与 ShardRouter 一样，init_app 需要在 db.init_app 之前调用"""
+
+    def __init__(self, db=None):
+        self.db = db
+
+    def init_app(self, app):
+        app.config.setdefault('READ_REPLICA_DATABASE_URI', None)
+        app.config.setdefault('READ_YOUR_WRITES_SECONDS', 5)
+        app.config.setdefault('READ_REPLICA_SYNC_INTERVAL', 0)
+        app.extensions['replica_router'] = self
+        app.cli.add_command(replica_cli)
+
+        uri = app.config['READ_REPLICA_DATABASE_URI']
+        if not uri:
+            return
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds[REPLICA_BIND_KEY] = uri
+        app.config['SQLALCHEMY_BINDS'] = binds
+        app.after_request(self._remember_write)
+
+    @staticmethod
+    def enabled(app=None):
+        return bool((app or current_app).config['READ_REPLICA_DATABASE_URI'])
+
+    def start(self, app):
+        """建表之后调用：先做一次全量同步，再按需启动后台同步线程"""
+        if not self.enabled(app):
+            return
+        self.sync()
+        interval = app.config['READ_REPLICA_SYNC_INTERVAL']
+        if interval:
+            threading.Thread(target=self._sync_forever, args=(app, interval),
+                             name='ledger-replica-sync', daemon=True).start()
+
+    def sync(self):
+        """用 SQLite 在线备份 API 把主库完整复制到副本"""
+        primary = self.db.engines[None].raw_connection()
+        replica = self.db.engines[REPLICA_BIND_KEY].raw_connection()
+        try:
+            primary.driver_connection.backup(replica.driver_connection)
+        finally:
+            replica.close()
+            primary.close()
+
+    def _sync_forever(self, app, interval):
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    self.sync()
+                except Exception:
+                    app.logger.exception('同步只读副本失败')
+
+    def _remember_write(self, response):
+        # 用户自己的写请求成功后，一段时间内的读请求都走主库（read-your-writes）
+        if request.method not in SAFE_METHODS and response.status_code < 400 \
+                and current_user.is_authenticated:
+            session['_rw_until'] = time.time() + current_app.config['READ_YOUR_WRITES_SECONDS']
+        return response
+
+    def should_use_replica(self):
+        if not self.enabled() or request.method not in SAFE_METHODS:
+            return False
+        return session.get('_rw_until', 0) <= time.time()
+
+
+def read_replica(view):
+    """标记只读视图：GET/HEAD 请求中的查询发往只读副本"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        router = current_app.extensions['replica_router']
+        if not router.should_use_replica():
+            return view(*args, **kwargs)
+        router.db.session.info['read_only'] = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            router.db.session.info.pop('read_only', None)
+    return wrapper
+
+
+@replica_cli.command('sync')
+def replica_sync():
+    """立即把主库同步到只读副本"""
+    router = current_app.extensions['replica_router']
+    if not router.enabled():
+        raise click.ClickException('未配置只读副本 (READ_REPLICA_DATABASE_URI)')
+    router.sync()
+    click.echo('只读副本已同步。')
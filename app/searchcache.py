@@ -0,0 +1,80 @@
+# app/searchcache.py
+"""
+交易查找的结果快照。
+
+翻页时筛选条件不变，每一页却都要重新执行完整的筛选、计数和收支合计/分面统计。
+第一次查询时把结果存成一份快照：
+
+    - 按显示顺序排好的全部交易 id（array('q')，每个 8 字节）
+    - 与分页无关的汇总（合计、分面）
+
+之后的页直接从 id 列表切出本页的 20 个，按主键取这几行即可，总数就是列表长度。
+
+快照键是 (用户, 数据版本号, 筛选条件)：用户的交易、分类或预算有任何改动，版本号加一，
+旧快照自然不再命中（同 app/caching.py）；另外有较短的过期时间，闲置的快照很快被清掉。
+匹配的交易超过 SEARCH_CACHE_MAX_ROWS 时不做快照，仍按原来的方式逐页查询；这个结论同样按上面的键
+记下来，之后翻页不必每次再取一遍 id 才发现太多。快照占用的总字节数不超过 SEARCH_CACHE_MAX_BYTES。
+
+    search_cache = SearchCache(db)
+    search_cache.init_app(app)
+"""
+from array import array
+from collections import namedtuple
+
+from flask import current_app
+
+from app.caching import LRUCache, data_version
+
+SearchSnapshot = namedtuple('SearchSnapshot', 'ids summary')
+
+# 结果太多、不做快照的标记
+_TOO_LARGE = object()
+
+
+def _snapshot_bytes(snapshot):
+    if snapshot is _TOO_LARGE:
+        return 0
+    return snapshot.ids.itemsize * len(snapshot.ids)
+
+
+class SearchCache:
+
+    def __init__(self, db=None):
+        self.db = db
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_CACHE_ENABLED', True)
+        app.config.setdefault('SEARCH_CACHE_SIZE', 256)
+        app.config.setdefault('SEARCH_CACHE_TIMEOUT', 120)
+        app.config.setdefault('SEARCH_CACHE_MAX_ROWS', 50000)
+        app.config.setdefault('SEARCH_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+        app.extensions['search_cache'] = LRUCache(app.config['SEARCH_CACHE_SIZE'], app.config['SEARCH_CACHE_TIMEOUT'],
+                                                  maxweight=app.config['SEARCH_CACHE_MAX_BYTES'], weigh=_snapshot_bytes)
+
+    def snapshot(self, user_id, fingerprint, fetch_ids, summarize):
+        """
+        取 fingerprint（可哈希的筛选条件）对应的快照，没有时生成一份。
+        fetch_ids(limit) 返回最多 limit 个按显示顺序排列的 id；summarize() 返回与分页无关的汇总。
+        未启用或结果太多时返回 None。
+        """
+        config = current_app.config
+        if not config['SEARCH_CACHE_ENABLED']:
+            return None
+        cache = current_app.extensions['search_cache']
+        key = (user_id, data_version(self.db.session, user_id), fingerprint)
+        snapshot = cache.get(key)
+        if snapshot is _TOO_LARGE:
+            return None
+        if snapshot is not None:
+            return snapshot
+        max_rows = config['SEARCH_CACHE_MAX_ROWS']
+        ids = fetch_ids(max_rows + 1)
+        if len(ids) > max_rows:
+            cache.set(key, _TOO_LARGE)
+            return None
+        snapshot = SearchSnapshot(array('q', ids), summarize())
+        cache.set(key, snapshot)
+        return snapshot
+
+    def clear(self):
+        current_app.extensions['search_cache'].clear()
@@ -0,0 +1,64 @@
+# app/session.py
+"""
+带路由功能的数据库 session。
+
+Flask-SQLAlchemy 默认只按模型的 __bind_key__ 静态选择 engine。这里在此基础上
+根据 session.info 中的路由信息动态选择：
+    - info['shard']：当前用户所在的分片编号，标记了 __sharded__ 的模型会被路由到对应分片
+    - info['read_only']：只读视图中为 True，原本发往主库的查询改发到只读副本 (bind 'replica')，
+      flush 以及 UPDATE/DELETE/INSERT 语句不受影响，始终写主库
+"""
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from flask_sqlalchemy.session import Session
+
+# 写入通道等需要在别的线程里“重放”当前请求路由信息时，只复制这些键
+ROUTING_KEYS = ('shard',)
+
+REPLICA_BIND_KEY = 'replica'
+
+
+def shard_bind_key(shard):
+    return f'shard_{shard}'
+
+
+def is_sharded(mapper):
+    return mapper is not None and getattr(sa.inspect(mapper).class_, '__sharded__', False)
+
+
+class RoutingSession(Session):
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._db.engines.get(shard_bind_key(0)) is not None and is_sharded(mapper):
+            shard = self.info.get('shard')
+            if shard is None:
+                # 分片模式下访问分片表却不知道用户在哪个分片，宁可报错也不要悄悄读写中心库
+                raise RuntimeError(f'未指定分片，无法访问 {sa.inspect(mapper).class_.__name__}')
+            return self._db.engines[shard_bind_key(shard)]
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if self.info.get('read_only') and bind is None and not self._flushing \
+                and not isinstance(clause, sa.sql.expression.UpdateBase) \
+                and engine is self._db.engines.get(None):
+            return self._db.engines.get(REPLICA_BIND_KEY, engine)
+        return engine
+
+
+def routing_state(session):
+    """取出 session 当前的路由信息（普通 dict，可跨线程传递）"""
+    return {key: session.info[key] for key in ROUTING_KEYS if key in session.info}
+
+
+@contextmanager
+def use_routing(session, state):
+    """在 with 块内临时使用给定的路由信息，退出时恢复原值"""
+    saved = routing_state(session)
+    for key in ROUTING_KEYS:
+        session.info.pop(key, None)
+    session.info.update(state)
+    try:
+        yield session
+    finally:
+        for key in ROUTING_KEYS:
+            session.info.pop(key, None)
+        session.info.update(saved)
@@ -0,0 +1,283 @@
+# app/sharding.py
+"""
+按用户分片：把 Transaction / Category / Budget（以及随之更新的余额检查点、数据版本号）
+分散到多个 SQLite 文件中。
+
+User 与 用户→分片 目录表 (ShardDirectory) 留在中心库；每个请求开始时根据当前用户
+查目录，把分片编号写入 db.session.info['shard']，由 RoutingSession 完成实际路由，
+因此现有路由代码无需修改。
+
+SHARD_COUNT = 0（默认）时完全不启用，所有数据仍在 SQLALCHEMY_DATABASE_URI 中。
+"""
+import os
+import time
+from contextlib import contextmanager
+
+import click
+from flask import current_app, request
+from flask.cli import AppGroup
+from flask_login import current_user
+from sqlalchemy import delete, func, insert, select
+
+from app.caching import bump_data_version
+from app.session import shard_bind_key, use_routing
+from app.snapshots import discard_snapshot
+
+shards_cli = AppGroup('shards', help='分片管理命令')
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ShardRouter:
+    """
+    分片扩展。注意 init_app 必须在 db.init_app 之前调用，
+    因为分片是通过 SQLALCHEMY_BINDS 注册给 Flask-SQLAlchemy 的。
+    """
+
+    def __init__(self, db=None):
+        self.db = db
+
+    def init_app(self, app):
+        app.config.setdefault('SHARD_COUNT', 0)
+        app.config.setdefault('SHARD_DATABASE_URI_TEMPLATE', 'sqlite:///shard_{n}.db')
+        app.config.setdefault('SHARD_MOVE_GRACE_SECONDS', 0.5)
+        app.extensions['shard_router'] = self
+        app.cli.add_command(shards_cli)
+
+        count = app.config['SHARD_COUNT']
+        if not count:
+            return
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for n in range(count):
+            binds.setdefault(shard_bind_key(n), app.config['SHARD_DATABASE_URI_TEMPLATE'].format(n=n))
+        app.config['SQLALCHEMY_BINDS'] = binds
+        app.before_request(self._route_request)
+
+    # --- 基础信息 ---
+
+    @staticmethod
+    def enabled(app=None):
+        return bool((app or current_app).config['SHARD_COUNT'])
+
+    @staticmethod
+    def sharded_tables():
+        from app.models import Transaction, Category, Budget
+        return Transaction.__table__, Category.__table__, Budget.__table__
+
+    @staticmethod
+    def version_tables():
+        from app.models import DataVersion, YearVersion
+        return DataVersion.__table__, YearVersion.__table__
+
+    def engine(self, shard):
+        return self.db.engines[shard_bind_key(shard)]
+
+    def create_all(self):
+        """在每个分片库中建立分片表（中心库由 db.create_all() 负责）"""
+        if not self.enabled():
+            return
+        for n in range(current_app.config['SHARD_COUNT']):
+            engine = self.engine(n)
+            if engine.url.get_backend_name() == 'sqlite' and engine.url.database not in (None, '', ':memory:'):
+                os.makedirs(os.path.dirname(os.path.abspath(engine.url.database)), exist_ok=True)
+            tables = [mapper.local_table for mapper in self.db.Model.registry.mappers
+                      if getattr(mapper.class_, '__sharded__', False)]
+            self.db.metadata.create_all(engine, tables=tables)
+
+    # --- 目录 ---
+
+    def lookup(self, user_id):
+        from app.models import ShardDirectory
+        return self.db.session.get(ShardDirectory, user_id)
+
+    def assign(self, user_id):
+        """为用户分配用户数最少的分片并写入目录（随调用方的事务一起提交）"""
+        from app.models import ShardDirectory
+        counts = dict(
+            self.db.session.query(ShardDirectory.shard, func.count())
+            .group_by(ShardDirectory.shard).all()
+        )
+        shard = min(range(current_app.config['SHARD_COUNT']), key=lambda n: (counts.get(n, 0), n))
+        entry = ShardDirectory(user_id=user_id, shard=shard)
+        self.db.session.add(entry)
+        self.db.session.flush()
+        return entry
+
+    def activate(self, user_id):
+        """让当前 session 路由到该用户的分片，用户还没有目录项时自动分配。返回分片编号"""
+        if not self.enabled():
+            return None
+        entry = self.lookup(user_id) or self.assign(user_id)
+        self.db.session.info['shard'] = entry.shard
+        return entry.shard
+
+    @contextmanager
+    def use_user(self, user_id):
+        """在 with 块内把 session 路由到指定用户的分片（用于脚本、后台任务和测试）"""
+        state = {}
+        if self.enabled():
+            entry = self.lookup(user_id) or self.assign(user_id)
+            state['shard'] = entry.shard
+        with use_routing(self.db.session, state) as session:
+            yield session
+
+    def _route_request(self):
+        if not current_user.is_authenticated:
+            self.db.session.info.pop('shard', None)
+            return None
+        entry = self.lookup(current_user.id)
+        if entry is None:
+            if request.method in READ_METHODS:
+                # 还没有目录项的用户在任何分片上都没有数据：读请求指向 0 号分片即可，
+                # 不为只读请求写中心库（目录项要随写请求的事务提交才会保留）
+                self.db.session.info['shard'] = 0
+                return None
+            entry = self.assign(current_user.id)
+        if entry.moving and request.method not in READ_METHODS:
+            # 迁移期间该用户只读，其它用户不受影响
+            return '数据迁移中，请稍后重试。', 503, {'Retry-After': '1'}
+        self.db.session.info['shard'] = entry.shard
+        return None
+
+    # --- 在线迁移 ---
+
+    def move_user(self, user_id, target, grace=None):
+        """
+        把一个用户的全部数据从当前分片迁移到 target 分片，返回迁移的交易条数。
+
+        迁移过程中目录项标记为 moving，该用户的写请求返回 503，读请求继续访问原分片；
+        复制完成并切换目录后再删除原分片中的数据。分类/预算/交易在新分片中会获得新的 id。
+        """
+        session = self.db.session
+        entry = self.lookup(user_id)
+        if entry is None:
+            raise ValueError(f'用户 {user_id} 没有分片目录项')
+        if not 0 <= target < current_app.config['SHARD_COUNT']:
+            raise ValueError(f'分片 {target} 不存在')
+        source = entry.shard
+        if source == target:
+            return 0
+
+        entry.moving = True
+        session.commit()
+        # 等待已经通过检查、正在写原分片的请求完成
+        time.sleep(current_app.config['SHARD_MOVE_GRACE_SECONDS'] if grace is None else grace)
+
+        transactions, categories, budgets = self.sharded_tables()
+        try:
+            with self.engine(source).connect() as src, self.engine(target).begin() as dst:
+                id_map = {}
+                for row in src.execute(select(categories).where(categories.c.user_id == user_id)).mappings():
+                    values = dict(row)
+                    old_id = values.pop('id')
+                    id_map[old_id] = dst.execute(insert(categories).values(**values)).inserted_primary_key[0]
+
+                budget_rows = []
+                for row in src.execute(select(budgets).where(budgets.c.user_id == user_id)).mappings():
+                    values = dict(row)
+                    values.pop('id')
+                    if values['category_id'] is not None:
+                        values['category_id'] = id_map[values['category_id']]
+                    budget_rows.append(values)
+                if budget_rows:
+                    dst.execute(insert(budgets), budget_rows)
+
+                tx_rows = []
+                for row in src.execute(select(transactions).where(transactions.c.user_id == user_id)).mappings():
+                    values = dict(row)
+                    values.pop('id')
+                    values['category_id'] = id_map[values['category_id']]
+                    tx_rows.append(values)
+                if tx_rows:
+                    dst.execute(insert(transactions), tx_rows)
+
+                # 版本号接着原分片的往上加，不能从 0 重新开始，否则会撞上迁移前缓存的旧片段
+                for table in self.version_tables():
+                    rows = [dict(row) for row in src.execute(
+                        select(table).where(table.c.user_id == user_id)).mappings()]
+                    if rows:
+                        dst.execute(insert(table), rows)
+
+            entry.shard = target
+            entry.moving = False
+            # 迁移后各行的 id 都变了，缓存的页面片段（编辑/删除链接）和列式快照（分类 id）需要失效
+            with use_routing(session, {'shard': target}):
+                bump_data_version(session, user_id)
+            session.commit()
+            discard_snapshot(user_id)
+        except Exception:
+            session.rollback()
+            entry = self.lookup(user_id)
+            if entry.shard != target:
+                # 目录还没切换：清掉目标分片里复制了一半的数据
+                self._delete_user_rows(target, user_id)
+            entry.moving = False
+            session.commit()
+            raise
+
+        self._delete_user_rows(source, user_id)
+        return len(tx_rows)
+
+    def _delete_user_rows(self, shard, user_id):
+        from app.models import BalanceCheckpoint
+        transactions, categories, budgets = self.sharded_tables()
+        with self.engine(shard).begin() as conn:
+            # 余额检查点不复制：新分片中没有初始化标记，下次改动交易时自动重建
+            for table in (BalanceCheckpoint.__table__, *self.version_tables(), transactions, budgets, categories):
+                conn.execute(delete(table).where(table.c.user_id == user_id))
+
+    def rebalance(self):
+        """不断把用户从用户最多的分片移到最少的分片，直到各分片用户数相差不超过 1"""
+        from app.models import ShardDirectory
+        moves = []
+        count = current_app.config['SHARD_COUNT']
+        while True:
+            counts = dict(
+                self.db.session.query(ShardDirectory.shard, func.count())
+                .group_by(ShardDirectory.shard).all()
+            )
+            fullest = max(range(count), key=lambda n: counts.get(n, 0))
+            emptiest = min(range(count), key=lambda n: counts.get(n, 0))
+            if counts.get(fullest, 0) - counts.get(emptiest, 0) <= 1:
+                return moves
+            entry = ShardDirectory.query.filter_by(shard=fullest).order_by(ShardDirectory.user_id.desc()).first()
+            self.move_user(entry.user_id, emptiest)
+            moves.append((entry.user_id, fullest, emptiest))
+
+
+def _router():
+    router = current_app.extensions['shard_router']
+    if not router.enabled():
+        raise click.ClickException('未启用分片 (SHARD_COUNT = 0)')
+    return router
+
+
+@shards_cli.command('status')
+def shards_status():
+    """显示每个分片上的用户数"""
+    from app.models import ShardDirectory
+    router = _router()
+    counts = dict(
+        router.db.session.query(ShardDirectory.shard, func.count())
+        .group_by(ShardDirectory.shard).all()
+    )
+    for n in range(current_app.config['SHARD_COUNT']):
+        click.echo(f'shard_{n}: {counts.get(n, 0)} 个用户')
+
+
+@shards_cli.command('move')
+@click.argument('user_id', type=int)
+@click.argument('target', type=int)
+def shards_move(user_id, target):
+    """在线把 USER_ID 的数据迁移到 TARGET 分片"""
+    moved = _router().move_user(user_id, target)
+    click.echo(f'已迁移用户 {user_id} 到 shard_{target}，共 {moved} 条交易。')
+
+
+@shards_cli.command('rebalance')
+def shards_rebalance():
+    """在各分片之间迁移用户，使用户数大致均衡"""
+    moves = _router().rebalance()
+    for user_id, source, target in moves:
+        click.echo(f'用户 {user_id}: shard_{source} -> shard_{target}')
+    click.echo(f'完成，共迁移 {len(moves)} 个用户。')
@@ -0,0 +1,70 @@
+# app/singleflight.py
+"""
+单飞（single-flight）：相同键的并发调用只真正执行一次。
+
+第一个调用者负责计算，计算期间到达的相同调用直接等待并共享它的结果（或异常）；
+计算结束后键即被移除，之后的调用会重新计算，所以这不是缓存，不会返回过期数据。
+适合多个标签页 / 自动刷新同时请求同一份聚合数据的场景。
+
+注意共享的结果会被多个线程同时使用：只能返回普通的 dict / list / 数字，
+不要返回绑定在某个线程 session 上的 ORM 对象。
+"""
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        # 统计：实际执行次数 / 共享结果的次数
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        """执行 fn() 或等待正在执行的相同调用，返回结果"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+# 进程内共享的默认实例
+group = SingleFlight()
@@ -0,0 +1,331 @@
+# app/snapshots.py
+"""
+已结束月份的列式快照。
+
+往月的交易几乎不会再改，统计/趋势却每次都要从 SQLite 一行行读出来。这里把每个用户
+本月之前的全部交易按列写成一个文件（SNAPSHOT_DIR/<user_id>.col），读取时 mmap
+映射，各列直接在映射的内存上构造 numpy 数组，不解析、不逐行转换，按日期区间切片也不拷贝；
+只有本月（以及以后）的交易仍然查库。
+
+文件格式（小端，各列按日期排序）：
+
+    头部      magic 'LCOL', 版本, 分类数 k, 覆盖到的月份序号, 行数 n
+    int64[k]  分类 id 字典
+    int64[n]  金额（分）
+    int32[n]  日期（1970-01-01 起的天数）
+    int16[n]  分类（字典下标；分类 id 是全库自增的，直接存 int16 会溢出）
+    uint8[]   类型位图（1 为收入）
+
+失效：
+    - 交易在 flush 时的增删改（新旧值任一落在往月）在提交后删除该用户的快照，下次读取时重建
+    - 批量 SQL（后台任务的 query.delete() 等）与分片迁移（分类 id 会变）需要调用 discard_snapshot()
+    - 月份翻过去之后旧快照少了一个月，读取时发现覆盖范围不是“上个月为止”也会重建
+    - 每次失效都会改写 <user_id>.gen 中的令牌；构建前后令牌不一致说明构建期间有人改了往月数据，
+      刚写好的快照直接丢弃。多个 worker 共用同一个目录，删除文件对所有进程立即可见
+"""
+import os
+import mmap
+import struct
+import tempfile
+from contextlib import contextmanager
+from datetime import date, datetime, time
+
+import click
+import numpy as np
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+from flask.cli import AppGroup
+
+from app.analytics import epoch_day, query_columns
+from app.caching import LRUCache
+from app.ledger import period_of
+from app.rangesum import committed_values
+from app.session import RoutingSession
+
+snapshots_cli = AppGroup('snapshots', help='列式快照命令')
+
+MAGIC = b'LCOL'
+VERSION = 1
+# magic, 版本, 分类数, 覆盖到的月份序号, 行数；补齐到 8 字节对齐
+_HEADER = struct.Struct('<4sHHiQ4x')
+
+_PENDING = 'snapshots_pending'
+_FIELDS = ('user_id', 'date')
+
+
+def month_start(period):
+    """月份序号（年 * 12 + 月 - 1）的第一天"""
+    return date(period // 12, period % 12 + 1, 1)
+
+
+class Snapshot:
+    """一个已映射的快照文件；各列都是指向映射内存的只读数组"""
+
+    def __init__(self, buffer, key=None):
+        magic, version, k, last_period, n = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('不是有效的快照文件')
+        self.key = key
+        self.last_period = last_period
+        self.rows = n
+        self._buffer = buffer
+        offset = _HEADER.size
+        self.category_ids = np.frombuffer(buffer, np.int64, k, offset)
+        offset += 8 * k
+        self.cents = np.frombuffer(buffer, np.int64, n, offset)
+        offset += 8 * n
+        self.days = np.frombuffer(buffer, np.int32, n, offset)
+        offset += 4 * n
+        self.codes = np.frombuffer(buffer, np.int16, n, offset)
+        offset += 2 * n
+        self.bits = np.frombuffer(buffer, np.uint8, (n + 7) // 8, offset)
+
+    @property
+    def end(self):
+        """快照之后的第一天（从这天起要查库）"""
+        return month_start(self.last_period + 1)
+
+    def columns(self, first_day=None, last_day=None):
+        """[first_day, last_day] 内的 (天数, 金额（分）, 分类 id, 是否收入)，与 analytics.query_columns 相同"""
+        lo = 0 if first_day is None else int(np.searchsorted(self.days, epoch_day(first_day), 'left'))
+        hi = self.rows if last_day is None else int(np.searchsorted(self.days, epoch_day(last_day), 'right'))
+        hi = max(lo, hi)
+        start = lo // 8
+        income = np.unpackbits(self.bits[start:(hi + 7) // 8], bitorder='little')[lo - 8 * start:hi - 8 * start]
+        return (self.days[lo:hi], self.cents[lo:hi],
+                self.category_ids[self.codes[lo:hi]], income.astype(bool))
+
+
+def encode(last_period, days, cents, category_ids, income):
+    """把已按日期排序的各列编码成快照文件内容"""
+    ids, codes = np.unique(np.asarray(category_ids, dtype=np.int64), return_inverse=True)
+    if len(ids) > np.iinfo(np.int16).max:
+        raise ValueError('分类太多，无法写入快照')
+    n = len(days)
+    return b''.join((
+        _HEADER.pack(MAGIC, VERSION, len(ids), last_period, n),
+        ids.tobytes(),
+        np.asarray(cents, dtype='<i8').tobytes(),
+        np.asarray(days, dtype='<i4').tobytes(),
+        codes.astype('<i2').tobytes(),
+        np.packbits(np.asarray(income, dtype=bool), bitorder='little').tobytes(),
+    ))
+
+
+@contextmanager
+def _primary(session):
+    # 快照必须从主库构建：副本可能还没同步到刚刚让快照失效的那次修改
+    read_only = session.info.pop('read_only', None)
+    try:
+        yield session
+    finally:
+        if read_only is not None:
+            session.info['read_only'] = read_only
+
+
+class ColumnSnapshots:
+    """
+    列式快照扩展：
+
+        snapshot_store = ColumnSnapshots(db)
+        snapshot_store.init_app(app)
+        snapshot_store.closed_columns(session, user_id, first_day, last_day)  # -> (列, 快照之后的第一天) 或 None
+    """
+
+    def __init__(self, db=None):
+        self.db = db
+
+    def init_app(self, app):
+        app.config.setdefault('SNAPSHOT_ENABLED', True)
+        app.config.setdefault('SNAPSHOT_DIR', os.path.join(app.instance_path, 'snapshots'))
+        app.config.setdefault('SNAPSHOT_MAX_OPEN', 64)
+        app.extensions['snapshots'] = self
+        # 每个进程保留最近用过的若干个映射：user_id -> Snapshot
+        self.opened = LRUCache(maxsize=app.config['SNAPSHOT_MAX_OPEN'])
+        app.cli.add_command(snapshots_cli)
+        for name, fn in (('after_flush', _collect_on_flush), ('after_commit', _discard_on_commit)):
+            if not sa.event.contains(RoutingSession, name, fn):
+                sa.event.listen(RoutingSession, name, fn)
+
+    # --- 文件 ---
+
+    @staticmethod
+    def directory():
+        return current_app.config['SNAPSHOT_DIR']
+
+    def path(self, user_id):
+        return os.path.join(self.directory(), f'{user_id}.col')
+
+    def _token_path(self, user_id):
+        return os.path.join(self.directory(), f'{user_id}.gen')
+
+    def _token(self, user_id):
+        try:
+            with open(self._token_path(user_id), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return b''
+
+    def _write_atomic(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def discard(self, user_id):
+        """让用户的快照失效：先换令牌（让正在进行的构建作废），再删文件"""
+        if not os.path.isdir(self.directory()):
+            return  # 还没有任何快照；构建时先建目录再读令牌，所以这里跳过不会漏掉正在进行的构建
+        self._write_atomic(self._token_path(user_id), os.urandom(8))
+        try:
+            os.unlink(self.path(user_id))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        """删除全部快照（测试、或者不知道是哪个用户改的数据时）"""
+        directory = self.directory()
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.endswith('.col'):
+                    self.discard(int(name[:-4]))
+        self.opened.clear()
+
+    # --- 构建与读取 ---
+
+    def build(self, session, user_id):
+        """从主库读取本月之前的全部交易，写成快照文件；构建期间往月数据被改过时返回 False"""
+        from app.models import Transaction
+        last_period = period_of(date.today()) - 1
+        os.makedirs(self.directory(), exist_ok=True)
+        token = self._token(user_id)
+        with _primary(session):
+            days, cents, category_ids, income = query_columns(
+                session, user_id, Transaction.date < datetime.combine(month_start(last_period + 1), time.min),
+                order_by=(Transaction.date, Transaction.id))
+        data = encode(last_period, days, cents, category_ids, income)
+        path = self.path(user_id)
+        self._write_atomic(path, data)
+        if self._token(user_id) != token:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            return False
+        return True
+
+    def open(self, user_id):
+        """
+        映射用户现有的快照文件；没有文件时返回 None。
+        文件被替换或删除后重新映射；旧映射不主动关闭，还在使用它的请求读完后自然回收。
+        """
+        try:
+            f = open(self.path(user_id), 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            stat = os.fstat(f.fileno())
+            key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            snapshot = self.opened.get(user_id)
+            if snapshot is None or snapshot.key != key:
+                snapshot = Snapshot(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), key)
+                self.opened.set(user_id, snapshot)
+        return snapshot
+
+    def get(self, session, user_id):
+        """覆盖到上个月为止的快照，必要时先构建；未启用或构建失败时返回 None"""
+        if not current_app.config['SNAPSHOT_ENABLED']:
+            return None
+        last_period = period_of(date.today()) - 1
+        snapshot = self.open(user_id)
+        if snapshot is None or snapshot.last_period != last_period:
+            try:
+                if not self.build(session, user_id):
+                    return None
+            except ValueError:
+                return None
+            snapshot = self.open(user_id)
+        return snapshot
+
+    def closed_columns(self, session, user_id, first_day, last_day):
+        """
+        [first_day, last_day] 中快照覆盖的部分：((天数, 金额, 分类 id, 是否收入), 快照之后的第一天)。
+        调用方再去库里查 “快照之后的第一天” 起的交易。未启用时返回 None。
+        """
+        snapshot = self.get(session, user_id)
+        if snapshot is None:
+            return None
+        return snapshot.columns(first_day, last_day), snapshot.end
+
+
+def discard_snapshot(user_id):
+    """批量 SQL 改了往月交易之后调用（没有应用上下文或未注册扩展时什么也不做）"""
+    if has_app_context() and 'snapshots' in current_app.extensions:
+        current_app.extensions['snapshots'].discard(user_id)
+
+
+# --- 失效：flush 时记下改动了往月交易的用户，提交后删除其快照 ---
+
+def _collect_on_flush(session, flush_context):
+    from app.models import Transaction
+    current = period_of(date.today())
+    pending = session.info.setdefault(_PENDING, set())
+
+    def touch(user_id, day):
+        if day is None or period_of(day) < current:
+            pending.add(user_id)
+
+    for obj in session.new:
+        if isinstance(obj, Transaction):
+            touch(obj.user_id, obj.date)
+    for obj in list(session.deleted) + list(session.dirty):
+        if not isinstance(obj, Transaction) or (obj in session.dirty and not session.is_modified(obj)):
+            continue
+        old = committed_values(obj, _FIELDS)
+        if old is None:
+            touch(sa.inspect(obj).dict.get('user_id'), None)  # 旧日期未知，按往月处理
+            continue
+        touch(*old)
+        if obj in session.dirty:
+            touch(obj.user_id, obj.date)
+
+
+def _discard_on_commit(session):
+    pending = session.info.pop(_PENDING, None)
+    if not pending or not has_app_context() or 'snapshots' not in current_app.extensions:
+        return
+    store = current_app.extensions['snapshots']
+    if None in pending:
+        store.clear()
+        return
+    for user_id in pending:
+        store.discard(user_id)
+
+
+@snapshots_cli.command('rebuild')
+@click.option('--user-id', type=int, help='只重建指定用户（默认全部用户）')
+def snapshots_rebuild(user_id):
+    """重新生成往月交易的列式快照"""
+    from app import db, shard_router, snapshot_store
+    from app.models import User
+    user_ids = [user_id] if user_id is not None else [uid for uid, in db.session.query(User.id)]
+    rows = 0
+    for uid in user_ids:
+        with shard_router.use_user(uid) as session:
+            snapshot_store.build(session, uid)
+            snapshot = snapshot_store.open(uid)
+            rows += snapshot.rows if snapshot is not None else 0
+            session.rollback()
+    click.echo(f'已重建 {len(user_ids)} 个用户的快照，共 {rows} 笔往月交易。')
+
+
+@snapshots_cli.command('clear')
+def snapshots_clear():
+    """删除全部快照（下次读取时按需重建）"""
+    current_app.extensions['snapshots'].clear()
+    click.echo('已删除全部快照。')
@@ -0,0 +1,119 @@
+# app/statements.py
+"""
+仪表盘与交易查找的热点查询，预先构造好的语句。
+
+这些查询每个请求都要执行，变化的只有用户、日期区间这类参数。用 ORM 查询 API 现拼时，
+每次都要重新构造一棵语句对象树、再遍历它算出缓存键才能命中编译缓存，这部分 Python
+开销比 SQLite 执行这些索引查询本身还要多。这里的语句在导入时构造一次，参数全部是
+命名的 bindparam，执行时只传参数值：
+
+    rows = execute(db.session, MONTH_TOTALS, user_id=1, start=start, end=end).all()
+
+    - 语句对象不变，缓存键只计算一次（SQLAlchemy 会把它记在语句对象上），编译结果一直命中缓存
+    - 直接在 session 的连接上执行，不走 ORM 的执行流程；连接按 Transaction 选取，
+      分片与只读副本的路由照常生效
+    - 交易查找的可选条件有多种组合，每种组合第一次用到时构造一套语句并缓存下来
+
+执行耗时可以用 python benchstatements.py 与现拼的 ORM 查询对比。
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+import sqlalchemy as sa
+from sqlalchemy import extract, func
+
+from app.models import Budget, Category, Transaction
+from app.readmodels import transaction_select
+
+_user = Transaction.user_id == sa.bindparam('user_id')
+_in_range = Transaction.date.between(sa.bindparam('start'), sa.bindparam('end'))
+
+# (类型, 金额合计（分）)；参数 user_id, start, end
+MONTH_TOTALS = sa.select(Transaction.type, func.sum(Transaction.amount_cents)).where(
+    _user, _in_range
+).group_by(Transaction.type)
+
+# 当月的预算 (分类 id, 分类名, 预算（分）)，总预算的分类 id 和分类名为 None；参数 user_id, year, month
+MONTH_BUDGETS = sa.select(Budget.category_id, Category.name, Budget.amount_cents).outerjoin(
+    Category, Budget.category_id == Category.id
+).where(
+    Budget.user_id == sa.bindparam('user_id'),
+    Budget.year == sa.bindparam('year'),
+    Budget.month == sa.bindparam('month')
+).order_by(Budget.id)
+
+# (分类 id, 支出合计（分）)；参数 user_id, start, end
+SPENT_BY_CATEGORY = sa.select(Transaction.category_id, func.sum(Transaction.amount_cents)).where(
+    _user, _in_range, Transaction.type == 'expense'
+).group_by(Transaction.category_id)
+
+# 支出饼图 (分类名, 支出合计（分）)，金额从大到小；参数 user_id, start, end
+EXPENSE_PIE = sa.select(Category.name, func.sum(Transaction.amount_cents).label('total')).join(
+    Category, Transaction.category_id == Category.id
+).where(
+    _user, _in_range, Transaction.type == 'expense'
+).group_by(Category.name).order_by(func.sum(Transaction.amount_cents).desc())
+
+# 每日收支 (类型, 日期, 金额合计（分）)，SQLite 的 date() 返回字符串；参数 user_id, start, end
+_day = func.date(Transaction.date)
+DAILY_TOTALS = sa.select(
+    Transaction.type, _day.label('day'), func.sum(Transaction.amount_cents).label('total')
+).where(_user, _in_range).group_by(Transaction.type, _day)
+
+# 最近录入的交易（readmodels.TransactionRow 的各列）；参数 user_id, limit
+RECENT_ROWS = transaction_select(_user).order_by(Transaction.id.desc()).limit(sa.bindparam('limit'))
+
+# 按 id 取交易（readmodels.TransactionRow 的各列，顺序不定）；参数 user_id, ids（列表）
+ROWS_BY_ID = transaction_select(_user, Transaction.id.in_(sa.bindparam('ids', expanding=True)))
+
+
+def execute(session, stmt, **params):
+    connection = session.connection(bind_arguments={'mapper': Transaction})
+    return connection.execute(stmt, params)
+
+
+# --- 交易查找 ---
+
+# 筛选条件，None 表示不限；keyword 已经是 ilike 的模式串（'%关键词%'），end 已经包含当天
+SearchFilters = namedtuple('SearchFilters', 'user_id keyword category_id start end min_cents max_cents')
+
+_SEARCH_CONDITIONS = {
+    'keyword': Transaction.memo.ilike(sa.bindparam('keyword')),
+    'category_id': Transaction.category_id == sa.bindparam('category_id'),
+    'start': Transaction.date >= sa.bindparam('start'),
+    'end': Transaction.date <= sa.bindparam('end'),
+    'min_cents': Transaction.amount_cents >= sa.bindparam('min_cents'),
+    'max_cents': Transaction.amount_cents <= sa.bindparam('max_cents'),
+}
+
+SearchStatements = namedtuple('SearchStatements', 'rows count ids facets')
+
+# 月份序号 = 年 * 12 + 月 - 1
+_period = extract('year', Transaction.date) * 12 + extract('month', Transaction.date) - 1
+
+
+@lru_cache(maxsize=None)
+def _search_statements(active):
+    where = [_user, *(_SEARCH_CONDITIONS[name] for name in active)]
+    order = (Transaction.date.desc(), Transaction.id.desc())
+    return SearchStatements(
+        # 按日期倒序的一页交易；另需参数 limit, offset
+        rows=transaction_select(*where).order_by(*order).limit(sa.bindparam('limit')).offset(sa.bindparam('offset')),
+        count=sa.select(func.count(Transaction.id)).where(*where),
+        # 按同样顺序的全部 id（结果快照用）；另需参数 limit
+        ids=sa.select(Transaction.id).where(*where).order_by(*order).limit(sa.bindparam('limit')),
+        # 分面：(分类 id, 分类名, 类型, 月份序号, 笔数, 金额合计（分）)，按分类和按月的汇总都从这一次分组得到
+        facets=sa.select(
+            Transaction.category_id, Category.name, Transaction.type, _period.label('period'),
+            func.count(Transaction.id), func.sum(Transaction.amount_cents)
+        ).join(Category, Transaction.category_id == Category.id).where(*where).group_by(
+            Transaction.category_id, Category.name, Transaction.type, _period
+        ),
+    )
+
+
+def search_statements(filters):
+    """按 filters 中用到的条件返回 (SearchStatements, 参数)"""
+    params = {name: value for name, value in filters._asdict().items() if value is not None}
+    active = tuple(name for name in SearchFilters._fields if name in params and name in _SEARCH_CONDITIONS)
+    return _search_statements(active), params
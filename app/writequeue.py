@@ -0,0 +1,170 @@
+# app/writequeue.py
+"""
+可选的“组提交”写入通道。
+
+SQLite 同一时间只允许一个写者，每个请求各自 commit 时，并发写入会在写锁和 fsync 上排队。
+启用 WRITE_QUEUE_ENABLED 后，路由中的增删改操作以函数的形式投递到单独的写线程，
+写线程把几毫秒内到达的操作合并进同一个事务提交，提交成功后再通知各个请求。
+单个操作抛出异常时整批回滚，去掉这个操作后把其余操作重新执行一遍，
+因此失败的操作不会影响同批次的其他操作；fn 可能被执行多次，不要在其中产生事务之外的副作用。
+"""
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import current_app
+
+from app.session import routing_state, use_routing
+
+_STOP = object()
+
+
+class _Writer:
+    """绑定到单个 Flask 应用的写线程"""
+
+    def __init__(self, app, db):
+        self.app = app
+        self.db = db
+        self.window = app.config['WRITE_QUEUE_WINDOW_MS'] / 1000.0
+        self.max_batch = app.config['WRITE_QUEUE_MAX_BATCH']
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='ledger-writer', daemon=True)
+                self.thread.start()
+
+    def stop(self, timeout=None):
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join(timeout)
+
+    def submit(self, fn):
+        future = Future()
+        self.start()
+        self.queue.put((fn, future))
+        return future
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit_batch(batch)
+            if stop:
+                return
+
+    def _commit_batch(self, batch):
+        ops = [(fn, future) for fn, future in batch if future.set_running_or_notify_cancel()]
+        while ops:
+            results, failed, error = self._run_ops(ops)
+            if error is None:
+                for (_, future), result in zip(ops, results):
+                    future.set_result(result)
+                return
+            if failed is None:
+                # 提交本身失败，整批操作都算失败
+                for _, future in ops:
+                    future.set_exception(error)
+                return
+            # 单个操作失败：整批已回滚，只通知失败的那个，其余操作重新执行一遍
+            _, future = ops.pop(failed)
+            future.set_exception(error)
+
+    def _run_ops(self, ops):
+        """
+        在一个事务中依次执行 ops 并提交，返回 (各操作的返回值, 出错操作的下标, 异常)；
+        出错时事务已整体回滚，下标为 None 表示是提交失败。
+
+        这里不用 SAVEPOINT 隔离各个操作：pysqlite 默认不会为 SAVEPOINT 发出 BEGIN，
+        最外层的 RELEASE 就等于 COMMIT，每个操作都会各自提交一次，组提交也就失效了。
+        """
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                results = []
+                for index, (fn, _) in enumerate(ops):
+                    try:
+                        results.append(fn(session))
+                    except Exception as e:
+                        session.rollback()
+                        return None, index, e
+                try:
+                    session.commit()
+                except Exception as e:
+                    session.rollback()
+                    return None, None, e
+                return results, None, None
+            finally:
+                self.db.session.remove()
+
+
+def _with_routing(fn, state):
+    """让写操作在写线程中沿用提交它的请求的路由信息（例如所在分片）"""
+    def op(session):
+        with use_routing(session, state):
+            result = fn(session)
+            # 必须在路由信息有效时 flush，否则会被写到错误的库
+            session.flush()
+        return result
+    return op
+
+
+class WriteQueue:
+    """
+    写入通道扩展，用法与其它 Flask 扩展一致：
+
+        write_queue = WriteQueue(db)
+        write_queue.init_app(app)
+
+    路由通过 run_write(fn) 提交修改，fn 接收一个 session 参数并只做 add/delete/属性修改，
+    不要自己 commit，也不要引用请求线程中已加载的 ORM 对象（应通过 id 重新获取）。
+    """
+
+    def __init__(self, db=None, app=None):
+        self.db = db
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, db=None):
+        app.config.setdefault('WRITE_QUEUE_ENABLED', False)
+        app.config.setdefault('WRITE_QUEUE_WINDOW_MS', 5)
+        app.config.setdefault('WRITE_QUEUE_MAX_BATCH', 64)
+        app.config.setdefault('WRITE_QUEUE_TIMEOUT', 10)
+        db = db or self.db
+        writer = _Writer(app, db)
+        app.extensions['write_queue'] = writer
+        atexit.register(writer.stop, 1.0)
+
+    def run_write(self, fn):
+        """执行一次修改并等待其提交，返回 fn 的返回值"""
+        app = current_app._get_current_object()
+        writer = app.extensions['write_queue']
+        if not app.config['WRITE_QUEUE_ENABLED']:
+            result = fn(writer.db.session)
+            writer.db.session.commit()
+            return result
+        # 结束请求线程自己的读事务，避免它持有的共享锁挡住写线程提交
+        writer.db.session.rollback()
+        future = writer.submit(_with_routing(fn, routing_state(writer.db.session)))
+        return future.result(timeout=app.config['WRITE_QUEUE_TIMEOUT'])
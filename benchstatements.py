@@ -0,0 +1,195 @@
+# benchstatements.py
+"""
+仪表盘热点查询的 Python 侧开销对比：每条查询分别用每次现拼的 ORM 查询（之前的写法）
+和 app/statements.py 中预先构造好的语句执行若干次，输出平均每次的耗时。
+
+数据库是只有少量数据的内存 SQLite，SQL 本身的执行时间可以忽略，差值基本就是语句构造、
+缓存键计算与编译的开销。每次调用轮换用户和月份，确认换参数后仍然命中缓存。
+
+用法示例：
+    python benchstatements.py
+    python benchstatements.py --iterations 5000 --users 8
+"""
+import argparse
+import time
+from datetime import date
+
+from sqlalchemy import func
+
+from app import create_app, db, statements
+from app.main.routes import get_date_range
+from app.models import Budget, Category, Transaction, User
+from app.money import to_cents
+from app.readmodels import fetch_rows, paginate_rows, transaction_select
+from loadtest import LoadTestConfig, seed_database
+
+
+class BenchConfig(LoadTestConfig):
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    # 只比较语句本身，不让结果缓存和请求合并挡在前面
+    FRAGMENT_CACHE_ENABLED = False
+    RESULT_CACHE_ENABLED = False
+    RANGESUM_ENABLED = False
+    SNAPSHOT_ENABLED = False
+
+
+def _search(user_id):
+    return statements.SearchFilters(user_id, '%午饭%', None, date(2000, 1, 1), None, 100, None)
+
+
+# --- 之前的写法 ---
+
+def _orm_month_totals(session, user_id, start, end, year, month):
+    return session.query(Transaction.type, func.sum(Transaction.amount_cents)).filter(
+        Transaction.user_id == user_id, Transaction.date.between(start, end)
+    ).group_by(Transaction.type).all()
+
+
+def _orm_budgets(session, user_id, start, end, year, month):
+    total = Budget.query.filter(Budget.user_id == user_id, Budget.year == year, Budget.month == month,
+                                Budget.category_id == None).first()  # noqa: E711
+    category_budgets = Budget.query.filter(Budget.user_id == user_id, Budget.year == year, Budget.month == month,
+                                           Budget.category_id != None).join(Category).all()  # noqa: E711
+    return total.amount_cents, sorted((b.category.name, to_cents(b.category.get_spent_in_month(year, month)))
+                                      for b in category_budgets)
+
+
+def _orm_pie(session, user_id, start, end, year, month):
+    return session.query(Category.name, func.sum(Transaction.amount_cents).label('total')).join(Transaction.category).filter(
+        Transaction.user_id == user_id, Transaction.date.between(start, end), Transaction.type == 'expense'
+    ).group_by(Category.name).order_by(func.sum(Transaction.amount_cents).desc()).all()
+
+
+def _orm_daily(session, user_id, start, end, year, month):
+    day_col = func.date(Transaction.date).label('day')
+    return session.query(Transaction.type, day_col, func.sum(Transaction.amount_cents).label('total')).filter(
+        Transaction.user_id == user_id, Transaction.date.between(start, end)
+    ).group_by(Transaction.type, day_col).all()
+
+
+def _orm_recent(session, user_id, start, end, year, month):
+    return fetch_rows(session, transaction_select(Transaction.user_id == user_id).order_by(Transaction.id.desc()).limit(5))
+
+
+def _orm_search(session, user_id, start, end, year, month):
+    conditions = (Transaction.user_id == user_id, Transaction.memo.ilike('%午饭%'),
+                  Transaction.date >= date(2000, 1, 1), Transaction.amount_cents >= 100)
+    page = paginate_rows(session, transaction_select(*conditions).order_by(Transaction.date.desc()), page=1, per_page=20)
+    return page.total, [tuple(r) for r in page.items]
+
+
+# --- 预先构造好的语句 ---
+
+def _cached_month_totals(session, user_id, start, end, year, month):
+    return statements.execute(session, statements.MONTH_TOTALS, user_id=user_id, start=start, end=end).all()
+
+
+def _cached_budgets(session, user_id, start, end, year, month):
+    budgets = statements.execute(session, statements.MONTH_BUDGETS, user_id=user_id, year=year, month=month).all()
+    spent = dict(statements.execute(session, statements.SPENT_BY_CATEGORY, user_id=user_id, start=start, end=end).all())
+    total = next(amount for category_id, _, amount in budgets if category_id is None)
+    return total, sorted((name, spent.get(category_id) or 0) for category_id, name, _ in budgets if category_id is not None)
+
+
+def _cached_pie(session, user_id, start, end, year, month):
+    return statements.execute(session, statements.EXPENSE_PIE, user_id=user_id, start=start, end=end).all()
+
+
+def _cached_daily(session, user_id, start, end, year, month):
+    return statements.execute(session, statements.DAILY_TOTALS, user_id=user_id, start=start, end=end).all()
+
+
+def _cached_recent(session, user_id, start, end, year, month):
+    return fetch_rows(session, statements.RECENT_ROWS, {'user_id': user_id, 'limit': 5})
+
+
+def _cached_search(session, user_id, start, end, year, month):
+    stmts, params = statements.search_statements(_search(user_id))
+    page = paginate_rows(session, stmts.rows, page=1, per_page=20, count_select=stmts.count, params=params)
+    return page.total, [tuple(r) for r in page.items]
+
+
+QUERIES = {
+    'month_totals': (_orm_month_totals, _cached_month_totals),
+    'budgets': (_orm_budgets, _cached_budgets),
+    'pie': (_orm_pie, _cached_pie),
+    'daily': (_orm_daily, _cached_daily),
+    'recent': (_orm_recent, _cached_recent),
+    'search': (_orm_search, _cached_search),
+}
+
+
+def _seed_budgets(user_ids, months):
+    for user_id in user_ids:
+        category = Category.query.filter_by(user_id=user_id, type='expense').first()
+        for year, month in months:
+            db.session.add(Budget(amount=3000, year=year, month=month, user_id=user_id))
+            db.session.add(Budget(amount=800, year=year, month=month, user_id=user_id, category_id=category.id))
+    db.session.commit()
+
+
+def _time(fn, session, argsets, iterations):
+    for args in argsets:
+        fn(session, *args)
+    started = time.perf_counter()
+    for i in range(iterations):
+        fn(session, *argsets[i % len(argsets)])
+    return (time.perf_counter() - started) / iterations
+
+
+def run_benchmark(iterations=2000, users=4, seed_transactions=50):
+    """返回 {查询名: (现拼 ORM 查询每次耗时, 预构造语句每次耗时)}，单位秒"""
+    app = create_app(BenchConfig)
+    try:
+        seed_database(app, users, seed_transactions, 'bench123')
+        with app.app_context():
+            today = date.today()
+            months = [(today.year - (today.month <= i), (today.month - 1 - i) % 12 + 1) for i in range(3)]
+            user_ids = [u.id for u in User.query.all()]
+            _seed_budgets(user_ids, months)
+            argsets = []
+            for user_id in user_ids:
+                for year, month in months:
+                    start, end, _, _ = get_date_range(year, month)
+                    argsets.append((user_id, start, end, year, month))
+
+            results = {}
+            for name, (orm, cached) in QUERIES.items():
+                # 两种写法的结果必须一致，否则比较没有意义
+                for args in argsets[:2]:
+                    assert _normalized(orm(db.session, *args)) == _normalized(cached(db.session, *args)), name
+                results[name] = (_time(orm, db.session, argsets, iterations),
+                                 _time(cached, db.session, argsets, iterations))
+                db.session.remove()
+            return results
+    finally:
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+
+
+def _normalized(result):
+    return [tuple(r) for r in result] if isinstance(result, list) else result
+
+
+def format_results(results):
+    lines = [f"{'查询':<14}{'ORM(µs)':>10}{'预构造(µs)':>12}{'加速':>8}"]
+    for name, (orm, cached) in results.items():
+        lines.append(f'{name:<14}{orm * 1e6:>10.0f}{cached * 1e6:>12.0f}{orm / cached:>7.1f}x')
+    orm_total = sum(orm for orm, _ in results.values())
+    cached_total = sum(cached for _, cached in results.values())
+    lines.append(f"{'合计':<14}{orm_total * 1e6:>10.0f}{cached_total * 1e6:>12.0f}{orm_total / cached_total:>7.1f}x")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='仪表盘热点查询的 Python 侧开销对比')
+    parser.add_argument('--iterations', type=int, default=2000, help='每条查询执行的次数')
+    parser.add_argument('--users', type=int, default=4, help='轮换使用的用户数')
+    parser.add_argument('--seed-transactions', type=int, default=50, help='每个用户预置的交易数')
+    args = parser.parse_args(argv)
+    print(format_results(run_benchmark(args.iterations, args.users, args.seed_transactions)))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,4 +9,95 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app.db')
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # 组提交写入通道：开启后增删改由单独的写线程合并提交
+    WRITE_QUEUE_ENABLED = os.environ.get('WRITE_QUEUE_ENABLED', '').lower() in ('1', 'true', 'yes')
+    WRITE_QUEUE_WINDOW_MS = 5      # 每批最多等待的毫秒数
+    WRITE_QUEUE_MAX_BATCH = 64     # 每批最多合并的操作数
+    WRITE_QUEUE_TIMEOUT = 10       # 请求等待提交结果的超时(秒)
+
+    # 按用户分片：SHARD_COUNT > 0 时 交易/分类/预算 分散存放在多个 SQLite 文件中
+    SHARD_COUNT = int(os.environ.get('SHARD_COUNT') or 0)
+    SHARD_DATABASE_URI_TEMPLATE = os.environ.get('SHARD_DATABASE_URI_TEMPLATE') or \
+        'sqlite:///' + os.path.join(basedir, 'shards', 'shard_{n}.db')
+    SHARD_MOVE_GRACE_SECONDS = 0.5  # 在线迁移前等待进行中写请求完成的时间
+
+    # 读写分离：配置后只读视图的查询发往该副本，副本通过 SQLite 在线备份从主库同步
+    READ_REPLICA_DATABASE_URI = os.environ.get('READ_REPLICA_DATABASE_URL')
+    READ_YOUR_WRITES_SECONDS = 5    # 用户写入后这段时间内的读请求仍走主库
+    READ_REPLICA_SYNC_INTERVAL = int(os.environ.get('READ_REPLICA_SYNC_INTERVAL') or 0)  # 后台同步间隔(秒)，0 为不自动同步
+
+    # 后台任务：'thread' 在本进程线程池执行，'external' 交给 `flask jobs worker` 进程，'inline' 同步执行
+    JOBS_MODE = os.environ.get('JOBS_MODE') or 'thread'
+    JOBS_WORKERS = 1               # 线程池大小
+    JOBS_BATCH_SIZE = 500          # 任务内部分批读写/提交的行数
+    JOBS_PROGRESS_INTERVAL = 0.5   # 进度写库的最小间隔(秒)
+
+    # 静态资源：构建带哈希文件名和 gzip/brotli 预压缩版本的产物，以 immutable 缓存头返回
+    ASSETS_BUILD_DIR = os.path.join(basedir, 'instance', 'assets')
+    ASSETS_AUTO_BUILD = True       # 启动时发现源文件有更新则自动重新构建
+    ASSETS_MAX_AGE = 365 * 24 * 3600
+    ASSETS_COMPRESS_LEVEL = 9      # 预压缩 gzip 级别（构建时一次性开销）
+
+    # 响应压缩：按 Accept-Encoding 压缩 HTML/JSON 等文本响应（可选 brotli/zstandard，否则 gzip）
+    COMPRESS_ENABLED = True
+    COMPRESS_LEVEL = 6             # gzip 压缩级别 1-9
+    COMPRESS_BR_LEVEL = 4          # brotli 质量 0-11
+    COMPRESS_ZSTD_LEVEL = 3        # zstd 级别
+    COMPRESS_MIN_SIZE = 500        # 小于该字节数的响应不压缩
+
+    # 模板：Jinja 字节码缓存目录（留空则不缓存）与 {% cache %} 片段缓存
+    JINJA_BYTECODE_CACHE_DIR = os.path.join(basedir, 'instance', 'jinja-cache')
+    FRAGMENT_CACHE_ENABLED = True
+    FRAGMENT_CACHE_SIZE = 1024     # 每个进程最多缓存的片段数
+    FRAGMENT_CACHE_TIMEOUT = 300   # 片段最长缓存时间(秒)
+    RESULT_CACHE_ENABLED = True    # 按数据版本号缓存的计算结果（如往年的日历热力图）
+    RESULT_CACHE_SIZE = 256
+
+    # 交易查找结果快照：第一页时记下全部匹配交易的 id 与合计，翻页只按主键取本页的行
+    SEARCH_CACHE_ENABLED = True
+    SEARCH_CACHE_SIZE = 256        # 每个进程最多缓存的快照数
+    SEARCH_CACHE_TIMEOUT = 120     # 快照最长保留时间(秒)
+    SEARCH_CACHE_MAX_ROWS = 50000  # 匹配的交易超过该数量时不做快照
+    SEARCH_CACHE_MAX_BYTES = 32 * 1024 * 1024  # 每个进程的快照最多占用的字节数（每个 id 8 字节）
+
+    # 查询时间预算：下列端点从请求开始计时，查询超过预算(秒)即被中止，提示用户缩小查找范围
+    QUERY_BUDGET_ENABLED = True
+    QUERY_BUDGETS = {
+        'main.transactions': 2.0,      # 交易查找
+        'main.ledger': 3.0,            # 流水账
+        'main.statistics': 5.0,        # 统计分析
+        'main.statistics_data': 5.0,
+        'main.chart_data': 3.0,        # 仪表盘图表、收支趋势与日历热力图接口
+        'main.trend': 3.0,
+        'main.heatmap': 3.0,
+    }
+
+    # 按日前缀和索引：用进程内索引 O(log n) 计算首页的当月收支合计和分类预算的已支出金额
+    # （交易查找的合计由分面查询顺带算出，不使用它）；关闭后改用 GROUP BY 查询
+    RANGESUM_ENABLED = True
+    RANGESUM_MAX_USERS = 256       # 最多同时保留多少个用户的索引
+    RANGESUM_IDLE_TIMEOUT = 1800   # 闲置多少秒后释放(秒)
+
+    # 列式快照：往月交易按列写成文件并 mmap 读取，统计分析与收支趋势只查本月起的交易
+    SNAPSHOT_ENABLED = True
+    SNAPSHOT_DIR = os.path.join(basedir, 'instance', 'snapshots')  # 每个数据库一个目录，多个 worker 共用
+    SNAPSHOT_MAX_OPEN = 64         # 每个进程最多同时映射的快照文件数
+
+    # 单飞：同一用户、同一参数的并发聚合查询（仪表盘、图表、查找统计）只执行一次，其余请求共享结果
+    SINGLE_FLIGHT_ENABLED = True
+
+    # 图表：折线图最多返回的点数，长区间自动按周/月聚合并用 LTTB 降采样
+    CHART_MAX_POINTS = 200
+    TREND_MONTHS = 6               # 仪表盘收支趋势默认显示的月数（接口最多 TREND_MAX_MONTHS）
+    TREND_MAX_MONTHS = 60
+    STATISTICS_MONTHS = 12         # 统计分析页面默认统计截至今天的最近几个月
+
+    # 生产服务器 (serve.py)：预加载后 fork 多个 worker 共享监听 socket
+    SERVER_BIND = os.environ.get('SERVER_BIND') or '127.0.0.1:8000'
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS') or 2)
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS') or 4)      # 每个 worker 的线程数
+    SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS') or 1000)  # worker 处理这么多请求后重启，0 为不限
+    SERVER_MAX_REQUESTS_JITTER = 50  # 重启阈值的随机抖动
+    SERVER_GRACEFUL_TIMEOUT = 30     # 平滑退出/重载时等待进行中请求的秒数
@@ -0,0 +1,370 @@
+# loadtest.py
+"""
+本地压测工具：在进程内对 create_app() 启动 N 个已登录的虚拟用户，
+按配置的比例回放 仪表盘 / 图表数据 / 搜索 / 记账 请求，
+输出吞吐量、p50/p99 延迟以及 SQLite 锁错误率。无需任何外部服务。
+
+用法示例：
+    python loadtest.py --users 8 --duration 10
+    python loadtest.py --users 16 --requests 200 --mix dashboard=40,chart=30,search=10,add=20
+    python loadtest.py --server --users 8 --duration 10   # 走真实的多线程 Werkzeug 服务器
+    python loadtest.py --users 16 --duration 10 --mix add=1 --write-queue   # 对比组提交写入
+"""
+import argparse
+import http.cookiejar
+import logging
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, datetime, timedelta
+
+from flask import got_request_exception
+from sqlalchemy.exc import OperationalError
+
+from config import Config
+from app import create_app, db
+from app.models import User, Category, Transaction
+
+DEFAULT_MIX = {'dashboard': 50, 'chart': 30, 'search': 10, 'add': 10}
+KEYWORDS = ['午饭', '咖啡', '地铁', '超市', '房租', '电影']
+
+
+class LoadTestConfig(Config):
+    WTF_CSRF_ENABLED = False
+    # 压测时不需要高强度的密码哈希，避免种子数据阶段耗时过长
+    BCRYPT_LOG_ROUNDS = 4
+
+
+def parse_mix(text):
+    """将 'dashboard=50,chart=30' 解析为 {'dashboard': 50, 'chart': 30}"""
+    mix = {}
+    for part in text.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f'未知的请求类型: {name}')
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError('请求比例不能全部为 0')
+    return mix
+
+
+def percentile(sorted_values, pct):
+    """最近秩法计算百分位数，输入需已排序"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100.0 * len(sorted_values)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def seed_database(app, users, transactions_per_user, password):
+    """创建压测用户、默认分类和若干历史交易，返回用户邮箱列表"""
+    emails = []
+    today = date.today()
+    with app.app_context():
+        for i in range(users):
+            user = User(username=f'load{i}', email=f'load{i}@example.com')
+            user.set_password(password)
+            db.session.add(user)
+            food = Category(name='餐饮', type='expense', owner=user)
+            salary = Category(name='工资', type='income', owner=user)
+            db.session.add_all([food, salary])
+            for j in range(transactions_per_user):
+                is_income = j % 10 == 0
+                db.session.add(Transaction(
+                    amount=round(random.uniform(1, 500), 2),
+                    type='income' if is_income else 'expense',
+                    date=datetime.combine(today - timedelta(days=random.randint(0, 365)), datetime.min.time()),
+                    memo=random.choice(KEYWORDS),
+                    author=user,
+                    category=salary if is_income else food,
+                ))
+            emails.append(user.email)
+        db.session.commit()
+    return emails
+
+
+class InProcessClient:
+    """直接调用 WSGI 应用（Flask test client），不经过网络"""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def get(self, path):
+        return self._client.get(path).status_code
+
+    def post(self, path, data):
+        return self._client.post(path, data=data).status_code
+
+
+class HttpClient:
+    """通过 HTTP 访问多线程 Werkzeug 服务器，带 cookie 以保持登录状态"""
+
+    def __init__(self, base_url):
+        self._base_url = base_url
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            _NoRedirect,
+        )
+
+    def _open(self, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            with self._opener.open(self._base_url + path, data=body) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def get(self, path):
+        return self._open(path)
+
+    def post(self, path, data):
+        return self._open(path, data)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # 与 test client 行为一致：不自动跟随重定向，302 直接计为一次请求
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class VirtualUser:
+    """一个已登录的虚拟用户，按比例随机选择操作并记录每次请求的耗时"""
+
+    def __init__(self, client, email, password, expense_category_id, mix, rng):
+        self.client = client
+        self.email = email
+        self.password = password
+        self.expense_category_id = expense_category_id
+        self.ops = list(mix)
+        self.weights = [mix[op] for op in self.ops]
+        self.rng = rng
+        self.samples = []  # (op, 秒, 状态码)
+
+    def login(self):
+        status = self.client.post('/auth/login', {'email': self.email, 'password': self.password})
+        if status != 302:
+            raise RuntimeError(f'虚拟用户 {self.email} 登录失败 (HTTP {status})')
+
+    def run_once(self):
+        op = self.rng.choices(self.ops, self.weights)[0]
+        today = date.today()
+        started = time.perf_counter()
+        if op == 'dashboard':
+            status = self.client.get(f'/?year={today.year}&month={today.month}')
+        elif op == 'chart':
+            status = self.client.get(f'/api/chart-data?year={today.year}&month={today.month}')
+        elif op == 'search':
+            keyword = urllib.parse.quote(self.rng.choice(KEYWORDS))
+            status = self.client.get(f'/transactions?keyword={keyword}')
+        else:
+            status = self.client.post(f'/?year={today.year}&month={today.month}', {
+                'exp-amount': f'{self.rng.uniform(1, 200):.2f}',
+                'exp-type': 'expense',
+                'exp-category': self.expense_category_id,
+                'exp-date': today.isoformat(),
+                'exp-memo': self.rng.choice(KEYWORDS),
+                'exp-submit': '保存',
+            })
+        self.samples.append((op, time.perf_counter() - started, status))
+
+
+class LoadTestReport:
+    def __init__(self, samples, elapsed, lock_errors, users):
+        self.samples = samples
+        self.elapsed = elapsed
+        self.lock_errors = lock_errors
+        self.users = users
+
+    @property
+    def total(self):
+        return len(self.samples)
+
+    @property
+    def throughput(self):
+        return self.total / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def errors(self):
+        return sum(1 for _, _, status in self.samples if status >= 500)
+
+    @property
+    def lock_error_rate(self):
+        return self.lock_errors / self.total if self.total else 0.0
+
+    def by_operation(self):
+        """按操作类型汇总：次数、吞吐、p50/p99 延迟(毫秒)、错误数"""
+        result = {}
+        for op in sorted({s[0] for s in self.samples}):
+            latencies = sorted(s[1] for s in self.samples if s[0] == op)
+            result[op] = {
+                'count': len(latencies),
+                'rps': len(latencies) / self.elapsed if self.elapsed > 0 else 0.0,
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'errors': sum(1 for s in self.samples if s[0] == op and s[2] >= 500),
+            }
+        return result
+
+    def as_dict(self):
+        latencies = sorted(s[1] for s in self.samples)
+        return {
+            'users': self.users,
+            'requests': self.total,
+            'elapsed_s': self.elapsed,
+            'rps': self.throughput,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'errors': self.errors,
+            'lock_errors': self.lock_errors,
+            'lock_error_rate': self.lock_error_rate,
+            'operations': self.by_operation(),
+        }
+
+    def format(self):
+        data = self.as_dict()
+        lines = [
+            f"虚拟用户: {data['users']}  请求数: {data['requests']}  耗时: {data['elapsed_s']:.2f}s",
+            f"吞吐量: {data['rps']:.1f} req/s  p50: {data['p50_ms']:.1f}ms  p99: {data['p99_ms']:.1f}ms",
+            f"5xx 错误: {data['errors']}  锁错误: {data['lock_errors']} ({data['lock_error_rate']:.2%})",
+            '',
+            f"{'操作':<10}{'次数':>8}{'req/s':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'错误':>6}",
+        ]
+        for op, row in data['operations'].items():
+            lines.append(f"{op:<10}{row['count']:>8}{row['rps']:>10.1f}{row['p50_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['errors']:>6}")
+        return '\n'.join(lines)
+
+
+def run_load_test(users=4, duration=None, requests_per_user=50, mix=None, server=False,
+                  seed_transactions=200, busy_timeout=5.0, database_uri=None, seed=None,
+                  write_queue=False):
+    """
+    运行一次压测并返回 LoadTestReport。
+    duration 不为空时按时长运行，否则每个虚拟用户执行 requests_per_user 次请求。
+    database_uri 为空时在临时目录中创建新的 SQLite 文件（内存数据库无法跨连接共享）。
+    """
+    mix = mix or DEFAULT_MIX
+    password = 'loadtest123'
+    tmpdir = None
+    if database_uri is None:
+        tmpdir = tempfile.mkdtemp(prefix='ledger-loadtest-')
+        database_uri = 'sqlite:///' + os.path.join(tmpdir, 'loadtest.db')
+
+    class _Config(LoadTestConfig):
+        SQLALCHEMY_DATABASE_URI = database_uri
+        SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': busy_timeout}}
+        WRITE_QUEUE_ENABLED = write_queue
+        # 临时库的用户 id 会与正式库重复，列式快照不能写进正式库的快照目录
+        SNAPSHOT_DIR = os.path.join(tmpdir, 'snapshots') if tmpdir else LoadTestConfig.SNAPSHOT_DIR
+
+    app = create_app(_Config)
+    lock_errors = []
+
+    def _on_exception(sender, exception, **extra):
+        if isinstance(exception, OperationalError) and 'locked' in str(exception):
+            lock_errors.append(exception)
+
+    got_request_exception.connect(_on_exception, app)
+    httpd = None
+    try:
+        emails = seed_database(app, users, seed_transactions, password)
+        with app.app_context():
+            category_ids = {
+                u.email: Category.query.filter_by(owner=u, type='expense').first().id
+                for u in User.query.filter(User.email.in_(emails))
+            }
+
+        if server:
+            from werkzeug.serving import make_server
+            # 每个请求一行的访问日志会淹没报告，压测时只保留警告
+            logging.getLogger('werkzeug').setLevel(logging.WARNING)
+            httpd = make_server('127.0.0.1', 0, app, threaded=True)
+            threading.Thread(target=httpd.serve_forever, daemon=True).start()
+            base_url = f'http://127.0.0.1:{httpd.server_port}'
+
+        rng = random.Random(seed)
+        vusers = []
+        for email in emails:
+            client = HttpClient(base_url) if server else InProcessClient(app)
+            vu = VirtualUser(client, email, password, category_ids[email], mix, random.Random(rng.random()))
+            vu.login()
+            vusers.append(vu)
+
+        start_barrier = threading.Barrier(len(vusers) + 1)
+        deadline = [None]
+
+        def _worker(vu):
+            start_barrier.wait()
+            if deadline[0] is not None:
+                while time.perf_counter() < deadline[0]:
+                    vu.run_once()
+            else:
+                for _ in range(requests_per_user):
+                    vu.run_once()
+
+        threads = [threading.Thread(target=_worker, args=(vu,)) for vu in vusers]
+        for t in threads:
+            t.start()
+        started = time.perf_counter()
+        if duration is not None:
+            deadline[0] = started + duration
+        start_barrier.wait()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        got_request_exception.disconnect(_on_exception, app)
+        if httpd is not None:
+            httpd.shutdown()
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    samples = [s for vu in vusers for s in vu.samples]
+    return LoadTestReport(samples, elapsed, len(lock_errors), len(vusers))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='记账本进程内压测工具')
+    parser.add_argument('--users', type=int, default=4, help='并发虚拟用户数')
+    parser.add_argument('--duration', type=float, default=None, help='按时长运行(秒)，优先于 --requests')
+    parser.add_argument('--requests', type=int, default=50, help='每个虚拟用户的请求数')
+    parser.add_argument('--mix', default='dashboard=50,chart=30,search=10,add=10', help='请求比例')
+    parser.add_argument('--server', action='store_true', help='使用多线程 Werkzeug 服务器而不是直接调用 WSGI')
+    parser.add_argument('--seed-transactions', type=int, default=200, help='每个用户预置的历史交易数')
+    parser.add_argument('--busy-timeout', type=float, default=5.0, help='SQLite 等待写锁的超时时间(秒)')
+    parser.add_argument('--database-uri', default=None, help='使用指定的数据库(默认临时 SQLite 文件)')
+    parser.add_argument('--write-queue', action='store_true', help='启用组提交写入通道')
+    parser.add_argument('--seed', type=int, default=None, help='随机数种子，便于复现')
+    args = parser.parse_args(argv)
+
+    report = run_load_test(
+        users=args.users,
+        duration=args.duration,
+        requests_per_user=args.requests,
+        mix=parse_mix(args.mix),
+        server=args.server,
+        seed_transactions=args.seed_transactions,
+        busy_timeout=args.busy_timeout,
+        database_uri=args.database_uri,
+        seed=args.seed,
+        write_queue=args.write_queue,
+    )
+    print(report.format())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 # run.py
+# 开发用的单进程调试服务器；生产环境请使用 serve.py
 from app import create_app
 
 app = create_app()
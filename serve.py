@@ -0,0 +1,274 @@
+# serve.py
+"""
+生产环境启动入口（纯 Python，无需 gunicorn/nginx 等外部组件）。
+
+主进程只做三件事：预加载应用、监听端口、管理 worker 进程。
+    - 预加载：create_app()、配置 ORM 映射、编译全部模板，fork 之后子进程直接共享这些内存
+    - 多进程：fork SERVER_WORKERS 个 worker 共享同一个监听 socket，由内核分配连接
+    - 多线程：每个 worker 用 SERVER_THREADS 个线程处理请求，线程全忙时不再接收新连接，
+      让空闲的 worker 去接
+    - 回收：worker 处理 SERVER_MAX_REQUESTS (+随机抖动) 个请求后平滑退出，主进程补一个新的，
+      防止内存无限增长
+
+信号：
+    SIGHUP           平滑重载：主进程带着监听 socket 重新 exec 自己（加载新代码），
+                     新 worker 就绪后再让旧 worker 处理完手上的请求退出，期间不丢连接
+    SIGTERM / SIGINT 平滑退出：等待 worker 处理完进行中的请求，超过 SERVER_GRACEFUL_TIMEOUT 强制结束
+
+用法：
+    python serve.py --bind 0.0.0.0:8000 --workers 4 --threads 8
+    kill -HUP <主进程 pid>    # 发布新代码后重载
+"""
+import argparse
+import errno
+import os
+import random
+import selectors
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.orm import configure_mappers
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler, select_address_family
+
+from app import create_app, db
+
+# 重载时通过环境变量把监听 socket 和旧 worker 交给新的主进程
+ENV_FD = 'LEDGER_SERVER_FD'
+ENV_OLD_WORKERS = 'LEDGER_SERVER_OLD_WORKERS'
+
+
+def parse_bind(text):
+    host, _, port = text.rpartition(':')
+    return host.strip('[]') or '127.0.0.1', int(port)
+
+
+def preload(app):
+    """fork 之前完成所有一次性的初始化，子进程通过写时复制共享"""
+    configure_mappers()
+    for name in app.jinja_env.list_templates():
+        if name.endswith('.html'):
+            app.jinja_env.get_template(name)
+
+
+def open_listener(host, port, backlog):
+    fd = os.environ.pop(ENV_FD, None)
+    if fd is not None:
+        # 重载：沿用旧主进程的 socket，期间到达的连接在 backlog 中排队，不会被拒绝
+        sock = socket.socket(fileno=int(fd))
+    else:
+        sock = socket.socket(select_address_family(host, port), socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class RequestHandler(WSGIRequestHandler):
+    # 每个连接只处理一个请求，避免空闲的长连接占住 worker 线程
+    protocol_version = 'HTTP/1.0'
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """在继承来的监听 socket 上服务，请求交给固定大小的线程池处理"""
+
+    def __init__(self, app, sock, threads):
+        host, port = sock.getsockname()[:2]
+        super().__init__(host, port, app, handler=RequestHandler, fd=sock.fileno())
+        # 多个 worker 同时被唤醒时只有一个能 accept 成功，其余的不能阻塞在 accept 上
+        self.socket.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.socket, selectors.EVENT_READ)
+        self.timeout = 0.5
+        self.multithread = threads > 1
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='ledger-http') if threads > 1 else None
+        self.slots = threading.BoundedSemaphore(threads)
+        self.handled = 0
+
+    def process_request(self, request, client_address):
+        self.handled += 1
+        if self.executor is None:
+            try:
+                super().process_request(request, client_address)
+            finally:
+                self.slots.release()
+            return
+        self.executor.submit(self._process_in_thread, request, client_address)
+
+    def _process_in_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def serve_until(self, stop, max_requests, parent_pid):
+        while not stop.is_set() and not (max_requests and self.handled >= max_requests):
+            if os.getppid() != parent_pid:
+                break  # 主进程意外退出，不要留下孤儿 worker
+            if not self.slots.acquire(timeout=self.timeout):
+                continue
+            before = self.handled
+            if self.selector.select(self.timeout):
+                self._handle_request_noblock()
+            if self.handled == before:  # 超时或者连接被别的 worker 抢走了
+                self.slots.release()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        self.selector.close()
+
+
+def run_worker(app, sock, threads, max_requests, parent_pid):
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+    # 连接池不能跨进程共享，丢弃从主进程继承来的连接（不关闭，主进程还在用）
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+    server = PooledWSGIServer(app, sock, threads)
+    server.serve_until(stop, max_requests, parent_pid)
+
+
+class Arbiter:
+    """主进程：维持 worker 数量，处理重载与退出"""
+
+    def __init__(self, app, sock, workers, threads, max_requests, jitter, graceful_timeout):
+        self.app = app
+        self.sock = sock
+        self.num_workers = workers
+        self.threads = threads
+        self.max_requests = max_requests
+        self.jitter = jitter
+        self.graceful_timeout = graceful_timeout
+        self.workers = set()
+        self.signals = []
+
+    def log(self, message):
+        print(f'[{os.getpid()}] {message}', file=sys.stderr, flush=True)
+
+    def spawn(self):
+        max_requests = self.max_requests + random.randint(0, self.jitter) if self.max_requests else 0
+        parent_pid = os.getpid()
+        pid = os.fork()
+        if pid:
+            self.workers.add(pid)
+            return pid
+        code = 0
+        try:
+            run_worker(self.app, self.sock, self.threads, max_requests, parent_pid)
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+
+    def reap(self):
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            self.workers.discard(pid)
+
+    def run(self):
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda signum, _: self.signals.append(signum))
+        signal.signal(signal.SIGCHLD, lambda *_: None)  # 让 sleep 被子进程退出打断
+
+        host, port = self.sock.getsockname()[:2]
+        self.log(f'Listening on http://{host}:{port} '
+                 f'({self.num_workers} workers x {self.threads} threads)')
+        old_workers = [int(pid) for pid in os.environ.pop(ENV_OLD_WORKERS, '').split(',') if pid]
+
+        while True:
+            self.reap()
+            while len(self.workers) < self.num_workers:
+                self.spawn()
+            if old_workers:
+                # 新 worker 已经就绪，通知重载前的旧 worker 处理完手上的请求后退出
+                self.log(f'重载完成，停止旧 worker {old_workers}')
+                self._signal_all(old_workers, signal.SIGTERM)
+                old_workers = []
+            if self.signals:
+                signum = self.signals.pop(0)
+                if signum == signal.SIGHUP:
+                    self.reload()
+                else:
+                    self.stop()
+                    return
+            time.sleep(0.5)
+
+    def reload(self):
+        self.log('收到 SIGHUP，重新加载')
+        os.environ[ENV_FD] = str(self.sock.fileno())
+        os.environ[ENV_OLD_WORKERS] = ','.join(str(pid) for pid in self.workers)
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    def stop(self):
+        self.log('正在停止 worker')
+        self._signal_all(self.workers, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        self._signal_all(self.workers, signal.SIGKILL)
+        self.reap()
+        self.sock.close()
+
+    @staticmethod
+    def _signal_all(pids, signum):
+        for pid in list(pids):
+            try:
+                os.kill(pid, signum)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='个人记账本生产环境服务器（预加载 + 多进程 + 多线程）')
+    parser.add_argument('--bind', help='监听地址 host:port（默认 SERVER_BIND）')
+    parser.add_argument('--workers', type=int, help='worker 进程数（默认 SERVER_WORKERS）')
+    parser.add_argument('--threads', type=int, help='每个 worker 的线程数（默认 SERVER_THREADS）')
+    parser.add_argument('--max-requests', type=int, help='worker 处理多少个请求后重启，0 为不限（默认 SERVER_MAX_REQUESTS）')
+    parser.add_argument('--max-requests-jitter', type=int, help='重启阈值的随机抖动，避免所有 worker 同时重启')
+    parser.add_argument('--graceful-timeout', type=float, help='平滑退出的最长等待秒数')
+    parser.add_argument('--backlog', type=int, default=2048)
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    preload(app)
+    config = app.config
+
+    def option(value, key):
+        return config[key] if value is None else value
+
+    host, port = parse_bind(option(args.bind, 'SERVER_BIND'))
+    sock = open_listener(host, port, args.backlog)
+    arbiter = Arbiter(
+        app, sock,
+        workers=option(args.workers, 'SERVER_WORKERS'),
+        threads=option(args.threads, 'SERVER_THREADS'),
+        max_requests=option(args.max_requests, 'SERVER_MAX_REQUESTS'),
+        jitter=option(args.max_requests_jitter, 'SERVER_MAX_REQUESTS_JITTER'),
+        graceful_timeout=option(args.graceful_timeout, 'SERVER_GRACEFUL_TIMEOUT'),
+    )
+    arbiter.run()
+
+
+if __name__ == '__main__':
+    main()
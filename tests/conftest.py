@@ -16,6 +16,12 @@ class TestConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    # 每个测试都会重建数据库，版本号会从头开始，进程内的片段缓存在测试之间不再可靠
+    FRAGMENT_CACHE_ENABLED = False
+    RESULT_CACHE_ENABLED = False
+    RANGESUM_ENABLED = False
+    SNAPSHOT_ENABLED = False
+    SEARCH_CACHE_ENABLED = False
 
 
 def _fresh_app():
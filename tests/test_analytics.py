@@ -0,0 +1,151 @@
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+import sqlalchemy as sa
+from flask import g
+
+from app import db
+from app.analytics import compute_statistics, epoch_day, load_columns
+from app.models import Category, Transaction
+
+
+def _columns(rows):
+    """rows: [(date, amount, category_id, type)]，金额换算成分"""
+    return (np.array([epoch_day(d) for d, _, _, _ in rows], dtype=np.int64),
+            np.array([round(a * 100) for _, a, _, _ in rows], dtype=np.int64),
+            np.array([c for _, _, c, _ in rows], dtype=np.int64),
+            np.array([t == 'income' for _, _, _, t in rows], dtype=bool))
+
+
+def test_statistics_match_plain_python():
+    rng = random.Random(5)
+    first, last = date(2024, 1, 10), date(2024, 4, 20)
+    rows = [(first + timedelta(days=rng.randrange((last - first).days + 1)), round(rng.uniform(1, 300), 2),
+             rng.choice([1, 2, 3]), rng.choice(['expense', 'expense', 'income'])) for _ in range(400)]
+    data = compute_statistics(_columns(rows), first, last, {1: 'Food', 2: 'Rent', 3: 'Fun'})
+
+    spend = [(d, a, c) for d, a, c, t in rows if t == 'expense']
+    amounts = [a for _, a, _ in spend]
+    summary = data['summary']
+    assert summary['count'] == 400 and summary['expense_count'] == len(spend)
+    assert summary['expense'] == round(sum(amounts), 2)
+    assert summary['median'] == round(statistics.median(amounts), 2)
+    assert summary['days'] == 102
+    assert data['quantiles']['p50'] == summary['median']
+    assert sum(data['histogram']['counts']) + data['histogram']['overflow'] == len(spend)
+
+    by_weekday = [0.0] * 7
+    for d, a, _ in spend:
+        by_weekday[d.weekday()] += a
+    assert data['weekday']['totals'] == pytest.approx(by_weekday, abs=0.01)
+    # 2024-01-10 ~ 04-20 共 102 天：周三到周六各 15 次，其余 14 次
+    assert data['weekday']['average'][0] == pytest.approx(by_weekday[0] / 14, abs=0.01)
+    assert data['weekday']['average'][2] == pytest.approx(by_weekday[2] / 15, abs=0.01)
+
+    weekly = data['weekly']
+    assert weekly['labels'][0] == '2024-01-08' and weekly['labels'][-1] == '2024-04-15'
+    week_totals = [0.0] * len(weekly['labels'])
+    for d, a, _ in spend:
+        week_totals[(d - date(2024, 1, 8)).days // 7] += a
+    assert weekly['expense'] == pytest.approx(week_totals, abs=0.01)
+    assert weekly['moving_average'][5] == pytest.approx(sum(week_totals[2:6]) / 4, abs=0.01)
+    assert weekly['moving_average'][1] == pytest.approx(sum(week_totals[:2]) / 2, abs=0.01)
+
+    monthly = data['monthly']
+    assert monthly['labels'] == ['2024-01', '2024-02', '2024-03', '2024-04']
+    month_totals = [sum(a for d, a, _ in spend if d.month == m) for m in (1, 2, 3, 4)]
+    assert monthly['expense'] == pytest.approx(month_totals, abs=0.01)
+    assert monthly['change'][0] is None
+    assert monthly['change_percent'][2] == pytest.approx((month_totals[2] - month_totals[1]) / month_totals[1] * 100, abs=0.01)
+
+    totals = {c: sum(a for _, a, cid in spend if cid == c) for c in (1, 2, 3)}
+    assert [c['id'] for c in data['categories']] == sorted(totals, key=totals.get, reverse=True)
+    assert {c['name'] for c in data['categories']} == {'Food', 'Rent', 'Fun'}
+    assert sum(c['percent'] for c in data['categories']) == pytest.approx(100, abs=0.05)
+
+
+def test_empty_range():
+    data = compute_statistics(_columns([]), date(2024, 1, 1), date(2024, 1, 31))
+    assert data['summary']['expense'] == 0.0 and data['summary']['median'] == 0.0
+    assert data['categories'] == []
+    assert data['monthly']['expense'] == [0.0]
+    assert sum(data['histogram']['counts']) == 0
+
+
+def test_large_history_is_fast():
+    rng = np.random.default_rng(1)
+    n = 100_000
+    first, last = date(2015, 1, 1), date(2024, 12, 31)
+    columns = (rng.integers(epoch_day(first), epoch_day(last) + 1, n), rng.integers(100, 50000, n),
+               rng.integers(1, 30, n), rng.random(n) < 0.2)
+    compute_statistics(columns, first, last)
+    started = time.perf_counter()
+    data = compute_statistics(columns, first, last)
+    # 计算本身远低于 100 ms，这里留足余量避免在慢机器上误报
+    assert time.perf_counter() - started < 0.5
+    assert data['summary']['count'] == n
+    assert len(data['weekly']['labels']) <= 200
+
+
+def test_load_columns_reads_only_range(user, make_category):
+    food = make_category('Food', 'expense')
+    salary = make_category('Salary', 'income')
+    for amount, type_, category, when in [(10, 'expense', food, datetime(2024, 3, 1, 23, 30)),
+                                          (99, 'income', salary, datetime(2024, 3, 15)),
+                                          (5, 'expense', food, datetime(2024, 4, 1))]:
+        db.session.add(Transaction(amount=amount, type=type_, date=when, user_id=user.id, category_id=category.id))
+    db.session.commit()
+    days, cents, category_ids, income = load_columns(db.session, user.id, datetime(2024, 3, 1), datetime(2024, 3, 31, 23, 59))
+    order = np.argsort(days)
+    assert days[order].tolist() == [epoch_day(date(2024, 3, 1)), epoch_day(date(2024, 3, 15))]
+    assert cents[order].tolist() == [1000, 9900]
+    assert category_ids[order].tolist() == [food.id, salary.id]
+    assert income[order].tolist() == [False, True]
+
+
+def test_load_columns_computes_days_outside_sql(user, make_category):
+    food = make_category('Food', 'expense')
+    db.session.add(Transaction(amount=1, type='expense', date=datetime(1969, 12, 31, 23, 59), user_id=user.id,
+                               category_id=food.id))
+    db.session.commit()
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    sa.event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        days, _, _, _ = load_columns(db.session, user.id, datetime(1969, 1, 1), datetime(1970, 1, 31))
+        empty = load_columns(db.session, user.id, datetime(2030, 1, 1), datetime(2030, 1, 31))
+    finally:
+        sa.event.remove(db.engine, 'before_cursor_execute', record)
+    # 不用 julianday() 这类只有 SQLite 才有的函数，天数由 NumPy 换算
+    assert statements and not any('julianday' in s for s in statements)
+    assert days.tolist() == [-1]
+    assert [len(column) for column in empty] == [0, 0, 0, 0] and empty[0].dtype == np.int64
+
+
+def test_statistics_endpoint_and_page(auth_client, user):
+    food = Category.query.filter_by(name='Food').first()
+    db.session.add(Transaction(amount=12.5, type='expense', date=datetime(2024, 2, 5), user_id=user.id, category_id=food.id))
+    db.session.add(Transaction(amount=7.5, type='expense', date=datetime(2024, 2, 6), user_id=user.id, category_id=food.id))
+    db.session.commit()
+
+    data = auth_client.get('/api/statistics?start_date=2024-02-01&end_date=2024-02-29').get_json()
+    assert data['start'] == '2024-02-01' and data['end'] == '2024-02-29'
+    assert data['summary']['expense'] == 20.0 and data['summary']['mean'] == 10.0
+    assert data['categories'][0]['name'] == 'Food'
+
+    # 缺省是截至今天的最近 12 个月
+    data = auth_client.get('/api/statistics').get_json()
+    assert data['end'] == date.today().isoformat()
+    assert len(data['monthly']['labels']) == 12
+
+    html = auth_client.get('/statistics?start_date=2024-02-01&end_date=2024-02-29').get_data(as_text=True)
+    assert '统计分析' in html and '20.00' in html
+    # 测试中整个会话共用一个应用上下文，g 会跨请求保留，清掉登录状态以免影响后面的测试
+    g.pop('_login_user', None)
@@ -0,0 +1,87 @@
+import gzip
+import json
+import os
+import re
+
+import pytest
+
+from app import create_app
+from app.assets import build_assets
+from tests.conftest import TestConfig
+
+
+@pytest.fixture
+def assets_app(tmp_path):
+    class AssetsConfig(TestConfig):
+        ASSETS_BUILD_DIR = str(tmp_path / 'assets')
+    return create_app(AssetsConfig)
+
+
+def test_base_template_uses_hashed_local_assets(assets_app):
+    html = assets_app.test_client().get('/auth/login').get_data(as_text=True)
+    assert 'cdn.jsdelivr.net' not in html
+    css = re.search(r'href="(/assets/vendor/bootstrap/bootstrap\.min\.[0-9a-f]{12}\.css)"', html)
+    assert css is not None
+    assert re.search(r'src="/assets/vendor/chartjs/chart\.umd\.min\.[0-9a-f]{12}\.js"', html)
+
+
+def test_assets_served_immutable_and_precompressed(assets_app):
+    client = assets_app.test_client()
+    manifest = assets_app.extensions['assets'].manifest
+    url = '/assets/' + manifest['vendor/bootstrap/bootstrap.min.css']
+
+    plain = client.get(url, headers={'Accept-Encoding': 'identity'})
+    assert plain.status_code == 200
+    assert plain.mimetype == 'text/css'
+    assert 'Content-Encoding' not in plain.headers
+    assert 'immutable' in plain.headers['Cache-Control']
+    assert 'max-age=31536000' in plain.headers['Cache-Control']
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    gz = client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+    assert gz.headers['Content-Encoding'] == 'gzip'
+    assert gz.mimetype == 'text/css'
+    assert gzip.decompress(gz.data) == plain.data
+    assert len(gz.data) < len(plain.data)
+
+
+def test_unknown_or_unhashed_asset_is_404(assets_app):
+    client = assets_app.test_client()
+    assert client.get('/assets/vendor/bootstrap/bootstrap.min.css').status_code == 404
+    assert client.get('/assets/manifest.json').status_code == 404
+
+
+def test_css_urls_rewritten_to_hashed_fonts(assets_app):
+    client = assets_app.test_client()
+    manifest = assets_app.extensions['assets'].manifest
+    css = client.get('/assets/' + manifest['vendor/bootstrap-icons/bootstrap-icons.min.css'],
+                     headers={'Accept-Encoding': 'identity'}).get_data(as_text=True)
+    font = manifest['vendor/bootstrap-icons/fonts/bootstrap-icons.woff2']
+    assert f'url("fonts/{os.path.basename(font)}")' in css
+    resp = client.get('/assets/' + font, headers={'Accept-Encoding': 'gzip'})
+    assert resp.mimetype == 'font/woff2'
+    # 字体本身已压缩，不生成 gzip 版本
+    assert 'Content-Encoding' not in resp.headers
+
+
+def test_build_hash_changes_with_content(tmp_path):
+    src = tmp_path / 'src'
+    src.mkdir()
+    (src / 'app.js').write_text('console.log(1);' * 50)
+    (src / 'LICENSE').write_text('MIT')
+    first = build_assets(str(src), str(tmp_path / 'out'))
+    assert list(first) == ['app.js']
+    (src / 'app.js').write_text('console.log(2);' * 50)
+    second = build_assets(str(src), str(tmp_path / 'out'))
+    assert first['app.js'] != second['app.js']
+    saved = json.loads((tmp_path / 'out' / 'manifest.json').read_text())
+    assert saved == second
+
+
+def test_asset_url_falls_back_to_static_without_build(tmp_path):
+    class NoBuildConfig(TestConfig):
+        ASSETS_BUILD_DIR = str(tmp_path / 'empty')
+        ASSETS_AUTO_BUILD = False
+    app = create_app(NoBuildConfig)
+    html = app.test_client().get('/auth/login').get_data(as_text=True)
+    assert '/static/vendor/bootstrap/bootstrap.min.css' in html
@@ -0,0 +1,184 @@
+import os
+from datetime import datetime
+
+import pytest
+import sqlalchemy as sa
+from flask import g
+
+from app import db
+from app.caching import LRUCache, bump_data_version, data_version
+from app.models import Category, Transaction, User
+
+
+@pytest.fixture
+def fragment_cache(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'FRAGMENT_CACHE_ENABLED', True)
+    cache = app.extensions['fragment_cache']
+    cache.clear()
+    yield cache
+    cache.clear()
+
+
+def test_data_version_bumps_on_ledger_changes(app, user, make_category):
+    assert data_version(db.session, user.id) == 0
+    cat = make_category('Food', 'expense')
+    assert data_version(db.session, user.id) == 1
+
+    tx = Transaction(amount=3, type='expense', date=datetime(2024, 5, 1), user_id=user.id, category_id=cat.id)
+    db.session.add(tx)
+    db.session.commit()
+    assert data_version(db.session, user.id) == 2
+
+    tx.memo = 'edited'
+    db.session.commit()
+    assert data_version(db.session, user.id) == 3
+
+    db.session.delete(tx)
+    db.session.commit()
+    assert data_version(db.session, user.id) == 4
+
+    bump_data_version(db.session, user.id)
+    db.session.commit()
+    assert data_version(db.session, user.id) == 5
+
+
+def test_category_list_fragment_is_cached_until_data_changes(fragment_cache, auth_client, user):
+    first = auth_client.get('/categories').get_data(as_text=True)
+    assert 'Food' in first
+    cached = len(fragment_cache)
+    assert cached == 1  # 分类列表（导航栏是静态标记，不缓存）
+
+    # 绕过 ORM 直接改库：版本号不变，页面仍是缓存的旧片段，分类查询也不再执行
+    db.session.execute(Category.__table__.update().values(name='Renamed'))
+    db.session.commit()
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    sa.event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        assert 'Renamed' not in auth_client.get('/categories').get_data(as_text=True)
+    finally:
+        sa.event.remove(db.engine, 'before_cursor_execute', record)
+    assert len(fragment_cache) == cached
+    assert not any('FROM category' in s for s in statements)
+
+    # 通过正常途径添加分类后版本号变化，片段重新渲染
+    auth_client.post('/categories', data={'name': 'Books', 'type': 'expense'})
+    page = auth_client.get('/categories').get_data(as_text=True)
+    assert 'Books' in page
+    assert 'Renamed' in page
+
+
+def test_fragments_are_per_user(fragment_cache, app, auth_client, user):
+    assert user.username in auth_client.get('/categories').get_data(as_text=True)
+
+    other = User(username='other', email='other@example.com')
+    other.set_password('secret123')
+    db.session.add(other)
+    db.session.commit()
+    # 测试中整个会话共用一个应用上下文，g 会跨请求保留，清掉上一个用户的登录状态
+    g.pop('_login_user', None)
+    g.pop('_data_versions', None)
+    other_client = app.test_client()
+    other_client.post('/auth/login', data={'email': 'other@example.com', 'password': 'secret123'})
+    page = other_client.get('/categories').get_data(as_text=True)
+    assert 'other' in page
+    assert user.username not in page
+    assert 'Food' not in page
+    g.pop('_login_user', None)
+
+
+def test_lru_cache_eviction_and_timeout(monkeypatch):
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+    now = [100.0]
+    monkeypatch.setattr('app.caching.time.monotonic', lambda: now[0])
+    expiring = LRUCache(timeout=10)
+    expiring.set('k', 'v')
+    now[0] += 11
+    assert expiring.get('k') is None
+
+
+def test_lru_cache_weight_budget():
+    cache = LRUCache(maxsize=10, maxweight=10, weigh=len)
+    cache.set('a', 'x' * 4)
+    cache.set('b', 'x' * 4)
+    cache.set('a', 'x' * 5)
+    assert cache.weight == 9
+    cache.set('c', 'x' * 3)
+    assert cache.get('b') is None and cache.get('c') and cache.weight == 8
+    cache.clear()
+    assert cache.weight == 0
+
+
+def test_jinja_bytecode_cache_written(app, auth_client):
+    directory = app.config['JINJA_BYTECODE_CACHE_DIR']
+    auth_client.get('/categories')
+    assert any(name.endswith('.cache') for name in os.listdir(directory))
+
+
+@pytest.fixture
+def all_caches(app, monkeypatch, tmp_path):
+    """打开测试配置里默认关闭的各种缓存，走一遍真实的页面"""
+    for name in ('FRAGMENT_CACHE_ENABLED', 'RESULT_CACHE_ENABLED', 'RANGESUM_ENABLED',
+                 'SNAPSHOT_ENABLED', 'SEARCH_CACHE_ENABLED'):
+        monkeypatch.setitem(app.config, name, True)
+    monkeypatch.setitem(app.config, 'SNAPSHOT_DIR', str(tmp_path))
+    caches = [app.extensions[name] for name in ('fragment_cache', 'result_cache', 'search_cache', 'range_index')]
+    for cache in caches:
+        cache.clear()
+    app.extensions['snapshots'].opened.clear()
+    yield
+    for cache in caches:
+        cache.clear()
+    app.extensions['snapshots'].opened.clear()
+    g.pop('_data_versions', None)
+    g.pop('_login_user', None)
+
+
+def _page(client, url):
+    # 测试中应用上下文跨请求共享，g 里缓存的版本号要手动清掉
+    g.pop('_data_versions', None)
+    resp = client.get(url)
+    assert resp.status_code == 200, url
+    return resp.get_data(as_text=True)
+
+
+def test_pages_stay_fresh_with_caches_enabled(all_caches, auth_client, user):
+    today = datetime.now()
+    last_year = today.year - 1
+    food = Category.query.filter_by(name='Food').one()
+    db.session.add(Transaction(amount=12.5, type='expense', date=datetime(last_year, 3, 1), memo='old-lunch',
+                               user_id=user.id, category_id=food.id))
+    db.session.commit()
+
+    pages = ['/', '/transactions?keyword=lunch', '/ledger',
+             f'/calendar?year={last_year}', '/statistics', '/categories', '/budget']
+    for url in pages * 2:
+        _page(auth_client, url)
+    heatmap = auth_client.get(f'/api/heatmap?year={last_year}').get_json()
+    assert sum(heatmap['expense']) == 12.5
+
+    g.pop('_data_versions', None)
+    resp = auth_client.post('/', data={
+        'exp-amount': '30', 'exp-type': 'expense', 'exp-category': food.id,
+        'exp-date': f'{last_year}-03-02', 'exp-memo': 'new-lunch', 'exp-submit': True,
+    })
+    assert resp.status_code == 302
+
+    # 写入之后各个缓存过的页面都能看到新数据
+    search = _page(auth_client, '/transactions?keyword=lunch')
+    assert 'new-lunch' in search and '共 2 条' in search
+    assert 'new-lunch' in _page(auth_client, '/ledger')
+    g.pop('_data_versions', None)
+    assert sum(auth_client.get(f'/api/heatmap?year={last_year}').get_json()['expense']) == 42.5
+    statistics = auth_client.get(f'/api/statistics?start_date={last_year}-01-01&end_date={last_year}-12-31').get_json()
+    assert '42.5' in str(statistics)
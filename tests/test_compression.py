@@ -0,0 +1,49 @@
+import gzip
+from datetime import datetime
+
+from werkzeug.datastructures import Accept
+
+from app import compression
+from app.compression import Compress
+from tests.test_routes_main import create_transaction
+
+
+def test_html_gzipped_when_accepted(app, auth_client):
+    plain = auth_client.get('/', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    resp = auth_client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert int(resp.headers['Content-Length']) == len(resp.data) < len(plain.data)
+    assert gzip.decompress(resp.data) == plain.data
+
+
+def test_json_gzipped(app, monkeypatch, auth_client, make_category, user):
+    monkeypatch.setitem(app.config, 'COMPRESS_MIN_SIZE', 0)
+    cat = make_category('Food', 'expense')
+    create_transaction(user, cat, amount=5, dt=datetime(2024, 5, 1))
+    resp = auth_client.get('/api/chart-data?year=2024&month=5', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert b'"pie_data"' in gzip.decompress(resp.data)
+
+
+def test_small_responses_not_compressed(app, monkeypatch, auth_client):
+    monkeypatch.setitem(app.config, 'COMPRESS_MIN_SIZE', 10 ** 7)
+    resp = auth_client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in resp.headers
+
+
+def test_disabled(app, monkeypatch, auth_client):
+    monkeypatch.setitem(app.config, 'COMPRESS_ENABLED', False)
+    resp = auth_client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in resp.headers
+
+
+def test_choose_encoding_respects_client_quality(app, monkeypatch):
+    monkeypatch.setitem(compression.COMPRESSORS, 'br', lambda data, app: data)
+    monkeypatch.setitem(app.config, 'COMPRESS_ALGORITHMS', ('br', 'gzip'))
+    assert Compress.choose_encoding(app, Accept([('gzip', 1), ('br', 1)])) == 'br'
+    assert Compress.choose_encoding(app, Accept([('gzip', 1), ('br', 0.5)])) == 'gzip'
+    assert Compress.choose_encoding(app, Accept([('deflate', 1)])) is None
+    assert Compress.choose_encoding(app, Accept([('*', 1)])) == 'br'
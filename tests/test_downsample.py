@@ -0,0 +1,43 @@
+from datetime import date
+
+from app.downsample import BUCKETS, choose_bucket, iter_buckets, lttb, downsample_series
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    values = [0.0] * 1000
+    values[137] = 500.0
+    values[802] = -300.0
+    keep = lttb(values, 50)
+    assert len(keep) == 50
+    assert keep[0] == 0 and keep[-1] == 999
+    assert keep == sorted(keep)
+    assert 137 in keep and 802 in keep
+
+
+def test_lttb_returns_everything_when_under_threshold():
+    assert lttb([1, 2, 3], 10) == [0, 1, 2]
+    assert lttb([1, 2, 3, 4], 2) == [0, 1, 2, 3]
+
+
+def test_choose_bucket_and_iter_buckets():
+    assert choose_bucket(date(2024, 1, 1), date(2024, 1, 31), 200) == 'day'
+    assert choose_bucket(date(2024, 1, 1), date(2024, 12, 31), 200) == 'week'
+    assert choose_bucket(date(2020, 1, 1), date(2024, 12, 31), 200) == 'month'
+    weeks = list(iter_buckets(date(2024, 1, 3), date(2024, 1, 15), 'week'))
+    assert weeks == [date(2024, 1, 1), date(2024, 1, 8), date(2024, 1, 15)]
+    months = list(iter_buckets(date(2023, 11, 20), date(2024, 2, 1), 'month'))
+    assert months == [date(2023, 11, 1), date(2023, 12, 1), date(2024, 1, 1), date(2024, 2, 1)]
+    for bucket in BUCKETS:
+        assert list(iter_buckets(date.max, date.max, bucket))[-1] <= date.max
+
+
+def test_downsample_series_shares_axis_and_keeps_each_series_shape():
+    labels = list(range(400))
+    expense = [0.0] * 400
+    income = [0.0] * 400
+    expense[50] = 100.0
+    income[300] = 100.0
+    out_labels, series = downsample_series(labels, {'expense': expense, 'income': income}, 40)
+    assert len(out_labels) <= 40
+    assert 50 in out_labels and 300 in out_labels
+    assert len(series['expense']) == len(series['income']) == len(out_labels)
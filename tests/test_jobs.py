@@ -0,0 +1,123 @@
+import io
+from datetime import datetime
+
+import pytest
+import sqlalchemy as sa
+
+from app import db, job_runner
+from app.models import Job, Transaction, Budget, Category
+
+
+@pytest.fixture
+def inline_jobs(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'JOBS_MODE', 'inline')
+
+
+def _seed(user, n=3):
+    user = db.session.merge(user)
+    cat = Category(name='Groceries', type='expense', owner=user)
+    db.session.add(cat)
+    for i in range(n):
+        db.session.add(Transaction(amount=10 + i, type='expense', date=datetime(2024, 5, i + 1),
+                                   memo=f'm{i}', author=user, category=cat))
+    db.session.add(Budget(amount=100, year=2024, month=5, owner=user))
+    db.session.commit()
+
+
+def test_export_job_produces_downloadable_csv(inline_jobs, auth_client, user):
+    _seed(user)
+    resp = auth_client.post('/jobs/submit/export_csv', headers={'Accept': 'application/json'})
+    assert resp.status_code == 202
+    status = auth_client.get(resp.get_json()['status_url']).get_json()
+    assert status['status'] == 'done'
+    assert status['progress'] == 1.0
+
+    download = auth_client.get(status['result_url'])
+    text = download.data.decode('utf-8-sig')
+    assert download.mimetype == 'text/csv'
+    assert text.splitlines()[0] == '日期,类型,分类,金额,备注'
+    assert '2024-05-02,支出,Groceries,11.00,m1' in text
+
+
+def test_import_job_creates_transactions_and_categories(inline_jobs, auth_client, user):
+    csv_data = '日期,类型,分类,金额,备注\n2024-05-01,支出,Books,25.5,novel\n2024-05-02,收入,Bonus,100,\nbad,row\n'
+    resp = auth_client.post('/jobs/submit/import_csv', data={
+        'file': (io.BytesIO(csv_data.encode('utf-8')), 'ledger.csv'),
+    }, content_type='multipart/form-data', follow_redirects=True)
+    assert resp.status_code == 200
+    job = Job.query.one()
+    assert job.status == 'done'
+    assert job.message == '导入 2 条，跳过 1 行'
+    assert job.payload is None
+    assert Transaction.query.filter_by(memo='novel').one().amount == 25.5
+    assert Category.query.filter_by(name='Bonus', type='income').count() == 1
+
+
+def test_purge_job_deletes_transactions_and_budgets(inline_jobs, auth_client, user):
+    _seed(user, n=5)
+    auth_client.post('/jobs/submit/purge')
+    assert Transaction.query.count() == 0
+    assert Budget.query.count() == 0
+    assert Category.query.filter_by(name='Groceries').count() == 1
+
+
+def test_external_mode_waits_for_worker(app, auth_client, user, monkeypatch):
+    monkeypatch.setitem(app.config, 'JOBS_MODE', 'external')
+    _seed(user)
+    job_id = auth_client.post('/jobs/submit/export_csv', headers={'Accept': 'application/json'}).get_json()['id']
+    assert auth_client.get(f'/jobs/{job_id}').get_json()['status'] == 'queued'
+
+    result = app.test_cli_runner().invoke(args=['jobs', 'worker', '--once'])
+    assert result.exit_code == 0
+    db.session.expire_all()
+    assert db.session.get(Job, job_id).status == 'done'
+    # 已完成的任务不会被重复领取
+    assert job_runner.claim(job_id) is False
+
+
+def test_failed_job_records_error(inline_jobs, app, user):
+    job = job_runner.submit(user.id, 'import_csv', payload=b'\xff\xfe not utf-8 \xff')
+    db.session.expire_all()
+    job = db.session.get(Job, job.id)
+    assert job.status == 'failed'
+    assert job.error
+
+
+def test_jobs_are_private(inline_jobs, auth_client, user):
+    other = Job(user_id=user.id + 1, kind='export_csv', status='done', result=b'x')
+    db.session.add(other)
+    db.session.commit()
+    assert auth_client.get(f'/jobs/{other.id}').status_code == 404
+    assert auth_client.get(f'/jobs/{other.id}/result').status_code == 404
+    assert auth_client.get('/jobs/').status_code == 200
+
+
+def test_job_list_and_status_skip_blobs(inline_jobs, auth_client, user):
+    _seed(user)
+    job_id = auth_client.post('/jobs/submit/export_csv', headers={'Accept': 'application/json'}).get_json()['id']
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if 'FROM job' in statement:
+            statements.append(statement)
+
+    sa.event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        db.session.expire_all()
+        assert auth_client.get(f'/jobs/{job_id}').get_json()['result_url']
+        assert '下载' in auth_client.get('/jobs/').get_data(as_text=True)
+    finally:
+        sa.event.remove(db.engine, 'before_cursor_execute', record)
+    assert statements and not any('job.result AS' in s or 'job.payload AS' in s for s in statements)
+
+
+def test_rebuild_rollups_job(inline_jobs, auth_client, user):
+    from app.models import BalanceCheckpoint
+    _seed(user)
+    BalanceCheckpoint.query.delete()
+    db.session.commit()
+    auth_client.post('/jobs/submit/rebuild_rollups')
+    job = Job.query.one()
+    assert job.status == 'done'
+    checkpoint = BalanceCheckpoint.query.filter_by(user_id=user.id, period=2024 * 12 + 4).one()
+    assert checkpoint.balance_cents == -(1000 + 1100 + 1200)
@@ -0,0 +1,139 @@
+import random
+import re
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+from app import db
+from app.ledger import INITIALIZED, balance_before, is_initialized, rebuild_checkpoints, reset_checkpoints
+from app.models import BalanceCheckpoint, Category, Transaction
+
+
+def _checkpoints(user_id):
+    return dict(db.session.query(BalanceCheckpoint.period, BalanceCheckpoint.balance_cents)
+                .filter_by(user_id=user_id).order_by(BalanceCheckpoint.period))
+
+
+def _signed(t):
+    return t.amount if t.type == 'income' else -t.amount
+
+
+def test_checkpoints_follow_every_mutation(user, make_category):
+    food = make_category('Food', 'expense')
+    salary = make_category('Salary', 'income')
+    rng = random.Random(3)
+    start = datetime(2023, 1, 1)
+
+    for _ in range(60):
+        action = rng.random()
+        existing = Transaction.query.all()
+        if action < 0.6 or not existing:
+            category, type_ = rng.choice([(food, 'expense'), (salary, 'income')])
+            db.session.add(Transaction(amount=rng.randint(1, 500), type=type_, user_id=user.id, category_id=category.id,
+                                       date=start + timedelta(days=rng.randrange(730))))
+        elif action < 0.85:
+            t = rng.choice(existing)
+            t.amount = rng.randint(1, 500)
+            t.date = start + timedelta(days=rng.randrange(730))
+        else:
+            db.session.delete(rng.choice(existing))
+        db.session.commit()
+
+    assert is_initialized(db.session, user.id)
+    maintained = _checkpoints(user.id)
+    rebuild_checkpoints(db.session, user.id)
+    db.session.commit()
+    rebuilt = _checkpoints(user.id)
+    # 增量维护可能留下已经没有交易的月份，它的值必须与之前最近的月份相同
+    assert set(rebuilt) <= set(maintained)
+    for period, balance in maintained.items():
+        expected = max(((p, b) for p, b in rebuilt.items() if p <= period), default=(None, 0))[1]
+        assert balance == expected
+
+    rows = sorted(Transaction.query.all(), key=lambda t: (t.date, t.id))
+    for i in (0, len(rows) // 2, len(rows) - 1):
+        t = rows[i]
+        assert balance_before(db.session, user.id, t.date, t.id) == round(sum(_signed(r) for r in rows[:i]), 2)
+
+
+def test_uninitialized_user_falls_back_to_full_sum(user, make_category):
+    food = make_category('Food', 'expense')
+    db.session.add(Transaction(amount=10, type='expense', date=datetime(2024, 1, 1), user_id=user.id, category_id=food.id))
+    db.session.commit()
+    reset_checkpoints(db.session, user.id)
+    db.session.commit()
+    assert not is_initialized(db.session, user.id)
+    assert balance_before(db.session, user.id, datetime(2024, 2, 1)) == -10.0
+
+    # 下一次改动交易时整体重建
+    db.session.add(Transaction(amount=5, type='expense', date=datetime(2024, 3, 1), user_id=user.id, category_id=food.id))
+    db.session.commit()
+    assert _checkpoints(user.id) == {INITIALIZED: 0, 2024 * 12: -1000, 2024 * 12 + 2: -1500}
+
+
+def test_ledger_page_shows_running_balance(auth_client, user):
+    food = Category.query.filter_by(name='Food').first()
+    salary = Category.query.filter_by(name='Salary').first()
+    start = datetime(2022, 1, 1)
+    for i in range(45):
+        if i % 5 == 0:
+            db.session.add(Transaction(amount=100, type='income', date=start + timedelta(days=i * 9), user_id=user.id,
+                                       category_id=salary.id))
+        db.session.add(Transaction(amount=i + 1, type='expense', date=start + timedelta(days=i * 9), user_id=user.id,
+                                   category_id=food.id))
+    db.session.commit()
+
+    rows = sorted(Transaction.query.all(), key=lambda t: (t.date, t.id))
+    expected, balance = {}, 0.0
+    for t in rows:
+        balance += _signed(t)
+        expected[t.id] = round(balance, 2)
+
+    statements, parameters = [], []
+
+    def record(conn, cursor, statement, params, *args):
+        statements.append(statement)
+        parameters.append(params)
+
+    newest_first = sorted(rows, key=lambda t: (t.date, t.id), reverse=True)
+    sa.event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        # 沿着“较早”的游标一直翻到最后一页
+        url, pages = '/ledger', []
+        while url:
+            statements.clear()
+            parameters.clear()
+            html = auth_client.get(url).get_data(as_text=True)
+            shown = [float(v) for v in re.findall(r'<td class="fw-bold text-(?:success|danger)">\s*(-?[\d.]+)\s*</td>\s*<td class="text-muted">', html)]
+            offset = len(pages) * 20
+            assert shown == [expected[t.id] for t in newest_first[offset:offset + 20]]
+            # 深页也不跳过行（SQLite 的 LIMIT 总是带着 OFFSET 0）、不计总数；每个 SUM 都限定在检查点之后或本页范围内
+            assert all(params[-1] == 0 for s, params in zip(statements, parameters) if 'OFFSET' in s)
+            assert not any('count(' in s.lower() for s in statements)
+            sums = [s for s in statements if 'sum(' in s.lower()]
+            assert sums and all('>=' in s or 'OVER' in s for s in sums)
+            pages.append(html)
+            after = re.search(r'href="(/ledger\?after=[^"]+)"', html)
+            url = after and after.group(1)
+    finally:
+        sa.event.remove(db.engine, 'before_cursor_execute', record)
+    assert len(pages) == 3
+
+    # 从最后一页往回翻，回到与第二页相同的内容
+    before = re.search(r'href="(/ledger\?before=[^"]+)"', pages[-1]).group(1)
+    assert re.findall(r'<tr>.*?</tr>', auth_client.get(before).get_data(as_text=True), re.S) == \
+        re.findall(r'<tr>.*?</tr>', pages[1], re.S)
+    assert 'ledger?before=' not in pages[0]
+    # 无效的游标按第一页处理
+    assert auth_client.get('/ledger?after=bogus').get_data(as_text=True) == pages[0]
+
+
+def test_rebuild_command(app, user, make_category):
+    food = make_category('Food', 'expense')
+    db.session.add(Transaction(amount=10, type='expense', date=datetime(2024, 1, 1), user_id=user.id, category_id=food.id))
+    db.session.commit()
+    reset_checkpoints(db.session, user.id)
+    db.session.commit()
+    result = app.test_cli_runner().invoke(args=['ledger', 'rebuild'])
+    assert result.exit_code == 0, result.output
+    assert _checkpoints(user.id) == {INITIALIZED: 0, 2024 * 12: -1000}
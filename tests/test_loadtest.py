@@ -0,0 +1,31 @@
+import pytest
+
+from loadtest import parse_mix, percentile, run_load_test
+
+
+def test_parse_mix_accepts_weights():
+    assert parse_mix('dashboard=3, add=1') == {'dashboard': 3.0, 'add': 1.0}
+
+
+def test_parse_mix_rejects_unknown_operation():
+    with pytest.raises(ValueError):
+        parse_mix('dashboard=1,export=2')
+
+
+def test_percentile_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 99) == 0.0
+
+
+def test_run_load_test_reports_all_operations():
+    report = run_load_test(users=2, requests_per_user=20, seed_transactions=10, seed=1)
+    data = report.as_dict()
+    assert data['users'] == 2
+    assert data['requests'] == 40
+    assert data['errors'] == 0
+    assert data['lock_errors'] == 0
+    assert data['rps'] > 0
+    assert set(data['operations']) <= {'dashboard', 'chart', 'search', 'add'}
+    assert sum(row['count'] for row in data['operations'].values()) == 40
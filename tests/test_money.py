@@ -0,0 +1,118 @@
+import os
+import shutil
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+import sqlalchemy as sa
+
+from app import create_missing_indexes, db
+from app.models import Budget, Category, Transaction
+from app.money import from_cents, to_cents, upgrade_schema
+
+
+def test_cents_conversion():
+    assert to_cents(12) == 1200
+    assert to_cents(Decimal('0.1')) == 10
+    assert to_cents('19.99') == 1999
+    # 1.005 的二进制近似值略小于 1.005，仍按十进制写法四舍五入
+    assert to_cents(1.005) == 101
+    assert to_cents(0.1 + 0.2) == 30
+    assert to_cents(None) is None and from_cents(None) is None
+    assert from_cents(1999) == 19.99
+
+
+def test_sums_are_exact(user, make_category):
+    food = make_category('Food', 'expense')
+    for amount in (0.1, 0.2, Decimal('0.7')):
+        db.session.add(Transaction(amount=amount, type='expense', date=datetime(2024, 1, 1), user_id=user.id, category_id=food.id))
+    db.session.add(Budget(amount=Decimal('1.00'), year=2024, month=1, user_id=user.id))
+    db.session.commit()
+
+    total = db.session.query(sa.func.sum(Transaction.amount_cents)).scalar()
+    assert total == 100 and from_cents(total) == 1.0
+    assert food.get_spent_in_month(2024, 1) == 1.0
+    assert Budget.query.one().amount_cents == 100
+    # 兼容旧写法：按元比较、排序仍可用
+    assert Transaction.query.filter(Transaction.amount > 0.15).count() == 2
+
+
+def test_upgrade_schema_converts_float_columns(tmp_path):
+    engine = sa.create_engine(f'sqlite:///{tmp_path / "old.db"}')
+    with engine.begin() as conn:
+        conn.execute(sa.text('CREATE TABLE "transaction" (id INTEGER PRIMARY KEY, amount FLOAT NOT NULL, memo VARCHAR(200))'))
+        conn.execute(sa.text('CREATE TABLE budget (id INTEGER PRIMARY KEY, amount FLOAT NOT NULL)'))
+        conn.execute(sa.text('CREATE TABLE balance_checkpoint (user_id INTEGER, period INTEGER, balance FLOAT)'))
+        conn.execute(sa.text('INSERT INTO "transaction" (id, amount, memo) VALUES (1, 0.29, \'a\'), (2, 12.34, \'b\'), (3, 1.005, \'c\')'))
+        conn.execute(sa.text('INSERT INTO budget (id, amount) VALUES (1, 500)'))
+
+    old = SimpleNamespace(engine=engine, engines={})
+    assert upgrade_schema(old) == {str(engine.url): ['transaction', 'budget', 'balance_checkpoint']}
+    # 再次执行什么也不做
+    assert upgrade_schema(old) == {}
+
+    inspector = sa.inspect(engine)
+    assert {c['name'] for c in inspector.get_columns('transaction')} == {'id', 'amount_cents', 'memo'}
+    assert 'balance_checkpoint' not in inspector.get_table_names()
+    with engine.connect() as conn:
+        assert conn.execute(sa.text('SELECT id, amount_cents, memo FROM "transaction" ORDER BY id')).all() == \
+            [(1, 29, 'a'), (2, 1234, 'b'), (3, 101, 'c')]  # 与 to_cents(1.005) 一致
+        assert conn.execute(sa.text('SELECT amount_cents FROM budget')).scalar() == 50000
+    engine.dispose()
+
+
+def test_startup_upgrades_baseline_database(tmp_path):
+    from app import create_app
+    from tests.conftest import PROJECT_ROOT, TestConfig
+    # 仓库里的 instance/app.db 是最早的库结构：浮点金额，没有 (user_id, date) 复合索引
+    shutil.copy(os.path.join(PROJECT_ROOT, 'instance', 'app.db'), tmp_path / 'app.db')
+
+    class BaselineConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "app.db"}'
+
+    app = create_app(BaselineConfig)
+    with app.app_context():
+        indexes = {index['name'] for index in sa.inspect(db.engine).get_indexes('transaction')}
+        assert 'ix_transaction_user_date' in indexes
+        assert create_missing_indexes([db.engine]) == []
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_create_missing_indexes_on_existing_tables(tmp_path):
+    # 分片库只有分片表，同样补建
+    engine = sa.create_engine(f'sqlite:///{tmp_path / "shard.db"}')
+    with engine.begin() as conn:
+        conn.execute(sa.text('CREATE TABLE "transaction" (id INTEGER PRIMARY KEY, user_id INTEGER, date DATETIME)'))
+    assert create_missing_indexes([engine]) == ['ix_transaction_user_date']
+    assert create_missing_indexes([engine]) == []
+    engine.dispose()
+
+
+def test_to_cents_rejects_non_finite_amounts():
+    for value in (float('nan'), float('inf'), Decimal('NaN'), Decimal('-Infinity'), 'Infinity'):
+        with pytest.raises(ValueError):
+            to_cents(value)
+
+
+@pytest.mark.parametrize('query', ['min_amount=NaN', 'min_amount=Infinity', 'max_amount=1e30', 'min_amount=1e400'])
+def test_search_ignores_invalid_amounts(auth_client, user, query):
+    resp = auth_client.get(f'/transactions?{query}')
+    assert resp.status_code == 200
+    assert 'is-invalid' in resp.get_data(as_text=True)
+
+
+@pytest.mark.parametrize('amount', ['1e30', 'Infinity', 'NaN'])
+def test_huge_or_non_finite_amounts_are_form_errors(auth_client, user, amount):
+    food = Category.query.filter_by(name='Food').one()
+    resp = auth_client.post('/', data={
+        'exp-amount': amount, 'exp-type': 'expense', 'exp-category': food.id,
+        'exp-date': '2024-05-02', 'exp-memo': 'huge', 'exp-submit': True,
+    })
+    assert resp.status_code in (200, 302)
+    assert Transaction.query.count() == 0
+
+    resp = auth_client.post('/budget?year=2024&month=5', data={'amount': amount, 'submit': True})
+    assert resp.status_code in (200, 302)
+    assert Budget.query.count() == 0
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+from flask import g
+from sqlalchemy import text
+
+from app import db, query_budget
+from app.querybudget import QueryBudgetExceeded
+
+# 没有终止条件的递归 CTE，不中止会一直执行下去
+RUNAWAY = text('WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) SELECT count(*) FROM n')
+
+
+@pytest.fixture
+def budgets(app):
+    saved = app.config['QUERY_BUDGETS']
+    query_budget.exceeded.clear()
+    yield app.config
+    app.config['QUERY_BUDGETS'] = saved
+    g.pop('_login_user', None)
+
+
+def test_runaway_query_is_interrupted():
+    started = time.monotonic()
+    with query_budget.limit(0.05, 'runaway'):
+        with pytest.raises(QueryBudgetExceeded):
+            db.session.execute(RUNAWAY)
+    assert time.monotonic() - started < 1
+    assert query_budget.exceeded['runaway'] == 1
+    db.session.rollback()
+    # 预算只在 with 块内生效
+    assert db.session.execute(text('SELECT 1')).scalar() == 1
+
+
+def test_nested_limit_keeps_earlier_deadline():
+    with query_budget.limit(0.05, 'outer'):
+        with query_budget.limit(60, 'inner') as budget:
+            assert budget.label == 'outer'
+            with pytest.raises(QueryBudgetExceeded):
+                db.session.execute(RUNAWAY)
+    db.session.rollback()
+
+
+def test_search_over_budget_asks_to_narrow(budgets, auth_client):
+    budgets['QUERY_BUDGETS'] = {'main.transactions': 0}
+    response = auth_client.get('/transactions?keyword=a')
+    assert response.status_code == 503
+    assert '请缩小查找范围' in response.get_data(as_text=True)
+    assert query_budget.exceeded['main.transactions'] == 1
+
+    # 其他端点不受影响，预算也不会残留到之后的请求
+    assert auth_client.get('/').status_code == 200
+
+
+def test_api_over_budget_returns_json(budgets, auth_client):
+    budgets['QUERY_BUDGETS'] = {'main.statistics_data': 0}
+    response = auth_client.get('/api/statistics')
+    assert response.status_code == 503
+    assert '请缩小查找范围' in response.get_json()['error']
+
+
+def test_budget_can_be_disabled(budgets, auth_client):
+    budgets['QUERY_BUDGETS'] = {'main.transactions': 0}
+    budgets['QUERY_BUDGET_ENABLED'] = False
+    try:
+        assert auth_client.get('/transactions?keyword=a').status_code == 200
+    finally:
+        budgets['QUERY_BUDGET_ENABLED'] = True
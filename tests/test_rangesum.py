@@ -0,0 +1,215 @@
+import random
+from datetime import date, datetime
+
+import pytest
+import sqlalchemy as sa
+from flask import g
+
+from app import db, range_index
+from app.caching import bump_data_version
+from app.models import Budget, Transaction, Category
+from app.rangesum import Fenwick
+
+
+def test_fenwick_matches_naive_sums():
+    rng = random.Random(7)
+    values = [rng.choice([0.0, rng.uniform(0, 100)]) for _ in range(200)]
+    tree = Fenwick(values)
+    for _ in range(50):
+        i = rng.randrange(200)
+        delta = rng.uniform(-50, 50)
+        values[i] += delta
+        tree.add(i, delta)
+    for _ in range(100):
+        lo = rng.randrange(201)
+        hi = rng.randrange(lo, 201)
+        assert tree.range_sum(lo, hi) == pytest.approx(sum(values[lo:hi]))
+
+
+@pytest.fixture
+def index(app):
+    app.config['RANGESUM_ENABLED'] = True
+    store = app.extensions['range_index']
+    store.clear()
+    yield store
+    store.clear()
+    app.config['RANGESUM_ENABLED'] = False
+
+
+@pytest.fixture
+def seeded(user, make_category):
+    food = make_category('Food', 'expense')
+    rent = make_category('Rent', 'expense')
+    salary = make_category('Salary', 'income')
+    rows = [
+        (food, 5, 'expense', datetime(2024, 1, 1, 9)),
+        (food, 7, 'expense', datetime(2024, 1, 15)),
+        (rent, 50, 'expense', datetime(2024, 2, 1)),
+        (salary, 100, 'income', datetime(2024, 2, 29, 23, 59)),
+    ]
+    for category, amount, type_, dt in rows:
+        db.session.add(Transaction(amount=amount, type=type_, date=dt, user_id=user.id, category_id=category.id))
+    db.session.commit()
+    return user.id, food.id, rent.id
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, *args):
+        if 'GROUP BY "transaction".type, "transaction".category_id' in statement:
+            self.count += 1
+
+
+@pytest.fixture
+def builds():
+    counter = QueryCounter()
+    sa.event.listen(db.engine, 'before_cursor_execute', counter)
+    yield counter
+    sa.event.remove(db.engine, 'before_cursor_execute', counter)
+
+
+def test_totals_by_range_and_category(index, seeded, builds):
+    user_id, food_id, rent_id = seeded
+    assert range_index.totals(user_id) == {'income': 100.0, 'expense': 62.0}
+    assert range_index.totals(user_id, date(2024, 1, 1), date(2024, 1, 31)) == {'income': 0.0, 'expense': 12.0}
+    assert range_index.totals(user_id, date(2024, 2, 29), None) == {'income': 100.0, 'expense': 0.0}
+    assert range_index.totals(user_id, None, date(2024, 1, 14), food_id)['expense'] == 5.0
+    assert range_index.totals(user_id, date(2030, 1, 1), date(2031, 1, 1))['expense'] == 0.0
+    assert range_index.totals(user_id, date(2024, 2, 1), date(2024, 1, 1))['expense'] == 0.0
+    assert builds.count == 1
+
+
+def test_commits_update_index_in_place(index, seeded, builds):
+    user_id, food_id, rent_id = seeded
+    range_index.totals(user_id)
+
+    tx = Transaction(amount=3, type='expense', date=datetime(2024, 1, 2), user_id=user_id, category_id=food_id)
+    db.session.add(tx)
+    db.session.commit()
+    assert range_index.totals(user_id, date(2024, 1, 1), date(2024, 1, 31)) == {'income': 0.0, 'expense': 15.0}
+
+    # 修改金额、日期和分类（先加载，和编辑页面一样）
+    assert tx.amount == 3
+    tx.amount = 4
+    tx.date = datetime(2024, 2, 3)
+    tx.category_id = rent_id
+    db.session.commit()
+    assert range_index.totals(user_id, date(2024, 1, 1), date(2024, 1, 31))['expense'] == 12.0
+    assert range_index.totals(user_id, date(2024, 2, 1), date(2024, 2, 29), rent_id)['expense'] == 54.0
+
+    db.session.delete(tx)
+    db.session.commit()
+    assert range_index.totals(user_id)['expense'] == 62.0
+
+    # 新建分类这种与交易无关的改动也会让版本号加一，同样要跟上
+    db.session.add(Category(name='Gift', type='income', user_id=user_id))
+    db.session.commit()
+    assert range_index.totals(user_id)['income'] == 100.0
+    assert builds.count == 1
+
+
+def test_out_of_band_changes_trigger_rebuild(index, seeded, builds):
+    user_id, food_id, rent_id = seeded
+    range_index.totals(user_id)
+
+    # 批量 SQL 绕过了 ORM，只手动加了版本号
+    db.session.query(Transaction).filter(Transaction.category_id == rent_id).delete()
+    bump_data_version(db.session, user_id)
+    db.session.commit()
+    assert range_index.totals(user_id)['expense'] == 12.0
+    assert builds.count == 2
+
+    # SAVEPOINT 回滚：记下的变化不可信，重建
+    savepoint = db.session.begin_nested()
+    db.session.add(Transaction(amount=1, type='expense', date=datetime(2024, 1, 3), user_id=user_id, category_id=food_id))
+    db.session.flush()
+    savepoint.rollback()
+    db.session.add(Transaction(amount=2, type='expense', date=datetime(2024, 1, 4), user_id=user_id, category_id=food_id))
+    db.session.commit()
+    assert range_index.totals(user_id)['expense'] == 14.0
+    assert builds.count == 3
+
+    # 提交后对象已过期，不加载直接改：旧值未知，只能重建
+    tx = Transaction.query.filter_by(amount=2).one()
+    db.session.commit()
+    tx.amount = 5
+    db.session.commit()
+    assert range_index.totals(user_id)['expense'] == 17.0
+    assert builds.count == 4
+
+    # 超出覆盖范围的日期
+    db.session.add(Transaction(amount=1, type='expense', date=datetime(1999, 1, 1), user_id=user_id, category_id=food_id))
+    db.session.commit()
+    assert range_index.totals(user_id)['expense'] == 18.0
+    assert builds.count == 5
+
+
+def test_idle_and_excess_users_are_evicted(app, index, seeded):
+    user_id = seeded[0]
+    range_index.totals(user_id)
+    assert len(index) == 1
+    index.idle_timeout = 0
+    try:
+        index.put(user_id + 1, range_index.build(user_id + 1, 0))
+        assert user_id not in index.indexes
+    finally:
+        index.idle_timeout = app.config['RANGESUM_IDLE_TIMEOUT']
+    index.max_users = 1
+    try:
+        range_index.totals(user_id)
+        assert list(index.indexes) == [user_id]
+    finally:
+        index.max_users = app.config['RANGESUM_MAX_USERS']
+
+
+def test_search_stats_come_from_facets(index, auth_client, user, builds):
+    # 分面查询已经读遍匹配的交易，合计由分面相加，不再为查找构建前缀和索引
+    food = Category.query.filter_by(name='Food').first()
+    db.session.add(Transaction(amount=8, type='expense', date=datetime(2024, 3, 1), user_id=user.id, category_id=food.id))
+    db.session.commit()
+    resp = auth_client.get('/transactions?start_date=2024-03-01&end_date=2024-03-31')
+    assert resp.status_code == 200
+    assert builds.count == 0
+    assert user.id not in index.indexes
+    assert '8.00' in resp.get_data(as_text=True)
+
+
+def test_dashboard_totals_come_from_index(index, auth_client, user, builds):
+    food = Category.query.filter_by(name='Food').first()
+    salary = Category.query.filter_by(name='Salary').first()
+    db.session.add_all([
+        Transaction(amount=12, type='expense', date=datetime(2024, 1, 5), user_id=user.id, category_id=food.id),
+        Transaction(amount=100, type='income', date=datetime(2024, 1, 31, 18), user_id=user.id, category_id=salary.id),
+        Transaction(amount=9, type='expense', date=datetime(2024, 2, 1), user_id=user.id, category_id=food.id),
+        Budget(amount=20, year=2024, month=1, user_id=user.id, category_id=food.id),
+    ])
+    db.session.commit()
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    sa.event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        g.pop('_data_versions', None)
+        html = auth_client.get('/?year=2024&month=1').get_data(as_text=True)
+        assert '+ 100.00' in html and '- 12.00' in html and '12.00 / 20.00' in html
+        # 当月合计和分类已支出都没有再按类型 / 分类 GROUP BY
+        assert not any(s.rstrip().endswith(('GROUP BY "transaction".type', 'GROUP BY "transaction".category_id'))
+                       for s in statements)
+    finally:
+        sa.event.remove(db.engine, 'before_cursor_execute', record)
+
+    resp = auth_client.post('/?year=2024&month=1', data={
+        'exp-amount': '3', 'exp-type': 'expense', 'exp-category': food.id,
+        'exp-date': '2024-01-20', 'exp-memo': '', 'exp-submit': True,
+    })
+    assert resp.status_code == 302
+    g.pop('_data_versions', None)
+    html = auth_client.get('/?year=2024&month=1').get_data(as_text=True)
+    assert '- 15.00' in html and '15.00 / 20.00' in html
+    # 新记账增量更新了索引，没有重建
+    assert builds.count == 1
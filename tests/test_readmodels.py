@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from flask import g
+
+from app import db
+from app.models import Transaction
+from app.readmodels import TransactionRow, fetch_rows, paginate_rows, transaction_select
+
+
+def _add(user, category, n):
+    start = datetime(2024, 1, 1)
+    for i in range(n):
+        db.session.add(Transaction(amount=i + 0.25, type=category.type, date=start + timedelta(days=i), memo=f'm{i}',
+                                   user_id=user.id, category_id=category.id))
+    db.session.commit()
+
+
+def test_rows_are_plain_and_untracked(user, make_category):
+    food = make_category('Food', 'expense')
+    _add(user, food, 3)
+    user_id = user.id
+    db.session.expunge_all()
+
+    rows = fetch_rows(db.session, transaction_select(Transaction.user_id == user_id).order_by(Transaction.id))
+    assert [type(r) for r in rows] == [TransactionRow] * 3
+    first = rows[0]
+    assert (first.date, first.amount_cents, first.amount, first.type, first.memo, first.category_name) == \
+        (datetime(2024, 1, 1), 25, 0.25, 'expense', 'm0', 'Food')
+    assert not hasattr(first, '__dict__')
+    # 没有装载 ORM 对象
+    assert len(db.session.identity_map) == 0
+
+
+def test_paginate_rows(user, make_category):
+    food = make_category('Food', 'expense')
+    _add(user, food, 45)
+    stmt = transaction_select(Transaction.user_id == user.id).order_by(Transaction.date.desc())
+    page = paginate_rows(db.session, stmt, page=3, per_page=20)
+    assert page.total == 45 and page.pages == 3 and not page.has_next
+    assert [r.memo for r in page.items] == [f'm{i}' for i in range(4, -1, -1)]
+
+
+def test_list_pages_do_not_load_transactions(auth_client, user):
+    category_id = db.session.execute(sa.text("SELECT id FROM category WHERE name = 'Food'")).scalar()
+    for i in range(25):
+        db.session.add(Transaction(amount=1, type='expense', date=datetime(2024, 3, 1) + timedelta(hours=i),
+                                   memo=f'row{i}', user_id=user.id, category_id=category_id))
+    db.session.commit()
+    db.session.expunge_all()
+
+    loaded = []
+
+    def record(target, context):
+        loaded.append(target)
+
+    sa.event.listen(Transaction, 'load', record)
+    try:
+        html = auth_client.get('/transactions?keyword=row').get_data(as_text=True)
+        assert 'row24' in html and 'Food' in html
+        assert 'row24' in auth_client.get('/ledger').get_data(as_text=True)
+        assert 'row24' in auth_client.get('/').get_data(as_text=True)
+    finally:
+        sa.event.remove(Transaction, 'load', record)
+    assert loaded == []
+    g.pop('_login_user', None)
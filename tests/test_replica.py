@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import pytest
+
+from app import create_app, db, replica_router
+from app.models import User, Category, Transaction
+from app.session import REPLICA_BIND_KEY
+from tests.conftest import TestConfig
+
+
+class ReplicaConfig(TestConfig):
+    READ_REPLICA_DATABASE_URI = 'sqlite:///:memory:'
+    READ_YOUR_WRITES_SECONDS = 60
+
+
+@pytest.fixture
+def replica_app():
+    app = create_app(ReplicaConfig)
+    ctx = app.app_context()
+    ctx.push()
+    yield app
+    db.session.remove()
+    ctx.pop()
+    # Flask-SQLAlchemy 的 metadata 是全局注册的，移除副本 bind 以免影响其它测试的 drop_all()
+    db.metadatas.pop(REPLICA_BIND_KEY, None)
+
+
+@pytest.fixture
+def replica_client(replica_app):
+    u = User(username='reader', email='reader@example.com')
+    u.set_password('secret123')
+    cat = Category(name='Food', type='expense', owner=u)
+    db.session.add_all([u, cat, Transaction(amount=3, type='expense', date=datetime(2024, 5, 1),
+                                             memo='synced-memo', author=u, category=cat)])
+    db.session.commit()
+    client = replica_app.test_client()
+    client.post('/auth/login', data={'email': 'reader@example.com', 'password': 'secret123'})
+    # 登录本身是写请求，清掉 read-your-writes 窗口，让后续读请求走副本
+    with client.session_transaction() as sess:
+        sess.pop('_rw_until', None)
+    return client, cat.id
+
+
+def test_read_views_use_replica_until_synced(replica_client):
+    client, _ = replica_client
+    assert 'synced-memo' not in client.get('/transactions').get_data(as_text=True)
+    replica_router.sync()
+    assert 'synced-memo' in client.get('/transactions').get_data(as_text=True)
+
+
+def test_user_reads_own_writes_from_primary(replica_client):
+    client, cat_id = replica_client
+    replica_router.sync()
+    resp = client.post('/', data={
+        'exp-amount': '4',
+        'exp-type': 'expense',
+        'exp-category': cat_id,
+        'exp-date': '2024-05-02',
+        'exp-memo': 'fresh-write',
+        'exp-submit': True
+    })
+    assert resp.status_code == 302
+    # 副本尚未同步，但刚写入的用户仍能看到自己的数据
+    assert 'fresh-write' in client.get('/transactions').get_data(as_text=True)
+
+    with client.session_transaction() as sess:
+        sess['_rw_until'] = 0
+    assert 'fresh-write' not in client.get('/transactions').get_data(as_text=True)
+
+
+def test_writes_never_go_to_replica(replica_client):
+    client, cat_id = replica_client
+    replica_router.sync()
+    db.session.info['read_only'] = True
+    try:
+        db.session.add(Transaction(amount=1, type='expense', date=datetime(2024, 5, 3),
+                                   memo='primary-only', user_id=1, category_id=cat_id))
+        db.session.commit()
+    finally:
+        db.session.info.pop('read_only', None)
+    with db.engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT COUNT(*) FROM \"transaction\" WHERE memo = 'primary-only'").scalar() == 1
+    with db.engines[REPLICA_BIND_KEY].connect() as conn:
+        assert conn.exec_driver_sql("SELECT COUNT(*) FROM \"transaction\" WHERE memo = 'primary-only'").scalar() == 0
@@ -1,4 +1,8 @@
-from datetime import datetime
+import json
+from datetime import date, datetime
+
+import sqlalchemy as sa
+from flask import g
 
 from app import db
 from app.models import Transaction, Budget, Category
@@ -36,6 +40,49 @@ def test_index_post_expense_creates_transaction(auth_client, make_category, user
     assert tx.amount == 12.5
 
 
+def test_index_ajax_post_returns_fragments(auth_client, make_category, user):
+    expense_cat = make_category('Groceries', 'expense')
+    resp = auth_client.post('/?year=2024&month=5', data={
+        'exp-amount': '12.50',
+        'exp-type': 'expense',
+        'exp-category': expense_cat.id,
+        'exp-date': '2024-05-02',
+        'exp-memo': 'ajax milk',
+        'exp-submit': True
+    }, headers={'X-Requested-With': 'XMLHttpRequest'})
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data['message'] == '支出记录已添加！'
+    assert set(data['fragments']) == {'stats', 'budget_warnings', 'recent_transactions'}
+    assert '- 12.50' in data['fragments']['stats']
+    assert 'ajax milk' in data['fragments']['recent_transactions']
+    assert '<!doctype html' not in data['fragments']['stats']
+    assert data['chart_data']['line_data']['expense'][1] == 12.5
+
+
+def test_index_ajax_post_invalid_returns_errors(auth_client, make_category, user):
+    resp = auth_client.post('/', data={
+        'exp-amount': '',
+        'exp-type': 'expense',
+        'exp-date': '2024-05-02',
+        'exp-submit': True
+    }, headers={'X-Requested-With': 'XMLHttpRequest'})
+    assert resp.status_code == 400
+    assert 'amount' in resp.get_json()['errors']
+    assert Transaction.query.count() == 0
+
+
+def test_dashboard_fragment_endpoint(auth_client, make_category, user):
+    cat = make_category('Food', 'expense')
+    create_transaction(user, cat, amount=7, dt=datetime(2024, 5, 3), memo='lunch')
+    resp = auth_client.get('/fragments/stats?year=2024&month=5')
+    assert resp.status_code == 200
+    assert b'- 7.00' in resp.data
+    assert b'<!doctype html' not in resp.data
+    assert b'lunch' in auth_client.get('/fragments/recent_transactions').data
+    assert auth_client.get('/fragments/nope').status_code == 404
+
+
 def test_chart_data_returns_day_totals(auth_client, make_category, user):
     cat = make_category('Food', 'expense')
     create_transaction(user, cat, amount=5, dt=datetime(2024, 5, 1))
@@ -48,6 +95,125 @@ def test_chart_data_returns_day_totals(auth_client, make_category, user):
     assert data['line_data']['expense'][1] == 7.0
 
 
+def test_index_inlines_chart_data(auth_client, make_category, user):
+    food = make_category('Food', 'expense')
+    rent = make_category('Rent', 'expense')
+    salary = make_category('Salary', 'income')
+    create_transaction(user, food, amount=5, dt=datetime(2024, 5, 1))
+    create_transaction(user, rent, amount=50, dt=datetime(2024, 5, 1))
+    create_transaction(user, salary, amount=80, type_='income', dt=datetime(2024, 5, 3))
+    resp = auth_client.get('/?year=2024&month=5')
+    assert resp.status_code == 200
+    # 图表数据直接内嵌在页面里，不再需要额外请求
+    assert b'/api/chart-data' not in resp.data
+    api = auth_client.get('/api/chart-data?year=2024&month=5').get_json()
+    assert api['pie_data'] == {'labels': ['Rent', 'Food'], 'data': [50.0, 5.0]}
+    assert api['line_data']['income'][2] == 80.0
+    assert api['line_data']['expense'][0] == 55.0
+    assert len(api['line_data']['labels']) == 31
+    assert json.dumps(api['pie_data']['labels']).encode() in resp.data
+
+
+def test_chart_data_custom_range_is_bucketed_and_bounded(app, auth_client, make_category, user):
+    food = make_category('Food', 'expense')
+    create_transaction(user, food, amount=5, dt=datetime(2021, 1, 4))
+    create_transaction(user, food, amount=7, dt=datetime(2021, 1, 6))
+    create_transaction(user, food, amount=9, dt=datetime(2023, 12, 31))
+
+    # 两个月：按日
+    data = auth_client.get('/api/chart-data?start_date=2021-01-01&end_date=2021-02-28').get_json()
+    assert data['line_data']['bucket'] == 'day'
+    assert len(data['line_data']['labels']) == 59
+
+    # 一年：按周（周一开始），同一周的支出合并
+    data = auth_client.get('/api/chart-data?start_date=2021-01-01&end_date=2021-12-31').get_json()
+    line = data['line_data']
+    assert line['bucket'] == 'week'
+    assert line['expense'][line['labels'].index('2021-01-04')] == 12.0
+
+    # 五年：按月；起止日期写反也可以
+    data = auth_client.get('/api/chart-data?start_date=2023-12-31&end_date=2019-01-01').get_json()
+    line = data['line_data']
+    assert line['bucket'] == 'month'
+    assert len(line['labels']) == 60
+    assert line['expense'][line['labels'].index('2021-01')] == 12.0 and line['expense'][-1] == 9.0
+    assert data['pie_data']['data'] == [21.0]
+
+    # 超出点数预算时降采样，首尾点保留
+    app.config['CHART_MAX_POINTS'] = 10
+    try:
+        line = auth_client.get('/api/chart-data?start_date=2019-01-01&end_date=2023-12-31').get_json()['line_data']
+    finally:
+        app.config['CHART_MAX_POINTS'] = 200
+    assert len(line['labels']) <= 10
+    assert line['labels'][0] == '2019-01' and line['labels'][-1] == '2023-12'
+    assert 12.0 in line['expense'] and 9.0 in line['expense']
+
+
+def test_chart_data_range_up_to_date_max(auth_client, user):
+    # 区间一直到 9999-12-31 时，最后一个桶之后不能再往后推
+    data = auth_client.get('/api/chart-data?start_date=9999-12-01&end_date=9999-12-31').get_json()
+    assert data['line_data']['bucket'] == 'day' and data['line_data']['labels'][-1] == '9999-12-31'
+    data = auth_client.get('/api/chart-data?start_date=0001-01-01&end_date=9999-12-31').get_json()
+    assert data['line_data']['bucket'] == 'month' and data['line_data']['labels'][-1] == '9999-12'
+
+
+def test_index_custom_chart_range(auth_client, make_category, user):
+    food = make_category('Food', 'expense')
+    create_transaction(user, food, amount=5, dt=datetime(2022, 3, 1))
+    resp = auth_client.get('/?year=2024&month=5&start_date=2022-01-01&end_date=2022-12-31')
+    assert resp.status_code == 200
+    html = resp.get_data(as_text=True)
+    assert '2022-01-01 至 2022-12-31' in html
+    assert '"bucket": "week"' in html
+
+
+def test_trend_groups_months_in_one_query(auth_client, make_category, user):
+    food = make_category('Food', 'expense')
+    rent = make_category('Rent', 'expense')
+    salary = make_category('Salary', 'income')
+    create_transaction(user, food, amount=5, dt=datetime(2023, 11, 30, 23, 0))
+    create_transaction(user, rent, amount=50, dt=datetime(2024, 1, 1))
+    create_transaction(user, food, amount=7, dt=datetime(2024, 1, 15))
+    create_transaction(user, salary, amount=100, type_='income', dt=datetime(2024, 2, 29))
+    create_transaction(user, food, amount=999, dt=datetime(2023, 8, 1))  # 窗口之外
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if 'FROM "transaction"' in statement or 'FROM transaction' in statement:
+            statements.append(statement)
+
+    sa.event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        data = auth_client.get('/api/trend?year=2024&month=3&months=6').get_json()
+    finally:
+        sa.event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert len(statements) == 1
+    assert data['labels'] == ['2023-10', '2023-11', '2023-12', '2024-01', '2024-02', '2024-03']
+    assert data['expense'] == [0.0, 5.0, 0.0, 57.0, 0.0, 0.0]
+    assert data['income'] == [0.0, 0.0, 0.0, 0.0, 100.0, 0.0]
+    assert data['balance'][4] == 100.0 and data['balance'][3] == -57.0
+    assert data['categories']['expense'] == {'Food': [0.0, 5.0, 0.0, 7.0, 0.0, 0.0],
+                                             'Rent': [0.0, 0.0, 0.0, 50.0, 0.0, 0.0]}
+
+    # 月数限制在 1..TREND_MAX_MONTHS 之间
+    assert len(auth_client.get('/api/trend?months=0').get_json()['labels']) == 1
+    assert len(auth_client.get('/api/trend?months=9999').get_json()['labels']) == 60
+    # 窗口不会早于公元 1 年 1 月；超出范围的年月按本月处理
+    assert auth_client.get('/api/trend?year=1&month=3&months=12').get_json()['labels'] == ['1-01', '1-02', '1-03']
+    assert len(auth_client.get('/api/trend?year=0&month=13').get_json()['labels']) == 6
+
+
+def test_index_inlines_trend(auth_client, make_category, user):
+    salary = make_category('Salary', 'income')
+    create_transaction(user, salary, amount=80, type_='income', dt=datetime(2024, 4, 3))
+    html = auth_client.get('/?year=2024&month=5').get_data(as_text=True)
+    assert '近 6 个月收支' in html
+    assert '"2024-04"' in html
+
+
 def test_transactions_filter_by_keyword_and_stats(auth_client, make_category, user):
     cat = make_category('Food', 'expense')
     create_transaction(user, cat, amount=10, memo='coffee')
@@ -66,6 +232,48 @@ def test_transactions_date_and_amount_filters(auth_client, make_category, user):
     assert b'5.0' in resp.data and b'20.0' not in resp.data
 
 
+def test_transactions_facets_in_one_grouped_query(auth_client, make_category, user):
+    from app.main.routes import build_search_facets
+    food = make_category('Groceries', 'expense')
+    rent = make_category('Rent', 'expense')
+    salary = Category.query.filter_by(name='Salary').first()
+    create_transaction(user, food, amount=10, memo='m', dt=datetime(2024, 4, 30))
+    create_transaction(user, food, amount=2.5, memo='m', dt=datetime(2024, 5, 3))
+    create_transaction(user, rent, amount=100, memo='m', dt=datetime(2024, 5, 1))
+    create_transaction(user, salary, amount=300, type_='income', memo='m', dt=datetime(2024, 5, 2))
+    create_transaction(user, rent, amount=999, memo='other', dt=datetime(2024, 5, 1))
+
+    grouped = []
+
+    def record(conn, cursor, statement, *args):
+        if 'GROUP BY' in statement:
+            grouped.append(statement)
+
+    g.pop('_data_versions', None)
+    sa.event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        html = auth_client.get('/transactions?keyword=m&start_date=2024-04-15').get_data(as_text=True)
+    finally:
+        sa.event.remove(db.engine, 'before_cursor_execute', record)
+    assert len(grouped) == 1
+    assert '按分类' in html and '2024-05' in html
+    # 点击月份时的区间与当前日期条件取交集
+    assert 'end_date=2024-04-30' in html and 'start_date=2024-04-01' not in html
+
+    search_rows = [(food.id, 'Groceries', 'expense', 2024 * 12 + 3, 1, 1000),
+                   (food.id, 'Groceries', 'expense', 2024 * 12 + 4, 1, 250),
+                   (rent.id, 'Rent', 'expense', 2024 * 12 + 4, 1, 10000),
+                   (salary.id, 'Salary', 'income', 2024 * 12 + 4, 1, 30000)]
+    facets, by_type = build_search_facets(search_rows, date(2024, 4, 15), None)
+    assert by_type == {'income': 30000, 'expense': 11250}
+    assert [(c['name'], c['count'], c['total']) for c in facets['categories']] == \
+        [('Salary', 1, 300.0), ('Rent', 1, 100.0), ('Groceries', 2, 12.5)]
+    assert [(m['label'], m['start_date'], m['end_date'], m['count'], m['expense'], m['income'])
+            for m in facets['months']] == [('2024-05', '2024-05-01', '2024-05-31', 3, 102.5, 300.0),
+                                           ('2024-04', '2024-04-15', '2024-04-30', 1, 10.0, 0.0)]
+    g.pop('_data_versions', None)
+
+
 def test_budget_create_and_update(auth_client, make_category, user):
     expense_cat = make_category('Transport', 'expense')
     # create
@@ -145,3 +353,76 @@ def test_delete_transaction(auth_client, make_category, user):
     resp = auth_client.post(f'/transaction/delete/{tx.id}', data={'submit': True}, follow_redirects=True)
     assert resp.status_code == 200
     assert Transaction.query.get(tx.id) is None
+
+
+def test_heatmap_returns_whole_year(auth_client, make_category, user):
+    food = make_category('Food', 'expense')
+    salary = make_category('Salary', 'income')
+    create_transaction(user, food, amount=5, dt=datetime(2024, 1, 1, 8))
+    create_transaction(user, food, amount=7, dt=datetime(2024, 1, 1, 20))
+    create_transaction(user, salary, amount=100, type_='income', dt=datetime(2024, 12, 31, 23, 0))
+    create_transaction(user, food, amount=999, dt=datetime(2025, 1, 1))
+
+    data = auth_client.get('/api/heatmap?year=2024').get_json()
+    assert data['start'] == '2024-01-01'
+    assert len(data['expense']) == len(data['income']) == 366
+    assert data['expense'][0] == 12.0 and sum(data['expense']) == 12.0
+    assert data['income'][-1] == 100.0
+    assert auth_client.get('/api/heatmap?year=0').status_code == 404
+
+    page = auth_client.get('/calendar?year=2024')
+    assert page.status_code == 200
+    html = page.get_data(as_text=True)
+    assert '2024-01-01 支出 12.00 收入 0.00' in html
+    assert 'heatmap-level-4' in html
+
+
+def test_heatmap_caches_closed_years_until_data_changes(app, auth_client, make_category, user):
+    food = make_category('Food', 'expense')
+    create_transaction(user, food, amount=5, dt=datetime(2020, 3, 1))
+    app.config['RESULT_CACHE_ENABLED'] = True
+    app.extensions['result_cache'].clear()
+    g.pop('_data_versions', None)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if 'FROM "transaction"' in statement:
+            statements.append(statement)
+
+    sa.event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        first = auth_client.get('/api/heatmap?year=2020').get_json()
+        second = auth_client.get('/api/heatmap?year=2020').get_json()
+        assert len(statements) == 1
+        assert first == second
+
+        # 别的年份的记账、改分类不影响已经缓存的 2020 年
+        other = create_transaction(user, food, amount=3, dt=datetime(2023, 6, 1))
+        assert other.date.year == 2023
+        other.memo = 'edited'
+        food.name = 'Meals'
+        db.session.commit()
+        g.pop('_data_versions', None)
+        del statements[:]
+        assert auth_client.get('/api/heatmap?year=2020').get_json() == first
+        assert statements == []
+
+        create_transaction(user, food, amount=7, dt=datetime(2020, 3, 1))
+        g.pop('_data_versions', None)
+        third = auth_client.get('/api/heatmap?year=2020').get_json()
+        assert len(statements) == 1
+        assert third['expense'][60] == 12.0
+
+        # 把交易从 2020 年改到别的年份，2020 年同样失效
+        moved = Transaction.query.filter_by(amount_cents=700).one()
+        moved.date = datetime(2023, 1, 1)
+        db.session.commit()
+        g.pop('_data_versions', None)
+        del statements[:]
+        assert auth_client.get('/api/heatmap?year=2020').get_json()['expense'][60] == 5.0
+        assert len(statements) == 1
+    finally:
+        sa.event.remove(db.engine, 'before_cursor_execute', record)
+        app.config['RESULT_CACHE_ENABLED'] = False
+        app.extensions['result_cache'].clear()
+        g.pop('_data_versions', None)
@@ -0,0 +1,101 @@
+import re
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+from flask import g
+
+from app import db, search_cache
+from app.models import Category, Transaction
+
+
+@pytest.fixture
+def enabled(app):
+    app.config['SEARCH_CACHE_ENABLED'] = True
+    search_cache.clear()
+    yield
+    app.config['SEARCH_CACHE_ENABLED'] = False
+    app.config['SEARCH_CACHE_MAX_ROWS'] = 50000
+    search_cache.clear()
+    g.pop('_data_versions', None)
+    g.pop('_login_user', None)
+
+
+@pytest.fixture
+def statements_run():
+    seen = []
+
+    def record(conn, cursor, statement, *args):
+        if re.search(r'FROM "?transaction"?', statement):
+            seen.append(statement)
+
+    sa.event.listen(db.engine, 'before_cursor_execute', record)
+    yield seen
+    sa.event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def _seed(user, n=45):
+    food = Category.query.filter_by(name='Food').first()
+    for i in range(n):
+        db.session.add(Transaction(amount=10 + i, type='expense', date=datetime(2024, 1, 1) + timedelta(days=i % 7),
+                                   memo=f'coffee {i:02d}', user_id=user.id, category_id=food.id))
+    db.session.add(Transaction(amount=50, type='expense', date=datetime(2024, 1, 1), memo='tea',
+                               user_id=user.id, category_id=food.id))
+    db.session.commit()
+
+
+def _memos(html):
+    return re.findall(r'coffee \d\d', html)
+
+
+def _get(client, url):
+    # 测试里应用上下文跨请求共享，g 中缓存的版本号需要手动清掉
+    g.pop('_data_versions', None)
+    return client.get(url).get_data(as_text=True)
+
+
+def test_later_pages_only_fetch_their_rows(app, enabled, auth_client, user, statements_run):
+    _seed(user)
+    url = '/transactions?keyword=coffee&min_amount=12&start_date=2024-01-01'
+    app.config['SEARCH_CACHE_ENABLED'] = False
+    expected = [_memos(_get(auth_client, f'{url}&page={page}')) for page in (1, 2, 3)]
+    app.config['SEARCH_CACHE_ENABLED'] = True
+
+    del statements_run[:]
+    first = _get(auth_client, url)
+    assert _memos(first) == expected[0] and '共 43 条' in first
+    assert any('GROUP BY' in s for s in statements_run)
+
+    for page in (2, 3):
+        del statements_run[:]
+        html = _get(auth_client, f'{url}&page={page}')
+        assert _memos(html) == expected[page - 1]
+        assert '共 43 条' in html
+        # 只按主键取本页的行：不再筛选、计数或分组统计
+        assert len(statements_run) == 1 and ' IN (' in statements_run[0]
+        assert 'GROUP BY' not in statements_run[0] and 'count(' not in statements_run[0]
+
+
+def test_writes_invalidate_snapshot(enabled, auth_client, user):
+    _seed(user)
+    url = '/transactions?keyword=coffee'
+    assert '共 45 条' in _get(auth_client, url)
+    food = Category.query.filter_by(name='Food').first()
+    db.session.add(Transaction(amount=1, type='expense', date=datetime(2024, 2, 1), memo='coffee 99',
+                               user_id=user.id, category_id=food.id))
+    db.session.commit()
+    html = _get(auth_client, url)
+    assert '共 46 条' in html and 'coffee 99' in html
+
+
+def test_large_results_are_not_snapshotted(app, enabled, auth_client, user, statements_run):
+    _seed(user)
+    app.config['SEARCH_CACHE_MAX_ROWS'] = 10
+    url = '/transactions?keyword=coffee'
+    _get(auth_client, url)
+    del statements_run[:]
+    assert '共 45 条' in _get(auth_client, f'{url}&page=2')
+    assert any('count(' in s for s in statements_run)
+    # 已经知道结果太多，翻页不再先取一遍 id
+    assert not any('LIMIT' in s and 'count(' not in s and 'GROUP BY' not in s and 'OFFSET' not in s
+                   for s in statements_run)
@@ -0,0 +1,86 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork') or not os.path.exists('/proc/self/task'),
+                                reason='serve.py 依赖 fork，测试依赖 /proc 查看子进程')
+
+
+def _children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return set(int(p) for p in f.read().split())
+
+
+def _wait_for(predicate, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = predicate()
+        if value:
+            return value
+        time.sleep(0.1)
+    raise AssertionError('等待超时')
+
+
+def _get(port, path='/auth/login'):
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=10) as resp:
+        return resp.status
+
+
+@pytest.fixture
+def server(tmp_path):
+    env = dict(os.environ,
+               DATABASE_URL=f'sqlite:///{tmp_path / "serve.db"}',
+               SERVER_MAX_REQUESTS='4')
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'serve.py'), '--bind', '127.0.0.1:0',
+         '--workers', '2', '--threads', '2', '--max-requests-jitter', '0', '--graceful-timeout', '5'],
+        cwd=ROOT, env=env, stderr=subprocess.PIPE, text=True)
+    line = proc.stderr.readline()
+    while 'Listening on' not in line:
+        assert line, '服务器没有启动'
+        line = proc.stderr.readline()
+    port = int(line.split(':')[-1].split()[0])
+    yield proc, port
+    if proc.poll() is None:
+        proc.kill()
+        proc.wait()
+
+
+def _workers(proc, count=2):
+    return _wait_for(lambda: len(_children(proc.pid)) == count and _children(proc.pid))
+
+
+def test_workers_serve_and_recycle(server):
+    proc, port = server
+    workers = _workers(proc)
+    for _ in range(12):
+        assert _get(port) == 200
+    # 每个 worker 处理 4 个请求后被替换
+    _wait_for(lambda: len(_children(proc.pid)) == 2 and not (_children(proc.pid) & workers))
+    assert _get(port) == 200
+
+
+def test_sighup_reloads_without_dropping_requests(server):
+    proc, port = server
+    workers = _workers(proc)
+    proc.send_signal(signal.SIGHUP)
+    for _ in range(3):
+        assert _get(port) == 200
+    # 重载后由同一个主进程（exec 了新代码）管理一组新的 worker
+    _wait_for(lambda: len(_children(proc.pid)) == 2 and not (_children(proc.pid) & workers))
+    assert proc.poll() is None
+    assert _get(port) == 200
+
+
+def test_sigterm_stops_gracefully(server):
+    proc, port = server
+    assert _get(port) == 200
+    proc.send_signal(signal.SIGTERM)
+    assert proc.wait(timeout=10) == 0
@@ -0,0 +1,198 @@
+import pytest
+import sqlalchemy as sa
+
+from app import create_app, db, shard_router
+from app.caching import data_version
+from app.models import User, Category, Transaction, ShardDirectory
+from app.session import shard_bind_key
+from tests.conftest import TestConfig
+
+
+class ShardConfig(TestConfig):
+    SHARD_COUNT = 2
+    SHARD_DATABASE_URI_TEMPLATE = 'sqlite:///:memory:'
+    SHARD_MOVE_GRACE_SECONDS = 0
+
+
+@pytest.fixture
+def shard_app():
+    app = create_app(ShardConfig)
+    ctx = app.app_context()
+    ctx.push()
+    yield app
+    db.session.remove()
+    ctx.pop()
+    # Flask-SQLAlchemy 的 metadata 是全局注册的，移除分片 bind 以免影响其它测试的 drop_all()
+    for n in range(ShardConfig.SHARD_COUNT):
+        db.metadatas.pop(shard_bind_key(n), None)
+
+
+def _register(client, name):
+    resp = client.post('/auth/register', data={
+        'username': name,
+        'email': f'{name}@example.com',
+        'password': 'password123',
+        'password2': 'password123'
+    })
+    assert resp.status_code == 302
+    return User.query.filter_by(username=name).one()
+
+
+def _login(client, name):
+    resp = client.post('/auth/login', data={'email': f'{name}@example.com', 'password': 'password123'})
+    assert resp.status_code == 302
+
+
+def _count(shard, table):
+    with shard_router.engine(shard).connect() as conn:
+        return conn.exec_driver_sql(f'SELECT COUNT(*) FROM "{table}"').scalar()
+
+
+def _add_expense(client, category_id, memo):
+    return client.post('/', data={
+        'exp-amount': '8',
+        'exp-type': 'expense',
+        'exp-category': category_id,
+        'exp-date': '2024-05-02',
+        'exp-memo': memo,
+        'exp-submit': True
+    })
+
+
+def test_users_are_spread_over_shards_and_data_lands_there(shard_app):
+    client = shard_app.test_client()
+    alice = _register(client, 'alice')
+    bob = _register(client, 'bob')
+
+    shards = {ShardDirectory.query.get(u.id).shard for u in (alice, bob)}
+    assert shards == {0, 1}
+    assert _count(0, 'category') == 9 and _count(1, 'category') == 9
+    # 中心库里不应有分片表的数据
+    with db.engine.connect() as conn:
+        assert conn.exec_driver_sql('SELECT COUNT(*) FROM category').scalar() == 0
+
+
+def test_routes_read_and_write_the_users_shard(shard_app):
+    client = shard_app.test_client()
+    alice = _register(client, 'alice')
+    _login(client, 'alice')
+    with shard_router.use_user(alice.id):
+        food = Category.query.filter_by(user_id=alice.id, name='餐饮').one()
+    assert _add_expense(client, food.id, 'sharded-lunch').status_code == 302
+
+    shard = ShardDirectory.query.get(alice.id).shard
+    assert _count(shard, 'transaction') == 1
+    assert _count(1 - shard, 'transaction') == 0
+    resp = client.get('/transactions')
+    assert 'sharded-lunch' in resp.get_data(as_text=True)
+
+
+def test_data_versions_live_on_the_users_shard(shard_app):
+    client = shard_app.test_client()
+    alice = _register(client, 'alice')
+    _login(client, 'alice')
+    with shard_router.use_user(alice.id):
+        food = Category.query.filter_by(user_id=alice.id, name='餐饮').one()
+    shard = ShardDirectory.query.get(alice.id).shard
+
+    central = []
+
+    def record(conn, cursor, statement, *args):
+        central.append(statement)
+
+    sa.event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        assert _add_expense(client, food.id, 'versioned').status_code == 302
+    finally:
+        sa.event.remove(db.engine, 'before_cursor_execute', record)
+
+    # 记账只写用户所在的分片，不在中心库里加版本号
+    assert not any(s.split()[0] in ('INSERT', 'UPDATE', 'DELETE') for s in central)
+    assert _count(shard, 'data_version') == 1 and _count(shard, 'year_version') >= 1
+    assert _count(1 - shard, 'data_version') == 0
+
+    # 迁移后版本号接着往上加，不会回到迁移前用过的值
+    with shard_router.use_user(alice.id):
+        before = data_version(db.session, alice.id)
+    shard_router.move_user(alice.id, 1 - shard)
+    with shard_router.use_user(alice.id):
+        assert data_version(db.session, alice.id) > before
+    assert _count(shard, 'data_version') == 0 and _count(shard, 'year_version') == 0
+
+
+def test_reads_do_not_assign_a_shard(shard_app):
+    client = shard_app.test_client()
+    alice = _register(client, 'alice')
+    _login(client, 'alice')
+    # 模拟启用分片之前注册、还没有目录项的用户
+    db.session.delete(ShardDirectory.query.get(alice.id))
+    db.session.commit()
+
+    assert client.get('/').status_code == 200
+    assert client.get('/transactions').status_code == 200
+    db.session.expire_all()
+    assert ShardDirectory.query.get(alice.id) is None
+
+    # 第一次写请求时分配，并随写请求一起提交
+    client.post('/categories', data={'name': 'Books', 'type': 'expense'})
+    db.session.expire_all()
+    entry = ShardDirectory.query.get(alice.id)
+    assert entry is not None
+    with shard_router.use_user(alice.id):
+        assert Category.query.filter_by(user_id=alice.id, name='Books').count() == 1
+
+
+def test_sharded_model_without_shard_raises(shard_app):
+    db.session.info.pop('shard', None)
+    with pytest.raises(RuntimeError):
+        Transaction.query.count()
+
+
+def test_move_user_copies_data_and_switches_directory(shard_app):
+    client = shard_app.test_client()
+    alice = _register(client, 'alice')
+    _login(client, 'alice')
+    with shard_router.use_user(alice.id):
+        food = Category.query.filter_by(user_id=alice.id, name='餐饮').one()
+    _add_expense(client, food.id, 'before-move')
+
+    source = ShardDirectory.query.get(alice.id).shard
+    target = 1 - source
+    moved = shard_router.move_user(alice.id, target)
+
+    assert moved == 1
+    assert ShardDirectory.query.get(alice.id).shard == target
+    assert _count(source, 'transaction') == 0 and _count(source, 'category') == 0
+    assert _count(target, 'transaction') == 1 and _count(target, 'category') == 9
+
+    # 移动后路由仍然可用，并且能用新分类 id 继续记账
+    with shard_router.use_user(alice.id):
+        food = Category.query.filter_by(user_id=alice.id, name='餐饮').one()
+        assert Transaction.query.one().category_id == food.id
+    assert _add_expense(client, food.id, 'after-move').status_code == 302
+    assert _count(target, 'transaction') == 2
+    assert 'before-move' in client.get('/transactions').get_data(as_text=True)
+
+
+def test_writes_are_rejected_while_user_is_moving(shard_app):
+    client = shard_app.test_client()
+    alice = _register(client, 'alice')
+    _login(client, 'alice')
+    entry = ShardDirectory.query.get(alice.id)
+    entry.moving = True
+    db.session.commit()
+
+    assert client.get('/').status_code == 200
+    assert _add_expense(client, 1, 'blocked').status_code == 503
+
+
+def test_rebalance_evens_out_user_counts(shard_app):
+    client = shard_app.test_client()
+    users = [_register(client, name) for name in ('u1', 'u2', 'u3', 'u4')]
+    for u in users:
+        shard_router.move_user(u.id, 0)
+    moves = shard_router.rebalance()
+    assert len(moves) == 2
+    counts = [ShardDirectory.query.filter_by(shard=n).count() for n in (0, 1)]
+    assert counts == [2, 2]
+    assert shard_bind_key(1) in db.engines
@@ -0,0 +1,119 @@
+import threading
+from datetime import date
+
+import pytest
+from flask import g
+
+from app import db, singleflight
+from app.models import Transaction, Category
+from app.singleflight import SingleFlight
+
+
+def _run_concurrently(group, key, fn, count):
+    results, errors = [], []
+
+    def worker():
+        try:
+            results.append(group.do(key, fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+
+def _wait_until_joined(group, count):
+    # 等所有线程都挂到同一个调用上再放行
+    joined = threading.Event()
+    while group.executed + group.shared < count:
+        joined.wait(0.01)
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    group = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {'total': 42}
+
+    threads, results, errors = _run_concurrently(group, 'k', compute, 5)
+    _wait_until_joined(group, 5)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert not errors
+    assert len(calls) == 1
+    assert group.executed == 1 and group.shared == 4
+    assert len(results) == 5 and all(r is results[0] for r in results)
+    assert group.in_flight() == 0
+
+
+def test_errors_propagate_to_waiters_and_are_not_cached():
+    group = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise ValueError('boom')
+
+    threads, results, errors = _run_concurrently(group, 'k', failing, 3)
+    _wait_until_joined(group, 3)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert not results
+    assert len(errors) == 3 and all(isinstance(e, ValueError) for e in errors)
+
+    # 调用结束后不保留结果，下一次会重新计算
+    assert group.do('k', lambda: 'ok') == 'ok'
+    assert group.executed == 2
+
+
+def test_different_keys_do_not_wait_on_each_other():
+    group = SingleFlight()
+    assert group.do('a', lambda: 1) == 1
+    assert group.do('b', lambda: 2) == 2
+    assert group.executed == 2 and group.shared == 0
+
+
+@pytest.fixture
+def recorded_keys(monkeypatch):
+    keys = []
+    group = SingleFlight()
+    original = group.do
+
+    def do(key, fn):
+        keys.append(key)
+        return original(key, fn)
+
+    monkeypatch.setattr(group, 'do', do)
+    monkeypatch.setattr(singleflight, 'group', group)
+    return keys
+
+
+def test_routes_coalesce_by_user_arguments_and_data_version(auth_client, user, recorded_keys):
+    today = date.today()
+    # 测试里应用上下文跨请求共享，g 中缓存的版本号需要手动清掉
+    g.pop('_data_versions', None)
+    auth_client.get(f'/api/chart-data?year={today.year}&month={today.month}')
+    auth_client.get('/transactions?keyword=lunch')
+    names = [key[0] for key in recorded_keys]
+    assert names == ['chart', 'search-stats']
+    assert all(key[1] == user.id for key in recorded_keys)
+    assert recorded_keys[1][3][0] == 'lunch'
+
+    # 写入后版本号变化，新的请求不会合并到写入前开始的计算上
+    version = recorded_keys[0][2]
+    food = Category.query.filter_by(name='Food').first()
+    db.session.add(Transaction(amount=5, type='expense', date=today, user_id=user.id, category_id=food.id))
+    db.session.commit()
+    g.pop('_data_versions', None)
+    auth_client.get(f'/api/chart-data?year={today.year}&month={today.month}')
+    assert recorded_keys[-1][0] == 'chart'
+    assert recorded_keys[-1][2] > version
@@ -0,0 +1,182 @@
+import os
+import random
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+import sqlalchemy as sa
+
+import app.snapshots as snapshots_module
+from app import db, snapshot_store
+from app.analytics import load_columns
+from app.ledger import period_of
+from app.main.routes import _build_trend_data
+from app.models import Transaction
+from app.snapshots import Snapshot, discard_snapshot, encode, month_start
+
+
+@pytest.fixture
+def store(app, tmp_path):
+    app.config['SNAPSHOT_ENABLED'] = True
+    app.config['SNAPSHOT_DIR'] = str(tmp_path)
+    snapshot_store.opened.clear()
+    yield snapshot_store
+    snapshot_store.opened.clear()
+    app.config['SNAPSHOT_ENABLED'] = False
+
+
+@pytest.fixture
+def history(user, make_category):
+    """过去两年的交易 + 本月的几笔"""
+    food = make_category('Food', 'expense')
+    salary = make_category('Salary', 'income')
+    rng = random.Random(11)
+    this_month = month_start(period_of(date.today()))
+    for _ in range(300):
+        day = this_month - timedelta(days=rng.randrange(1, 730))
+        category, type_ = rng.choice([(food, 'expense'), (food, 'expense'), (salary, 'income')])
+        db.session.add(Transaction(amount=rng.randint(100, 50000) / 100, type=type_, user_id=user.id,
+                                   category_id=category.id, date=datetime.combine(day, datetime.min.time()) + timedelta(hours=rng.randrange(24))))
+    for i in range(3):
+        db.session.add(Transaction(amount=10 + i, type='expense', user_id=user.id, category_id=food.id,
+                                   date=datetime.combine(this_month, datetime.min.time()) + timedelta(hours=i)))
+    db.session.commit()
+    return user.id, food.id
+
+
+def _range():
+    return datetime.now() - timedelta(days=800), datetime.now() + timedelta(days=1)
+
+
+def _sorted(columns):
+    days, cents, category_ids, income = columns
+    order = np.lexsort((cents, days))
+    return [days[order].tolist(), cents[order].tolist(), category_ids[order].tolist(), income[order].tolist()]
+
+
+def test_encode_and_slice_roundtrip():
+    rng = np.random.default_rng(3)
+    n = 1001
+    days = np.sort(rng.integers(19000, 19400, n))
+    cents = rng.integers(1, 10 ** 9, n)
+    category_ids = rng.choice([7, 70000, 123456], n)
+    income = rng.random(n) < 0.3
+    snapshot = Snapshot(encode(24000, days, cents, category_ids, income))
+    assert snapshot.rows == n and snapshot.last_period == 24000
+    assert not snapshot.days.flags.owndata  # 直接指向文件内容，没有拷贝
+
+    for first, last in [(None, None), (19000, 19399), (19013, 19013), (19100, 19257), (19399, 19000)]:
+        first_day = None if first is None else date(1970, 1, 1) + timedelta(days=first)
+        last_day = None if last is None else date(1970, 1, 1) + timedelta(days=last)
+        keep = np.ones(n, bool)
+        if first is not None:
+            keep &= (days >= first) & (days <= last)
+        got_days, got_cents, got_ids, got_income = snapshot.columns(first_day, last_day)
+        assert got_days.tolist() == days[keep].tolist()
+        assert got_cents.tolist() == cents[keep].tolist()
+        assert got_ids.tolist() == category_ids[keep].tolist()
+        assert got_income.tolist() == income[keep].tolist()
+
+
+def test_columns_match_sql_and_skip_closed_months(app, store, history):
+    user_id, _ = history
+    start, end = _range()
+    app.config['SNAPSHOT_ENABLED'] = False
+    expected = _sorted(load_columns(db.session, user_id, start, end))
+    app.config['SNAPSHOT_ENABLED'] = True
+    assert _sorted(load_columns(db.session, user_id, start, end)) == expected
+    assert os.path.exists(store.path(user_id))
+
+    # 快照已存在时只查本月起的交易
+    scans = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.startswith('SELECT "transaction".date, "transaction".amount_cents, "transaction".category_id'):
+            scans.append(statement)
+
+    sa.event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        assert _sorted(load_columns(db.session, user_id, start, end)) == expected
+    finally:
+        sa.event.remove(db.engine, 'before_cursor_execute', record)
+    assert len(scans) == 1 and 'ORDER BY' not in scans[0]
+
+
+def test_back_dated_edits_invalidate(store, history):
+    user_id, food_id = history
+    start, end = _range()
+    assert store.get(db.session, user_id) is not None
+    path = store.path(user_id)
+
+    # 本月的改动不影响快照
+    db.session.add(Transaction(amount=1, type='expense', user_id=user_id, category_id=food_id, date=datetime.now()))
+    db.session.commit()
+    assert os.path.exists(path)
+
+    # 修改往月的交易：提交后快照被删除，下次读取重建并包含新值
+    old = Transaction.query.filter(Transaction.date < datetime.combine(store.get(db.session, user_id).end, datetime.min.time())).first()
+    old.amount = 123456.78
+    db.session.commit()
+    assert not os.path.exists(path)
+    assert 12345678 in load_columns(db.session, user_id, start, end)[1].tolist()
+
+    # 把本月的交易改到往月同样失效
+    recent = Transaction.query.filter_by(amount_cents=100).one()
+    recent.date = datetime(2000, 1, 1)
+    db.session.commit()
+    assert not os.path.exists(path)
+
+    # 批量 SQL 绕过 ORM：手动失效之前快照里还是旧数据
+    store.get(db.session, user_id)
+    db.session.query(Transaction).filter(Transaction.amount_cents == 12345678).delete()
+    db.session.commit()
+    assert 12345678 in load_columns(db.session, user_id, start, end)[1].tolist()
+    discard_snapshot(user_id)
+    assert 12345678 not in load_columns(db.session, user_id, start, end)[1].tolist()
+
+
+def test_stale_month_and_concurrent_invalidation(store, history, monkeypatch):
+    user_id, _ = history
+    last_period = period_of(date.today()) - 1
+
+    # 月份翻过之后旧快照少一个月：重建
+    with open(store.path(user_id), 'wb') as f:
+        f.write(encode(last_period - 1, [], [], [], []))
+    assert store.get(db.session, user_id).last_period == last_period
+
+    # 构建期间有人改了往月数据：刚写好的快照作废
+    original = snapshots_module.query_columns
+
+    def racing(*args, **kwargs):
+        result = original(*args, **kwargs)
+        store.discard(user_id)
+        return result
+
+    monkeypatch.setattr(snapshots_module, 'query_columns', racing)
+    assert store.build(db.session, user_id) is False
+    assert not os.path.exists(store.path(user_id))
+    assert store.get(db.session, user_id) is None
+
+
+def test_trend_from_snapshot_matches_sql(app, store, history):
+    user_id, _ = history
+    today = date.today()
+    app.config['SNAPSHOT_ENABLED'] = False
+    expected = _build_trend_data(user_id, today.year, today.month, 24)
+    app.config['SNAPSHOT_ENABLED'] = True
+    got = _build_trend_data(user_id, today.year, today.month, 24)
+    assert got['labels'] == expected['labels']
+    for key in ('income', 'expense'):
+        assert got[key] == pytest.approx(expected[key])
+        assert got['categories'][key].keys() == expected['categories'][key].keys()
+    assert os.path.exists(store.path(user_id))
+
+
+def test_rebuild_command(app, store, history):
+    user_id, _ = history
+    result = app.test_cli_runner().invoke(args=['snapshots', 'rebuild'])
+    assert result.exit_code == 0, result.output
+    assert store.open(user_id).rows == 300
+    result = app.test_cli_runner().invoke(args=['snapshots', 'clear'])
+    assert result.exit_code == 0, result.output
+    assert store.open(user_id) is None
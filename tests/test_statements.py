@@ -0,0 +1,37 @@
+from datetime import date, datetime
+
+from app import db, statements
+from app.models import Transaction
+from app.readmodels import paginate_rows
+from benchstatements import QUERIES, format_results, run_benchmark
+
+
+def test_search_statements_are_reused_per_filter_combination(user, make_category):
+    food = make_category('Food', 'expense')
+    for amount, memo in [(5, 'coffee'), (30, 'coffee beans'), (50, 'lunch')]:
+        db.session.add(Transaction(amount=amount, type='expense', date=datetime(2024, 5, 1), memo=memo,
+                                   user_id=user.id, category_id=food.id))
+    db.session.commit()
+
+    stmts, params = statements.search_statements(
+        statements.SearchFilters(user.id, '%coffee%', None, date(2024, 1, 1), None, 1000, None))
+    assert params == {'user_id': user.id, 'keyword': '%coffee%', 'start': date(2024, 1, 1), 'min_cents': 1000}
+    again, _ = statements.search_statements(
+        statements.SearchFilters(user.id + 1, '%tea%', None, date(2023, 1, 1), None, 1, None))
+    assert again is stmts
+
+    page = paginate_rows(db.session, stmts.rows, page=1, per_page=20, count_select=stmts.count, params=params)
+    assert page.total == 1 and [r.memo for r in page.items] == ['coffee beans']
+    assert [tuple(r)[2:] for r in statements.execute(db.session, stmts.facets, **params)] == [('expense', 2024 * 12 + 4, 1, 3000)]
+
+    everything, params = statements.search_statements(statements.SearchFilters(user.id, *[None] * 6))
+    assert params == {'user_id': user.id}
+    assert statements.execute(db.session, everything.count, **params).scalar() == 3
+
+
+def test_benchmark_matches_orm_queries():
+    # run_benchmark 会先断言两种写法的结果相同
+    results = run_benchmark(iterations=3, users=2, seed_transactions=10)
+    assert set(results) == set(QUERIES)
+    assert all(orm > 0 and cached > 0 for orm, cached in results.values())
+    assert '合计' in format_results(results)
@@ -0,0 +1,114 @@
+import threading
+from datetime import datetime
+
+import pytest
+import sqlalchemy as sa
+
+from app import db, write_queue
+from app.models import Transaction
+
+
+def _insert(user_id, category_id, memo):
+    def op(session):
+        t = Transaction(amount=1, type='expense', date=datetime(2024, 5, 1), memo=memo,
+                        user_id=user_id, category_id=category_id)
+        session.add(t)
+        session.flush()
+        return t.id
+    return op
+
+
+@pytest.fixture
+def writer(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'WRITE_QUEUE_ENABLED', True)
+    w = app.extensions['write_queue']
+    monkeypatch.setattr(w, 'window', 0.05)
+    yield w
+    w.stop(timeout=1)
+
+
+@pytest.fixture
+def sqlite_statements():
+    """SQLite 实际执行的语句（包括 pysqlite 自己发出的 BEGIN / COMMIT）"""
+    seen = []
+
+    def trace(dbapi_connection, connection_record, connection_proxy):
+        dbapi_connection.set_trace_callback(seen.append)
+
+    sa.event.listen(db.engine, 'checkout', trace)
+    yield seen
+    sa.event.remove(db.engine, 'checkout', trace)
+    with db.engine.connect() as conn:
+        conn.connection.dbapi_connection.set_trace_callback(None)
+
+
+def _commits(statements):
+    # 最外层的 RELEASE SAVEPOINT 同样会提交，一并算上
+    return [s for s in statements if s.split()[0].upper() in ('COMMIT', 'RELEASE', 'SAVEPOINT')]
+
+
+def test_run_write_commits_inline_when_disabled(app, user, make_category):
+    cat = make_category()
+    tx_id = write_queue.run_write(_insert(user.id, cat.id, 'inline'))
+    assert db.session.get(Transaction, tx_id).memo == 'inline'
+
+
+def test_concurrent_writes_are_coalesced(writer, user, make_category, sqlite_statements):
+    cat = make_category()
+    user_id, cat_id = user.id, cat.id
+    db.session.remove()
+    del sqlite_statements[:]
+    results = []
+
+    def submit(i):
+        results.append(writer.submit(_insert(user_id, cat_id, f'm{i}')).result(timeout=5))
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(results) == 10 and len(set(results)) == 10
+    commits = _commits(sqlite_statements)
+    assert commits and set(commits) == {'COMMIT'}
+    assert len(commits) < 10
+    assert Transaction.query.count() == 10
+
+
+def test_failed_operation_only_rolls_back_itself(writer, user, make_category, sqlite_statements):
+    cat = make_category()
+    user_id, cat_id = user.id, cat.id
+    db.session.remove()
+    del sqlite_statements[:]
+
+    def broken(session):
+        session.add(Transaction(amount=1, type='expense', date=datetime(2024, 5, 1),
+                                user_id=user_id, category_id=cat_id))
+        raise ValueError('boom')
+
+    ok1 = writer.submit(_insert(user_id, cat_id, 'ok1'))
+    bad = writer.submit(broken)
+    ok2 = writer.submit(_insert(user_id, cat_id, 'ok2'))
+
+    assert ok1.result(timeout=5) and ok2.result(timeout=5)
+    with pytest.raises(ValueError):
+        bad.result(timeout=5)
+    assert _commits(sqlite_statements) == ['COMMIT']
+    assert sorted(t.memo for t in Transaction.query.all()) == ['ok1', 'ok2']
+
+
+def test_index_post_goes_through_write_queue(writer, auth_client, make_category, sqlite_statements):
+    cat = make_category('Groceries', 'expense')
+    del sqlite_statements[:]
+    resp = auth_client.post('/', data={
+        'exp-amount': '3.50',
+        'exp-type': 'expense',
+        'exp-category': cat.id,
+        'exp-date': '2024-05-02',
+        'exp-memo': 'queued',
+        'exp-submit': True
+    })
+    assert resp.status_code == 302
+    assert _commits(sqlite_statements) == ['COMMIT']
+    assert Transaction.query.filter_by(memo='queued').one().amount == 3.5